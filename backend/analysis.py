@@ -1,43 +1,202 @@
+import asyncio
 import json
 import logging
-import google.generativeai as genai
+import os
+import threading
+import time
 from llm_config import get_llm_config
+from llm_providers import create_provider, TransientLLMError
+from chunking import split_into_chunks, estimate_tokens
+from ratelimit import Semaphore, TokenBucket, backoff_delay
+from analysis_schema import parse_structured_response, build_analysis, AnalysisParseError, CATEGORIES, SEVERITY_RANK
+from metrics import (timer, timed, analysis_seconds, llm_call_seconds, llm_prompt_tokens, llm_retries,
+                     parse_seconds)
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 log = logging.getLogger(__name__)
 
-async def perform_analysis(content):
-    log.info(f"Starting analysis of policy content (length: {len(content)})")
+DEFAULT_CHUNK_TOKENS = 24000
+DEFAULT_MAX_CONCURRENT_CHUNKS = 4
+
+# Quota errors and transient server failures are retried with backoff
+RETRYABLE_ERRORS = (TransientLLMError, asyncio.TimeoutError)
+
+# Caps LLM calls in flight across all models in this process
+llm_global_semaphore = Semaphore(int(os.getenv('LLM_MAX_CONCURRENCY', 16)))
+
+class LLMClient:
+    """
+    Shared entry point for one LLM_CONFIGS entry.
+
+    Concurrency limits, rate limits and retries are shared by every caller in
+    the process; the model call itself goes to the provider named in the
+    config (see llm_providers.py).
+    """
+
+    def __init__(self, llm_name, llm_config):
+        self.llm_name = llm_name
+        self.config = llm_config
+        self.semaphore = Semaphore(llm_config.get('max_concurrency', 8))
+        requests_per_minute = llm_config.get('requests_per_minute', 0)
+        tokens_per_minute = llm_config.get('tokens_per_minute', 0)
+        self.request_bucket = TokenBucket(requests_per_minute / 60.0, capacity=max(1, requests_per_minute / 6.0))
+        self.token_bucket = TokenBucket(tokens_per_minute / 60.0, capacity=max(1, tokens_per_minute / 6.0))
+        self.max_retries = llm_config.get('max_retries', 4)
+        self.timeout = llm_config.get('request_timeout', 120)
+        self.provider = create_provider(llm_config)
+
+    async def generate(self, prompt):
+        """Generate a response for the prompt, honouring limits and retrying transient errors"""
+        prompt_tokens = estimate_tokens(prompt)
+        for attempt in range(self.max_retries + 1):
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(prompt_tokens)
+            try:
+                async with llm_global_semaphore, self.semaphore:
+                    llm_prompt_tokens.inc(prompt_tokens, llm=self.config['name'])
+                    start = time.perf_counter()
+                    try:
+                        response_text = await asyncio.wait_for(self.provider.generate(prompt), self.timeout)
+                    except Exception:
+                        llm_call_seconds.observe(time.perf_counter() - start, llm=self.config['name'], outcome='error')
+                        raise
+                    llm_call_seconds.observe(time.perf_counter() - start, llm=self.config['name'], outcome='ok')
+                    return response_text
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                llm_retries.inc(llm=self.config['name'])
+                delay = backoff_delay(attempt, base=self.config.get('retry_base_delay', 2.0))
+                log.warning("%s call failed (%s: %s); retry %d/%d in %.1fs", self.config['name'],
+                            type(e).__name__, e, attempt + 1, self.max_retries, delay)
+                await asyncio.sleep(delay)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_llm_client(llm_name=None):
+    """Return the shared client for an LLM_CONFIGS entry, creating it on first use"""
+    llm_config = get_llm_config(llm_name)
+    if llm_config is None:
+        raise ValueError(f"Unknown LLM configuration: {llm_name}")
+    key = llm_config['name']
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = LLMClient(llm_name, llm_config)
+            _clients[key] = client
+        return client
+
+async def perform_analysis(content, llm_name=None, note=None):
+    """Analyze policy text; ``note`` is added to the prompt, e.g. to say the content is only an excerpt"""
+    log.info("Starting analysis of policy content (length: %s)", len(content))
+    start = time.perf_counter()
     
     try:
-        # Get LLM configuration
-        llm_config = get_llm_config()
-        
-        # Configure Gemini
-        genai.configure(api_key=llm_config['api_key'])
-        model = genai.GenerativeModel(llm_config['model'])
-        
-        # Prepare prompt with content
-        prompt = llm_config['default_prompt'] + f"\n\nPolicy Content:\n{content}"
+        # Shared, rate-limited client for the configured LLM
+        client = get_llm_client(llm_name)
+        llm_config = client.config
         
-        # Generate response
-        response = await model.generate_content_async(prompt)
-        
-        # Parse the response into structured format
-        analysis_result = parse_llm_response(response.text)
+        # Long policies are analyzed as section-aligned chunks and merged
+        chunks = split_into_chunks(content, llm_config.get('chunk_tokens', DEFAULT_CHUNK_TOKENS))
+        if len(chunks) <= 1:
+            analysis_result = await analyze_chunk(client, content, note=note)
+        else:
+            log.info("Policy content split into %s chunks for analysis", len(chunks))
+            semaphore = asyncio.Semaphore(llm_config.get('max_concurrent_chunks', DEFAULT_MAX_CONCURRENT_CHUNKS))
+
+            async def analyze_bounded(index, chunk):
+                async with semaphore:
+                    return await analyze_chunk(client, chunk, part=(index + 1, len(chunks)), note=note)
+
+            chunk_results = await asyncio.gather(*(analyze_bounded(i, chunk) for i, chunk in enumerate(chunks)))
+            analysis_result = merge_analysis_results(chunk_results)
         
-        log.info("Analysis complete using Gemini 1.5")
+        log.info("Analysis complete using %s", llm_config['name'])
+        analysis_seconds.observe(time.perf_counter() - start, outcome='ok')
         return analysis_result
         
     except Exception as e:
-        log.error(f"Error during analysis: {str(e)}")
+        log.error("Error during analysis: %s", e)
+        analysis_seconds.observe(time.perf_counter() - start, outcome='error')
         return {
             "summary": "Error analyzing policy",
             "keyPoints": [],
-            "concerns": [f"Analysis failed: {str(e)}"]
+            "concerns": [f"Analysis failed: {str(e)}"],
+            "error": str(e)
+        }
+
+async def analyze_chunk(client, content, part=None, note=None):
+    """Run the analysis prompt over one piece of policy text"""
+    # Prepare prompt with content
+    # Content is expected to be extracted policy text (see extraction.py), not raw HTML
+    prompt = client.config['default_prompt']
+    if part:
+        prompt += f"\n\nThis is part {part[0]} of {part[1]} of the policy; analyze only this part."
+    if note:
+        prompt += f"\n\n{note}"
+    prompt += f"\n\nPolicy Content:\n{content}"
+    
+    if not client.config.get('structured_output'):
+        # Generate response
+        response_text = await client.generate(prompt)
+        
+        # Parse the response into structured format
+        return parse_llm_response(response_text)
+
+    # JSON mode: validate (with a cheap repair pass) and only re-ask the model if that fails
+    attempts = 1 + client.config.get('max_parse_retries', 1)
+    for attempt in range(attempts):
+        response_text = await client.generate(prompt)
+        try:
+            with timer(parse_seconds, parser='structured'):
+                return parse_structured_response(response_text)
+        except AnalysisParseError as e:
+            log.warning("Invalid structured response from %s (attempt %d/%d): %s",
+                        client.config['name'], attempt + 1, attempts, e)
+    log.error("Falling back to plain-text parsing of the last response")
+    return parse_llm_response(response_text)
+
+def merge_analysis_results(results):
+    """Combine per-chunk analyses into a single summary/keyPoints/concerns result"""
+    summaries = [result['summary'].strip() for result in results if result.get('summary', '').strip()]
+    summary = "\n\n".join(summaries)
+    key_points = _unique([point for result in results for point in result.get('keyPoints', [])])
+    if not all('concernDetails' in result for result in results):
+        return {
+            "summary": summary,
+            "keyPoints": key_points,
+            "concerns": _unique([concern for result in results for concern in result.get('concerns', [])])
         }
 
+    # Structured results: merge per-category findings and keep the highest severity per concern
+    categories = {}
+    for key in CATEGORIES:
+        parts = [result['categories'][key] for result in results]
+        categories[key] = {
+            "summary": " ".join(part['summary'] for part in parts if part['summary']),
+            "keyPoints": _unique([point for part in parts for point in part['keyPoints']])
+        }
+    concerns = {}
+    for result in results:
+        for concern in result['concernDetails']:
+            key = concern['concern'].strip().lower()
+            if key not in concerns or SEVERITY_RANK[concern['severity']] < SEVERITY_RANK[concerns[key]['severity']]:
+                concerns[key] = concern
+    concern_details = sorted(concerns.values(), key=lambda c: SEVERITY_RANK[c['severity']])
+    return build_analysis(summary, key_points, concern_details, categories)
+
+def _unique(items):
+    seen = set()
+    unique_items = []
+    for item in items:
+        key = item.strip().lower()
+        if key and key not in seen:
+            seen.add(key)
+            unique_items.append(item)
+    return unique_items
+
+@timed(parse_seconds, parser='text')
 def parse_llm_response(response_text):
     """Parse LLM response into structured format"""
     try:
@@ -49,7 +208,7 @@ def parse_llm_response(response_text):
             "concerns": [concern.strip() for concern in sections[2].split('\n')] if len(sections) > 2 else []
         }
     except Exception as e:
-        log.error(f"Error parsing LLM response: {str(e)}")
+        log.error("Error parsing LLM response: %s", e)
         return {
             "summary": response_text[:500],  # First 500 chars as summary
             "keyPoints": [],
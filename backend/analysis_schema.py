@@ -0,0 +1,149 @@
+import re
+from typing import Optional, Dict, Any, List
+
+try:
+    import orjson
+
+    def _loads(text: str) -> Any:
+        return orjson.loads(text)
+except ImportError:
+    import json
+
+    def _loads(text: str) -> Any:
+        return json.loads(text)
+
+SCHEMA_VERSION = 1
+
+# Keys of the five categories requested by the analysis prompt
+CATEGORIES = {
+    'data_collection': 'Data Collection Practices',
+    'data_sharing': 'Data Sharing Policies',
+    'user_rights': 'User Rights',
+    'security': 'Security Measures',
+    'contact': 'Contact Information'
+}
+SEVERITIES = ('high', 'medium', 'low')
+SEVERITY_RANK = {severity: rank for rank, severity in enumerate(SEVERITIES)}
+
+# Declared to the model in the prompt; also the shape stored for each analysis
+RESPONSE_SCHEMA_DESCRIPTION = ("""
+{
+  "summary": "<2-4 sentence overview>",
+  "categories": {
+""" + ',\n'.join(
+    f'    "{key}": {{"summary": "<{label}>", "keyPoints": ["<point>", ...]}}' for key, label in CATEGORIES.items()
+) + """
+  },
+  "keyPoints": ["<most important point>", ...],
+  "concerns": [{"concern": "<potential concern>", "severity": "high|medium|low"}, ...]
+}
+""").strip()
+
+_FENCE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$', re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_SMART_QUOTES = str.maketrans({'“': '"', '”': '"'})
+
+
+class AnalysisParseError(ValueError):
+    """Raised when a model response can't be turned into a valid structured analysis."""
+
+
+def repair_json_text(text: str) -> str:
+    """Cheap fixes for common model formatting slips: code fences, prose around the object, trailing commas."""
+    text = _FENCE.sub('', text.strip())
+    start, end = text.find('{'), text.rfind('}')
+    if start != -1 and end > start:
+        text = text[start:end + 1]
+    return _TRAILING_COMMA.sub(r'\1', text.translate(_SMART_QUOTES))
+
+
+def parse_structured_response(text: str) -> Dict[str, Any]:
+    """
+    Parses and validates a JSON analysis response, repairing it once if needed.
+
+    Raises:
+        AnalysisParseError: If the response is not valid JSON even after
+            repair, or does not match the schema.
+    """
+    try:
+        data = _loads(text)
+    except ValueError:
+        try:
+            data = _loads(repair_json_text(text))
+        except ValueError as e:
+            raise AnalysisParseError(f"Response is not valid JSON: {e}") from e
+    return validate_analysis(data)
+
+
+def validate_analysis(data: Any) -> Dict[str, Any]:
+    """
+    Checks a decoded response against the schema and normalizes it.
+
+    Missing optional parts are filled with empty values and concerns are
+    sorted by severity. ``concerns`` stays a list of strings for existing
+    readers, and the ranked form is kept in ``concernDetails``.
+    """
+    if not isinstance(data, dict):
+        raise AnalysisParseError('Response is not a JSON object')
+    summary = data.get('summary')
+    if not isinstance(summary, str) or not summary.strip():
+        raise AnalysisParseError('Response has no summary')
+
+    raw_categories = data.get('categories') or {}
+    if not isinstance(raw_categories, dict):
+        raise AnalysisParseError('"categories" must be an object')
+    categories = {}
+    for key in CATEGORIES:
+        category = raw_categories.get(key) or {}
+        if isinstance(category, str):
+            category = {'summary': category}
+        if not isinstance(category, dict):
+            raise AnalysisParseError(f'Category "{key}" must be an object')
+        categories[key] = {
+            'summary': _as_text(category.get('summary')),
+            'keyPoints': _as_text_list(category.get('keyPoints'))
+        }
+
+    raw_concerns = data.get('concerns') or []
+    if isinstance(raw_concerns, str):
+        raw_concerns = [raw_concerns]
+    if not isinstance(raw_concerns, list):
+        raise AnalysisParseError('"concerns" must be a list')
+    concern_details = []
+    for concern in raw_concerns:
+        if isinstance(concern, str):
+            concern = {'concern': concern}
+        if not isinstance(concern, dict) or not _as_text(concern.get('concern')):
+            continue
+        severity = str(concern.get('severity', 'medium')).lower()
+        concern_details.append({
+            'concern': _as_text(concern['concern']),
+            'severity': severity if severity in SEVERITY_RANK else 'medium'
+        })
+    concern_details.sort(key=lambda c: SEVERITY_RANK[c['severity']])
+
+    return build_analysis(summary.strip(), _as_text_list(data.get('keyPoints')), concern_details, categories)
+
+
+def build_analysis(summary: str, key_points: List[str], concern_details: List[Dict[str, str]],
+                   categories: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    return {
+        'schema_version': SCHEMA_VERSION,
+        'summary': summary,
+        'keyPoints': key_points,
+        'concerns': [c['concern'] for c in concern_details],
+        'concernDetails': concern_details,
+        'categories': categories or {key: {'summary': '', 'keyPoints': []} for key in CATEGORIES}
+    }
+
+
+def _as_text(value: Any) -> str:
+    return value.strip() if isinstance(value, str) else ''
+
+
+def _as_text_list(value: Any) -> List[str]:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return [item.strip() for item in value if isinstance(item, str) and item.strip()]
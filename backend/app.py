@@ -1,56 +1,29 @@
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
-from models import Domain, Policy
-from analysis import perform_analysis
+from models import (Domain, Policy, PolicyChange, UserHistory, domain_cache, policy_cache, iter_pages, select_columns,
+                    DOMAIN_COLUMNS, POLICY_COLUMNS, POLICY_SUMMARY_COLUMNS, POLICY_RESULT_FIELDS, MAX_PAGE_SIZE)
+from pipeline import analyze_policy_url, analysis_flights
+from jobs import JobQueue, QueueFullError
+from cache import analysis_cache_stats
+from fetcher import policy_fetcher
+from visits import VisitBuffer, BufferFullError
+from similarity import near_duplicate_stats
+import metrics
+import hashlib
 import json
+import time
+from collections import OrderedDict
 from datetime import datetime
 from urllib.parse import urlparse
-from logging.handlers import RotatingFileHandler
 import os
 from typing import Optional, Dict, Any, List # Add this import
+from logging_config import setup_logging, dropped_records
 
 
-# Configure logging
-import logging
-from logging.handlers import RotatingFileHandler
-import os
-
-# Enhanced logging configuration
-def setup_logging():
-    log_dir = 'logs'
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-
-    # Configure logging with more detailed format
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
-    )
-
-    # File handler with rotation
-    file_handler = RotatingFileHandler(
-        os.path.join(log_dir, 'policy_analyzer.log'),
-        maxBytes=10485760,  # 10MB
-        backupCount=5
-    )
-    file_handler.setFormatter(formatter)
-    file_handler.setLevel(logging.INFO)
-
-    # Console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    console_handler.setLevel(logging.INFO)
-
-    # Root logger configuration
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
-
-    return logging.getLogger(__name__)
-
-# Initialize logger
-log = setup_logging()
+# Configure logging; records are written by a background listener thread
+setup_logging()
+log = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -58,6 +31,59 @@ CORS(app)  # Enable CORS for all routes
 # Remove the SQLAlchemy session
 # db_session = Session()  # This line should be removed
 
+# Browser/CDN caching of read endpoints; responses carry ETags so expired
+# copies are revalidated with a cheap 304
+READ_CACHE_MAX_AGE = int(os.environ.get('READ_CACHE_MAX_AGE', 60))
+
+def compute_etag(*parts):
+    """Builds an ETag from the row versions (IDs and update timestamps) a response is made of."""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+def cached_json_response(etag, build_body, max_age=None):
+    """
+    Returns a cacheable JSON response, or an empty 304 if the client already has this version.
+
+    Args:
+        etag: Validator for the current version of the resource.
+        build_body: Zero-argument function returning the JSON body; not called on a 304.
+        max_age: Cache-Control max-age in seconds (defaults to READ_CACHE_MAX_AGE).
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build_body())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f"public, max-age={READ_CACHE_MAX_AGE if max_age is None else max_age}"
+    return response
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.timings_token, g.timings = metrics.begin_request_timings()
+
+@app.after_request
+def add_timing_headers(response):
+    """Records request latency and reports where the time went in a Server-Timing header."""
+    started = g.get('request_started')
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.http_request_seconds.observe(elapsed, method=request.method, endpoint=endpoint,
+                                             status=str(response.status_code))
+        response.headers['Server-Timing'] = metrics.server_timing_header(g.timings, elapsed)
+    return response
+
+@app.teardown_request
+def end_request_timer(exc):
+    token = g.pop('timings_token', None)
+    if token is not None:
+        metrics.end_request_timings(token)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Exposes request, database, fetch and LLM timings in the Prometheus text format."""
+    return Response(metrics.registry.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
 @app.route('/get-domain/<string:domain_name>', methods=['GET'])
 def get_domain(domain_name):
     """
@@ -72,18 +98,25 @@ def get_domain(domain_name):
     try:
         domain = Domain.get_by_name(domain_name)  # Returns dict or None
         if not domain:
-            log.info(f"Domain not found: {domain_name}")
-            return jsonify({'exists': False}), 404
+            log.info("Domain not found: %s", domain_name)
+            response = jsonify({'exists': False})
+            response.status_code = 404
+            # Clients create missing domains via /save-policies and then check again,
+            # so a "not found" must never be served from a cache
+            response.headers['Cache-Control'] = 'no-store'
+            return response
         
-        log.info(f"Domain found: {domain_name}")
-        return jsonify({
+        log.info("Domain found: %s", domain_name)
+        etag = compute_etag(domain['id'], domain.get('updated_at'), domain.get('policy_count'),
+                            domain.get('processing_status'))
+        return cached_json_response(etag, lambda: {
             'exists': True,
             'policy_count': domain.get('policy_count', 0),
             'processing_status': domain.get('processing_status', 'unknown'),
             'updated_at': domain.get('updated_at')
-        }), 200
+        })
     except Exception as e:
-        log.exception(f"Error checking domain {domain_name}: {e}")
+        log.exception("Error checking domain %s: %s", domain_name, e)
         return jsonify({'error': f"Internal server error: {str(e)}"}), 500
 
 @app.route('/save-policies', methods=['POST', 'OPTIONS'])
@@ -101,7 +134,7 @@ def save_policies():
         return response
         
     data = request.get_json()
-    log.info(f"Received request to save policies for domain: {data.get('domain')}")
+    log.info("Received request to save policies for domain: %s", data.get('domain'))
 
     if not data or 'domain' not in data or 'policies' not in data:
         log.warning("Invalid request received for save_policies")
@@ -117,9 +150,9 @@ def save_policies():
         domain = Domain.get_by_name(domain_name) # Returns dict or None
         
         if not domain:
-            log.info(f"Domain '{domain_name}' not found. Creating new domain.")
+            log.info("Domain '%s' not found. Creating new domain.", domain_name)
             if not base_url:
-                 log.error(f"Cannot create domain '{domain_name}' without base_url.")
+                 log.error("Cannot create domain '%s' without base_url.", domain_name)
                  return jsonify({'error': 'Invalid request: base_url is required when creating a new domain'}), 400
             # Create new domain
             domain_creation_response = Domain.create(
@@ -128,45 +161,37 @@ def save_policies():
                 legal_entity_name=legal_entity_name
             )
             if not domain_creation_response.data:
-                 log.error(f"Failed to create domain '{domain_name}' in database.")
+                 log.error("Failed to create domain '%s' in database.", domain_name)
                  raise Exception("Failed to create domain in database")
             domain = domain_creation_response.data[0] # Extract the created domain dict
-            log.info(f"Successfully created domain '{domain_name}' with ID: {domain['id']}")
+            log.info("Successfully created domain '%s' with ID: %s", domain_name, domain['id'])
         else:
-             log.info(f"Domain '{domain_name}' found with ID: {domain['id']}")
+             log.info("Domain '%s' found with ID: %s", domain_name, domain['id'])
 
         domain_id = domain['id']
-        new_policies_count = 0
 
-        # Save each policy if it doesn't exist
+        # Insert all policies in one request; URLs that already exist are skipped
+        new_rows = []
+        seen_urls = set()
         for policy_data in policies_data:
             policy_url = policy_data.get('url')
             if not policy_url:
-                log.warning(f"Skipping policy due to missing URL for domain {domain_id}")
+                log.warning("Skipping policy due to missing URL for domain %s", domain_id)
                 continue
-
-            existing_policy = Policy.get_by_url(policy_url) # Returns dict or None
-            if not existing_policy:
-                log.info(f"Policy URL '{policy_url}' not found. Creating new policy.")
-                Policy.create(
-                    domain_id=domain_id,
-                    policy_type=policy_data.get('policy_type', 'unknown'),
-                    page_name=policy_data.get('title', 'Untitled'),
-                    page_url=policy_url,
-                    # processing_status='pending_analysis' # Let create handle default
-                )
-                new_policies_count += 1
-            else:
-                 log.info(f"Policy URL '{policy_url}' already exists with ID: {existing_policy['id']}. Skipping creation.")
-
-
-        # Update domain status if new policies were added or status needs update
-        # Fetch current policy count for accuracy
-        current_policies = Policy.get_by_domain(domain_id)
-        total_policy_count = len(current_policies) if current_policies else 0
-
+            if policy_url in seen_urls:
+                continue
+            seen_urls.add(policy_url)
+            new_rows.append(Policy.new_row(
+                domain_id=domain_id,
+                policy_type=policy_data.get('policy_type', 'unknown'),
+                page_name=policy_data.get('title', 'Untitled'),
+                page_url=policy_url
+            ))
+        new_policies_count = len(Policy.upsert_many(new_rows))
+        log.info("Saved %s new policies out of %s for domain %s.", new_policies_count, len(new_rows), domain_id)
+
+        # policy_count is maintained by a database trigger on policies
         update_data = {
-            'policy_count': total_policy_count,
             'updated_at': datetime.utcnow().isoformat()
         }
         # Optionally update processing status if needed, e.g., if new policies trigger analysis
@@ -174,12 +199,12 @@ def save_policies():
              update_data['processing_status'] = 'pending_analysis' # Or relevant status
 
         Domain.update(domain_id, update_data)
-        log.info(f"Updated domain '{domain_name}' (ID: {domain_id}) policy count to {total_policy_count}.")
+        log.info("Updated domain '%s' (ID: %s).", domain_name, domain_id)
 
-        return jsonify({'message': 'Policies processed successfully'}), 200
+        return jsonify({'message': 'Policies processed successfully', 'new_policies': new_policies_count}), 200
 
     except Exception as e:
-        log.exception(f"Error saving policies for domain {domain_name}: {e}")
+        log.exception("Error saving policies for domain %s: %s", domain_name, e)
         return jsonify({'error': f"Internal server error: {str(e)}"}), 500
 
 @app.route('/get-policies/<string:domain_id>', methods=['GET']) # Changed to string ID
@@ -190,33 +215,282 @@ def get_policies(domain_id):
     Args:
         domain_id: The ID of the domain.
 
+    Query params:
+        fields: Optional comma-separated columns to return for each policy.
+            The analysis and llm_details result fields are only included
+            when named here.
+
     Returns:
         JSON list of policies or empty list if none found.
     """
+    fields = request.args.get('fields')
     try:
-        log.info(f"Fetching policies for domain ID: {domain_id}")
+        columns = select_columns(fields.split(','), POLICY_COLUMNS, POLICY_COLUMNS).split(',') if fields else None
+    except ValueError as e:
+        return jsonify({'error': f"Invalid request: {e}"}), 400
+    try:
+        log.info("Fetching policies for domain ID: %s", domain_id)
         # get_by_domain returns a list of dicts directly
         policies = Policy.get_by_domain(domain_id)
         if not policies:
-            log.info(f"No policies found for domain ID: {domain_id}")
-            return jsonify([]), 200 # Return empty list, not 404
+            log.info("No policies found for domain ID: %s", domain_id)
+            policies = [] # Return empty list, not 404
+        else:
+            log.info("Found %s policies for domain ID: %s", len(policies), domain_id)
+
+        etag = compute_etag(domain_id, columns, *(
+            (policy['id'], policy.get('last_updated_at'), policy.get('processing_status')) for policy in policies
+        ))
+
+        def build_body():
+            if not columns:
+                return policies # Return the list directly
+            # Results are only loaded when asked for, and not at all for a 304
+            result_fields = tuple(column for column in columns if column in POLICY_RESULT_FIELDS)
+            rows = Policy.with_results(policies, result_fields) if result_fields else policies
+            return [{column: policy.get(column) for column in columns} for policy in rows]
+        return cached_json_response(etag, build_body)
+    except Exception as e:
+        log.exception("Error fetching policies for domain %s: %s", domain_id, e)
+        return jsonify({'error': f"Internal server error: {str(e)}"}), 500
+
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', 100))
+
+def list_rows(list_page, allowed_columns, default_columns, filters):
+    """
+    Shared implementation of the keyset-paginated listing endpoints.
+
+    Query params:
+        limit: Page size (default DEFAULT_PAGE_SIZE, at most MAX_PAGE_SIZE).
+        after: ID cursor; pass the previous page's next_cursor.
+        fields: Comma-separated columns to return (id is always included).
+        format: "ndjson" to stream every row from the cursor on, one JSON
+            object per line, fetched a page at a time.
+
+    Returns:
+        JSON {"items": [...], "next_cursor": id or null}, or an NDJSON stream.
+    """
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    after = request.args.get('after', type=int)
+    fields = request.args.get('fields')
+    try:
+        columns = select_columns(fields.split(',') if fields else None, allowed_columns, default_columns)
+    except ValueError as e:
+        return jsonify({'error': f"Invalid request: {e}"}), 400
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    filters = {key: value for key, value in filters.items() if value}
+
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            for row in iter_pages(list_page, page_size=MAX_PAGE_SIZE, after_id=after, columns=columns, **filters):
+                yield json.dumps(row) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
-        log.info(f"Found {len(policies)} policies for domain ID: {domain_id}")
-        return jsonify(policies), 200 # Return the list directly
+    try:
+        page = list_page(after_id=after, limit=limit, columns=columns, **filters)
     except Exception as e:
-        log.exception(f"Error fetching policies for domain {domain_id}: {e}")
+        log.exception("Error listing rows after %s: %s", after, e)
         return jsonify({'error': f"Internal server error: {str(e)}"}), 500
+    return jsonify({'items': page, 'next_cursor': page[-1]['id'] if len(page) == limit else None}), 200
+
+@app.route('/domains', methods=['GET'])
+def list_domains():
+    """
+    Lists domains in ID order, a page at a time (see list_rows for paging params).
+
+    Query params:
+        processing_status: Only domains with this status.
+    """
+    return list_rows(Domain.list_page, DOMAIN_COLUMNS, DOMAIN_COLUMNS,
+                     {'processing_status': request.args.get('processing_status')})
+
+@app.route('/policies', methods=['GET'])
+def list_policies():
+    """
+    Lists policies in ID order, a page at a time (see list_rows for paging params).
+
+    Without fields=, the analysis and llm_details result fields are left
+    out; naming them costs one more query per page.
+
+    Query params:
+        domain_id: Only policies of this domain.
+        processing_status: Only policies with this status.
+        policy_type: Only policies of this type.
+    """
+    return list_rows(Policy.list_page, POLICY_COLUMNS, POLICY_SUMMARY_COLUMNS, {
+        'domain_id': request.args.get('domain_id'),
+        'processing_status': request.args.get('processing_status'),
+        'policy_type': request.args.get('policy_type')
+    })
+
+@app.route('/policies/<string:policy_id>/changes', methods=['GET'])
+def list_policy_changes(policy_id):
+    """
+    Lists what changed between analyzed versions of a policy, newest first.
+
+    Query params:
+        limit: Page size (default 20, max 1000).
+        before: ID of the last change of the previous page.
+    """
+    limit = max(1, min(request.args.get('limit', 20, type=int), MAX_PAGE_SIZE))
+    before = request.args.get('before', type=int)
+    try:
+        changes = PolicyChange.list_for_policy(policy_id, before_id=before, limit=limit)
+    except Exception as e:
+        log.exception("Error listing changes of policy %s: %s", policy_id, e)
+        return jsonify({'error': f"Internal server error: {str(e)}"}), 500
+    return jsonify({'items': changes, 'next_cursor': changes[-1]['id'] if len(changes) == limit else None}), 200
+
+def get_or_create_analysis_domain(domain_name):
+    """Returns the domain row for an analysis request, creating it if needed."""
+    domain = Domain.get_by_name(domain_name) # Returns dict or None
+    
+    if not domain:
+        log.info("Domain '%s' not found for analysis. Creating new domain.", domain_name)
+        # Create new domain - assuming base_url is the policy URL for simplicity here
+        # Might need refinement based on how base_url should be determined
+        domain_creation_response = Domain.create(
+            name=domain_name,
+            base_url=f"https://{domain_name}" # Construct a base URL
+        )
+        if not domain_creation_response.data:
+             log.error("Failed to create domain '%s' for analysis.", domain_name)
+             raise Exception("Failed to create domain for analysis")
+        domain = domain_creation_response.data[0]
+        log.info("Created domain '%s' (ID: %s) for analysis.", domain_name, domain['id'])
+    else:
+         log.info("Domain '%s' (ID: %s) found for analysis.", domain_name, domain['id'])
+    return domain
+
+@app.route('/fetch-and-analyze', methods=['POST'])
+def fetch_and_analyze():
+    """
+    Saves and analyzes a batch of policy URLs in one request.
+
+    Each domain is resolved once, existing policies are looked up in a single
+    query and missing ones are inserted in one bulk insert. The analyses run
+    concurrently on the analysis worker pool.
+
+    Body: {"urls": [url, ...] or [{"url", "title", "policy_type"}, ...]}
+    Query params:
+        wait: "true" to hold the request until the analyses finish, for at most
+            BATCH_WAIT_TIMEOUT seconds. By default the request returns 202 with
+            job IDs straight away, to be polled at /jobs/<job_id>, so batches
+            don't tie up the server's request threads.
+        stream: "true" to stream per-URL results as NDJSON as they finish
+            (implies wait).
+
+    Returns:
+        JSON {"results": [...]} with one entry per URL; 202 while any job is
+        still queued or running.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('urls') or data.get('policies')
+    if not isinstance(items, list) or not items:
+        log.warning("Invalid request received for fetch_and_analyze: urls missing.")
+        return jsonify({'error': 'Invalid request: "urls" must be a non-empty list.'}), 400
+    if len(items) > MAX_BATCH_URLS:
+        return jsonify({'error': f'Invalid request: at most {MAX_BATCH_URLS} URLs per batch.'}), 400
+
+    requested = OrderedDict()
+    for item in items:
+        item = {'url': item} if isinstance(item, str) else item
+        url = item.get('url') if isinstance(item, dict) else None
+        if url and extract_domain(url):
+            requested.setdefault(url, item)
+    log.info("Received batch analysis request for %s URLs", len(requested))
+    if not requested:
+        return jsonify({'error': 'Invalid request: no valid URLs provided.'}), 400
+
+    results = OrderedDict((url, {'url': url}) for url in requested)
+    jobs = {}
+    try:
+        existing = {policy['page_url']: policy for policy in Policy.get_by_urls(list(requested))}
+
+        by_domain = OrderedDict()
+        for url in requested:
+            by_domain.setdefault(extract_domain(url), []).append(url)
+
+        new_rows = []
+        for domain_name, urls in by_domain.items():
+            domain = get_or_create_analysis_domain(domain_name)
+            for url in urls:
+                if url not in existing:
+                    item = requested[url]
+                    new_rows.append(Policy.new_row(
+                        domain_id=domain['id'],
+                        policy_type=item.get('policy_type', 'privacy_policy'),
+                        page_name=item.get('title') or url,
+                        page_url=url
+                    ))
+        created = Policy.upsert_many(new_rows)
+        for policy in created:
+            existing[policy['page_url']] = policy
+        missing = [url for url in requested if url not in existing]
+        if missing:
+            # Created concurrently by another request between our lookup and insert
+            existing.update((policy['page_url'], policy) for policy in Policy.get_by_urls(missing))
+        log.info("Batch analysis: %s new policies created", len(created))
+
+        for url in requested:
+            policy = existing.get(url)
+            if not policy:
+                results[url].update({'status': 'failed', 'error': 'Failed to create policy entry'})
+                continue
+            results[url]['policy_id'] = policy['id']
+            try:
+                job = analysis_jobs.submit(dedupe_key=str(policy['id']), policy_id=policy['id'], url=url)
+                jobs[url] = job
+                results[url].update({'job_id': job.id, 'status': job.status})
+            except QueueFullError:
+                results[url].update({'status': 'failed', 'error': 'Analysis queue is full, please retry later.'})
+    except Exception as e:
+        log.exception("Error preparing batch analysis: %s", e)
+        return jsonify({'error': f'Internal server error during analysis: {str(e)}'}), 500
+
+    stream = request.args.get('stream', 'false').lower() in ['true', '1', 't']
+    if not stream and request.args.get('wait', 'false').lower() not in ['true', '1', 't']:
+        return jsonify({'results': list(results.values())}), 202
+
+    deadline = time.monotonic() + BATCH_WAIT_TIMEOUT
+
+    def finish(url):
+        job = jobs[url]
+        job.wait(max(0.0, deadline - time.monotonic()))
+        results[url].update({'status': job.status, 'result': job.result, 'error': job.error})
+        return results[url]
+
+    if stream:
+        def generate():
+            pending = set(jobs)
+            for url, result in results.items():
+                if url not in jobs:
+                    yield json.dumps(result) + '\n'
+            while pending and time.monotonic() < deadline:
+                for url in [url for url in pending if jobs[url].wait(0.1)]:
+                    pending.discard(url)
+                    yield json.dumps(finish(url)) + '\n'
+            for url in pending:
+                yield json.dumps(finish(url)) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    for url in jobs:
+        finish(url)
+    status = 200 if all(job.finished for job in jobs.values()) else 202
+    return jsonify({'results': list(results.values())}), status
 
 @app.route('/analyze-policy', methods=['POST'])
 def analyze_policy():
     """
-    Analyzes a single policy URL. Creates domain/policy if they don't exist.
+    Queues analysis of a single policy URL. Creates domain/policy if they don't exist.
+
+    Returns 202 with a job ID; progress is reported by /jobs/<job_id>.
     """
     data = request.get_json()
     url = data.get('url')
     title = data.get('title')
 
-    log.info(f"Received policy analysis request for URL: {url}")
+    log.info("Received policy analysis request for URL: %s", url)
 
     if not url or not title:
         log.warning("Invalid request received for analyze_policy: URL or title missing.")
@@ -225,143 +499,230 @@ def analyze_policy():
     try:
         domain_name = extract_domain(url)
         if not domain_name:
-             log.error(f"Could not extract domain from URL: {url}")
+             log.error("Could not extract domain from URL: %s", url)
              return jsonify({'error': 'Invalid URL provided.'}), 400
 
-        # Check if domain exists
-        domain = Domain.get_by_name(domain_name) # Returns dict or None
-        
-        if not domain:
-            log.info(f"Domain '{domain_name}' not found for analysis. Creating new domain.")
-            # Create new domain - assuming base_url is the policy URL for simplicity here
-            # Might need refinement based on how base_url should be determined
-            domain_creation_response = Domain.create(
-                name=domain_name,
-                base_url=f"https://{domain_name}" # Construct a base URL
-            )
-            if not domain_creation_response.data:
-                 log.error(f"Failed to create domain '{domain_name}' for analysis.")
-                 raise Exception("Failed to create domain for analysis")
-            domain = domain_creation_response.data[0]
-            log.info(f"Created domain '{domain_name}' (ID: {domain['id']}) for analysis.")
-        else:
-             log.info(f"Domain '{domain_name}' (ID: {domain['id']}) found for analysis.")
-
+        domain = get_or_create_analysis_domain(domain_name)
         domain_id = domain['id']
 
         # Check if policy exists
         policy = Policy.get_by_url(url) # Returns dict or None
 
         if not policy:
-            log.info(f"Policy URL '{url}' not found. Creating new policy entry.")
+            log.info("Policy URL '%s' not found. Creating new policy entry.", url)
             # Create new policy entry
-            policy_creation_response = Policy.create(
+            # Insert-or-fetch keyed on the unique page_url, so concurrent requests can't create duplicates
+            policy = Policy.get_or_create(
                 domain_id=domain_id,
                 policy_type='privacy_policy', # Assuming default, adjust if needed
                 page_name=title,
                 page_url=url
             )
-            if not policy_creation_response.data:
-                 log.error(f"Failed to create policy entry for URL '{url}'.")
-                 raise Exception("Failed to create policy entry")
-            policy = policy_creation_response.data[0]
-            log.info(f"Created policy entry for URL '{url}' (ID: {policy['id']}).")
+            log.info("Using policy entry for URL '%s' (ID: %s).", url, policy['id'])
         else:
-            log.info(f"Policy URL '{url}' (ID: {policy['id']}) found. Proceeding with analysis.")
+            log.info("Policy URL '%s' (ID: %s) found. Proceeding with analysis.", url, policy['id'])
 
         policy_id = policy['id']
 
-        # Fetch content and perform analysis
-        log.info(f"Fetching content for policy URL: {url}")
-        content = fetch_policy_content(url)
-        if content is None:
-            log.error(f"Failed to fetch content for URL: {url}")
-            # Update policy status to failed
-            Policy.update(policy_id, {'processing_status': 'failed_fetch'})
-            return jsonify({'error': 'Failed to fetch policy content.'}), 500
-
-        log.info(f"Performing analysis for policy ID: {policy_id}")
-        # Update status to 'processing' before starting analysis
-        Policy.update(policy_id, {'processing_status': 'processing'})
-
-        # Assuming perform_analysis is synchronous for now
-        # If it becomes async, this needs adjustment (e.g., background task)
-        analysis_result = perform_analysis(content)
-        
-        # Update policy with results
-        log.info(f"Analysis complete for policy ID: {policy_id}. Updating database.")
-        Policy.update(policy_id, {
-            'processing_status': 'processed',
-            'last_updated_at': datetime.utcnow().isoformat(),
-            'llm_details': 'Gemini 1.5', # Example, fetch from config if dynamic
-            'llm_prompt': 'Default analysis prompt', # Example, fetch from config
-            'processing_output': json.dumps(analysis_result) # Ensure result is JSON serializable
-        })
-
-        log.info(f"Policy {policy_id} analyzed and saved successfully.")
-        return jsonify({'message': 'Policy analyzed and saved successfully.', 'policy_id': policy_id}), 200
-
+        job = analysis_jobs.submit(dedupe_key=str(policy_id), policy_id=policy_id, url=url)
+        log.info("Queued analysis job %s for policy ID: %s", job.id, policy_id)
+        return jsonify({
+            'message': 'Policy analysis queued.',
+            'policy_id': policy_id,
+            'job_id': job.id,
+            'status_url': f"/jobs/{job.id}"
+        }), 202
+
+    except QueueFullError as e:
+        log.warning("Rejecting analysis of %s: %s", url, e)
+        return jsonify({'error': 'Analysis queue is full, please retry later.'}), 503
     except Exception as e:
-        log.exception(f"Error analyzing policy {url}: {e}")
-        # Attempt to update policy status to failed if possible
-        if 'policy_id' in locals():
-            try:
-                Policy.update(policy_id, {'processing_status': 'failed_analysis'})
-            except Exception as update_e:
-                log.error(f"Failed to update policy status to failed_analysis for {policy_id}: {update_e}")
+        log.exception("Error analyzing policy %s: %s", url, e)
         return jsonify({'error': f'Internal server error during analysis: {str(e)}'}), 500
 
-def extract_domain(url):
-    parsed_url = urlparse(url)
-    return parsed_url.netloc
+@app.route('/jobs/<string:job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Reports the progress of a queued analysis job.
 
+    Args:
+        job_id: The ID returned by /analyze-policy.
 
-def fetch_policy_content(url: str) -> Optional[str]:
+    Returns:
+        JSON job status or 404 if the job is unknown.
+    """
+    job = analysis_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+async def run_analysis_job(job):
+    """Job handler: runs the fetch -> analyze -> persist pipeline for a queued policy."""
+    return await analyze_policy_url(job.payload['policy_id'], job.payload['url'], on_stage=job.set_stage)
+
+MAX_BATCH_URLS = int(os.environ.get('MAX_BATCH_URLS', 50))
+# Kept short: a waiting batch holds one of the server's request threads
+BATCH_WAIT_TIMEOUT = float(os.environ.get('BATCH_WAIT_TIMEOUT', 10))
+
+analysis_jobs = JobQueue(
+    run_analysis_job,
+    num_workers=int(os.environ.get('ANALYSIS_WORKERS', 4)),
+    max_queue_size=int(os.environ.get('ANALYSIS_QUEUE_SIZE', 1000)),
+    name='analysis-worker'
+)
+metrics.gauge('policy_analysis_jobs_pending', 'Analysis jobs waiting for a worker',
+              callback=analysis_jobs.pending_count)
+metrics.gauge('policy_analysis_jobs_in_flight', 'Analysis jobs being run by a worker',
+              callback=analysis_jobs.in_flight_count)
+if policy_fetcher.scheduler:
+    metrics.gauge('policy_fetch_slots_active', 'Policy fetches in flight',
+                  callback=lambda: policy_fetcher.scheduler.stats()['active'])
+    metrics.gauge('policy_fetch_slots_waiting', 'Policy fetches waiting for a per-host slot',
+                  callback=lambda: policy_fetcher.scheduler.stats()['waiting'])
+metrics.gauge('policy_log_records_dropped', 'Log records discarded because the log queue was full',
+              callback=dropped_records)
+
+# How long shutdown waits for queued and running analyses to finish
+ANALYSIS_DRAIN_TIMEOUT = float(os.environ.get('ANALYSIS_DRAIN_TIMEOUT', 60))
+
+def begin_drain():
+    """
+    Marks the process as shutting down while it still serves requests: /readyz
+    reports not-ready and new analyses are refused. drain_analysis_jobs() then
+    finishes what was already queued.
     """
-    Fetches the text content of a given URL.
+    analysis_jobs.close()
+    log.info("Shutting down: refusing new analyses (%s queued, %s running)",
+             analysis_jobs.pending_count(), analysis_jobs.in_flight_count())
 
-    Args:
-        url: The URL to fetch content from.
+def drain_analysis_jobs(timeout=None):
+    """
+    Stops accepting analyses and visits, then waits for queued/running analyses to finish
+    and writes buffered visits. Called on shutdown.
+    """
+    analysis_jobs.stop(timeout=ANALYSIS_DRAIN_TIMEOUT if timeout is None else timeout)
+    visit_buffer.stop(timeout=VISIT_FLUSH_INTERVAL * 2)
+
+VISIT_FLUSH_INTERVAL = float(os.environ.get('VISIT_FLUSH_INTERVAL', 2.0))
+MAX_VISITS_PER_REQUEST = int(os.environ.get('MAX_VISITS_PER_REQUEST', 100))
+
+visit_buffer = VisitBuffer(
+    flush_size=int(os.environ.get('VISIT_FLUSH_SIZE', 500)),
+    flush_interval=VISIT_FLUSH_INTERVAL,
+    max_buffered=int(os.environ.get('VISIT_BUFFER_SIZE', 10000))
+)
+metrics.gauge('policy_visits_buffered', 'Visit events waiting to be written', callback=visit_buffer.pending)
+
+@app.route('/track-visit', methods=['POST'])
+def track_visit():
+    """
+    Records page visits for popularity tracking.
+
+    Visits are buffered and written to user_history in bulk in the
+    background, so this returns 202 without touching the database for known
+    domains.
+
+    Body: {"user_id", "domain"} for one visit, or {"visits": [{"user_id", "domain"}, ...]}.
+        "domain_id" may be given instead of "domain".
 
     Returns:
-        The text content of the page, or None if fetching fails.
+        202 with the number of visits accepted (visits to unknown domains are skipped),
+        or 503 with Retry-After when the buffer is full.
     """
-    import requests
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid request: body must be a JSON object.'}), 400
+    visits = data.get('visits') if 'visits' in data else [data]
+    if not isinstance(visits, list) or not visits or len(visits) > MAX_VISITS_PER_REQUEST:
+        return jsonify({'error': f'Invalid request: between 1 and {MAX_VISITS_PER_REQUEST} visits required.'}), 400
+
+    accepted = 0
     try:
-        headers = {'User-Agent': 'PolicyAnalyzerBot/1.0 (+http://example.com/bot)'} # Be a good citizen
-        response = requests.get(url, timeout=20, headers=headers, allow_redirects=True) # Increased timeout, allow redirects
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-        
-        # Basic check for HTML content type
-        content_type = response.headers.get('Content-Type', '').lower()
-        if 'html' not in content_type and 'text' not in content_type:
-             log.warning(f"Unexpected content type '{content_type}' for URL: {url}")
-             # Decide if you want to proceed or return None/error
-             # return None 
-
-        # Consider adding basic HTML parsing here if needed (e.g., using BeautifulSoup)
-        # from bs4 import BeautifulSoup
-        # soup = BeautifulSoup(response.text, 'html.parser')
-        # return soup.get_text() 
-        
-        log.info(f"Successfully fetched content from {url}")
-        return response.text
-    except requests.exceptions.Timeout:
-        log.error(f"Timeout error fetching policy content from {url}")
-        return None
-    except requests.exceptions.RequestException as e:
-        log.exception(f"Request error fetching policy content from {url}: {e}")
-        return None
+        for visit in visits:
+            user_id = visit.get('user_id') if isinstance(visit, dict) else None
+            if not user_id:
+                return jsonify({'error': 'Invalid request: "user_id" is required for every visit.'}), 400
+            domain_id = visit.get('domain_id')
+            if domain_id is None and visit.get('domain'):
+                domain = Domain.get_by_name(visit['domain'])
+                domain_id = domain['id'] if domain else None
+            if domain_id is None:
+                continue
+            visit_buffer.record(str(user_id), domain_id)
+            accepted += 1
+    except BufferFullError:
+        log.warning("Visit buffer full; rejecting visits after %s accepted", accepted)
+        response = jsonify({'error': 'Too many visits, please retry later.', 'accepted': accepted})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(max(1, int(VISIT_FLUSH_INTERVAL)))
+        return response
     except Exception as e:
-        log.exception(f"Unexpected error fetching policy content from {url}: {e}")
-        return None
+        log.exception("Error recording visits: %s", e)
+        return jsonify({'error': f"Internal server error: {str(e)}"}), 500
+    return jsonify({'accepted': accepted}), 202
+
+@app.route('/popular-domains', methods=['GET'])
+def popular_domains():
+    """
+    Most visited domains over the last 30 days, from the domain_popularity view.
+
+    Query params:
+        limit: Number of domains (default 10, max 100).
+    """
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    try:
+        return jsonify(UserHistory.get_popular_domains(limit)), 200
+    except Exception as e:
+        log.exception("Error fetching popular domains: %s", e)
+        return jsonify({'error': f"Internal server error: {str(e)}"}), 500
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness probe: the process is up and serving requests."""
+    return jsonify({'status': 'ok'}), 200
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    Readiness probe for load balancers.
+
+    Returns 503 from the moment shutdown starts (see begin_drain) until the
+    process exits, so new traffic goes to other instances.
+    """
+    body = {
+        'status': 'draining' if analysis_jobs.closed else 'ok',
+        'analysis_jobs': {'pending': analysis_jobs.pending_count(), 'in_flight': analysis_jobs.in_flight_count()}
+    }
+    return jsonify(body), 503 if analysis_jobs.closed else 200
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Reports hit/miss counters for the backend caches."""
+    return jsonify({
+        'analysis': analysis_cache_stats.to_dict(),
+        'near_duplicates': near_duplicate_stats.to_dict(),
+        'domains': domain_cache.to_dict(),
+        'policies': policy_cache.to_dict(),
+        'analysis_singleflight': {'shared': analysis_flights.shared, 'in_flight': analysis_flights.in_flight()},
+        'robots': policy_fetcher.robots.cache.to_dict() if policy_fetcher.robots else None,
+        'fetch_scheduler': policy_fetcher.scheduler.stats() if policy_fetcher.scheduler else None
+    }), 200
+
+def extract_domain(url):
+    parsed_url = urlparse(url)
+    return parsed_url.netloc
+
 
 
 if __name__ == '__main__':
     # Use environment variables for host and port if available, otherwise default
     host = os.environ.get('FLASK_RUN_HOST', '127.0.0.1')
     port = int(os.environ.get('FLASK_RUN_PORT', 5000))
-    debug_mode = os.environ.get('FLASK_DEBUG', 'True').lower() in ['true', '1', 't']
+    debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() in ['true', '1', 't']
     
-    log.info(f"Starting Flask server on {host}:{port} with debug={debug_mode}")
-    app.run(host=host, port=port, debug=debug_mode)
\ No newline at end of file
+    # Development server only; production runs through serve.py
+    log.info("Starting Flask development server on %s:%s with debug=%s", host, port, debug_mode)
+    try:
+        app.run(host=host, port=port, debug=debug_mode)
+    finally:
+        drain_analysis_jobs()
\ No newline at end of file
@@ -0,0 +1,7 @@
+"""
+Benchmarks and load generation for the Flask backend.
+
+Everything runs locally: models.py talks to an in-memory stand-in for the
+Supabase client, analyses use the 'stub' LLM config, and policy pages are
+served by a synthetic HTTP server. See benchmarks/run.py for usage.
+"""
@@ -0,0 +1,248 @@
+import copy
+import itertools
+import threading
+import time
+from typing import Optional, Dict, Any, List
+
+from postgrest.exceptions import APIError
+
+# Unique columns enforced by the migrations
+UNIQUE_COLUMNS = {
+    'domains': ['name'],
+    'policies': ['page_url'],
+    'policy_signatures': ['policy_id'],
+    'llm_prompts': ['hash']
+}
+
+
+class FakeResult:
+    def __init__(self, data: List[Dict[str, Any]], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class FakeSupabase:
+    """
+    In-memory stand-in for the subset of the Supabase client used by models.py.
+
+    Every ``execute()`` counts as one database round trip, and can be delayed
+    by ``latency`` seconds to simulate network distance. The policy_count
+    trigger from migration 003 is emulated.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self.round_trips = 0
+
+    def table(self, name: str) -> 'FakeQuery':
+        return FakeQuery(self, name)
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.round_trips = 0
+
+    def rows(self, table: str) -> Dict[int, Dict[str, Any]]:
+        return self.tables.setdefault(table, {})
+
+    def _on_insert(self, table: str, row: Dict[str, Any]) -> None:
+        if table == 'policies':
+            domain = self.rows('domains').get(row.get('domain_id'))
+            if domain is not None:
+                domain['policy_count'] = domain.get('policy_count', 0) + 1
+
+    def _on_delete(self, table: str, row: Dict[str, Any]) -> None:
+        if table == 'policies':
+            domain = self.rows('domains').get(row.get('domain_id'))
+            if domain is not None:
+                domain['policy_count'] = max(0, domain.get('policy_count', 0) - 1)
+        elif table == 'domains':
+            policies = self.rows('policies')
+            for policy_id in [pid for pid, p in policies.items() if p.get('domain_id') == row['id']]:
+                del policies[policy_id]
+
+
+class FakeQuery:
+    def __init__(self, db: FakeSupabase, table: str):
+        self.db = db
+        self.table = table
+        self.operation = 'select'
+        self.columns = '*'
+        self.count_mode: Optional[str] = None
+        self.filters = []
+        self.payload: Any = None
+        self.on_conflict: Optional[str] = None
+        self.ignore_duplicates = False
+        self.order_by: List[tuple] = []
+        self.limit_count: Optional[int] = None
+        self.range_bounds: Optional[tuple] = None
+        self.head = False
+
+    # Query builders
+    def select(self, columns: str = '*', count: Optional[str] = None, head: bool = False, **kwargs) -> 'FakeQuery':
+        self.operation = 'select'
+        self.columns = columns
+        self.count_mode = count
+        self.head = head
+        return self
+
+    def insert(self, data: Any, **kwargs) -> 'FakeQuery':
+        self.operation = 'insert'
+        self.payload = data
+        return self
+
+    def upsert(self, data: Any, on_conflict: Optional[str] = None, ignore_duplicates: bool = False, **kwargs) -> 'FakeQuery':
+        self.operation = 'upsert'
+        self.payload = data
+        self.on_conflict = on_conflict
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, data: Dict[str, Any], **kwargs) -> 'FakeQuery':
+        self.operation = 'update'
+        self.payload = data
+        return self
+
+    def delete(self, **kwargs) -> 'FakeQuery':
+        self.operation = 'delete'
+        return self
+
+    def eq(self, column: str, value: Any) -> 'FakeQuery':
+        self.filters.append(lambda row: _same(row.get(column), value))
+        return self
+
+    def neq(self, column: str, value: Any) -> 'FakeQuery':
+        self.filters.append(lambda row: not _same(row.get(column), value))
+        return self
+
+    def in_(self, column: str, values: List[Any]) -> 'FakeQuery':
+        values = [str(v) for v in values]
+        self.filters.append(lambda row: str(row.get(column)) in values)
+        return self
+
+    def gt(self, column: str, value: Any) -> 'FakeQuery':
+        self.filters.append(lambda row: row.get(column) is not None and _comparable(row.get(column)) > _comparable(value))
+        return self
+
+    def lt(self, column: str, value: Any) -> 'FakeQuery':
+        self.filters.append(lambda row: row.get(column) is not None and _comparable(row.get(column)) < _comparable(value))
+        return self
+
+    def lte(self, column: str, value: Any) -> 'FakeQuery':
+        self.filters.append(lambda row: row.get(column) is not None and _comparable(row.get(column)) <= _comparable(value))
+        return self
+
+    def order(self, column: str, desc: bool = False, **kwargs) -> 'FakeQuery':
+        self.order_by.append((column, desc))
+        return self
+
+    def limit(self, count: int, **kwargs) -> 'FakeQuery':
+        self.limit_count = count
+        return self
+
+    def range(self, start: int, end: int) -> 'FakeQuery':
+        self.range_bounds = (start, end)
+        return self
+
+    def execute(self) -> FakeResult:
+        if self.db.latency:
+            time.sleep(self.db.latency)
+        with self.db._lock:
+            self.db.round_trips += 1
+            return getattr(self, f"_execute_{self.operation}")()
+
+    # Execution
+    def _matching(self) -> List[Dict[str, Any]]:
+        return [row for row in self.db.rows(self.table).values() if all(f(row) for f in self.filters)]
+
+    def _execute_select(self) -> FakeResult:
+        rows = self._matching()
+        for column, desc in reversed(self.order_by):
+            rows.sort(key=lambda row: _comparable(row.get(column)), reverse=desc)
+        total = len(rows)
+        if self.range_bounds:
+            rows = rows[self.range_bounds[0]:self.range_bounds[1] + 1]
+        if self.limit_count is not None:
+            rows = rows[:self.limit_count]
+        if self.head:
+            return FakeResult([], total if self.count_mode else None)
+        return FakeResult([self._project(row) for row in rows], total if self.count_mode else None)
+
+    def _project(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        for column in [c.strip() for c in self.columns.split(',') if c.strip()]:
+            if column == '*':
+                result.update(copy.deepcopy(row))
+            elif column.endswith('(*)'):
+                related = column[:-3]
+                parent = self.db.rows(related).get(row.get(f"{related[:-1]}_id"))
+                result[related] = copy.deepcopy(parent)
+            else:
+                result[column] = copy.deepcopy(row.get(column))
+        return result
+
+    def _find_conflict(self, row: Dict[str, Any], columns: List[str],
+                       composite: bool = False) -> Optional[Dict[str, Any]]:
+        # Separate unique columns conflict on any match; a composite key only when all match
+        match = all if composite else any
+        for existing in self.db.rows(self.table).values():
+            if match(column in row and existing.get(column) == row[column] for column in columns):
+                return existing
+        return None
+
+    def _execute_insert(self) -> FakeResult:
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        unique = UNIQUE_COLUMNS.get(self.table, [])
+        for row in rows:
+            if self._find_conflict(row, unique):
+                raise APIError({'message': f'duplicate key value violates unique constraint on {self.table}',
+                                'code': '23505'})
+        return FakeResult([self._store(row) for row in rows])
+
+    def _execute_upsert(self) -> FakeResult:
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        conflict_columns = [c.strip() for c in (self.on_conflict or 'id').split(',')]
+        written = []
+        for row in rows:
+            existing = self._find_conflict(row, conflict_columns, composite=True)
+            if existing is None:
+                written.append(self._store(row))
+            elif not self.ignore_duplicates:
+                existing.update(copy.deepcopy(row))
+                written.append(copy.deepcopy(existing))
+        return FakeResult(written)
+
+    def _execute_update(self) -> FakeResult:
+        updated = []
+        for row in self._matching():
+            row.update(copy.deepcopy(self.payload))
+            updated.append(copy.deepcopy(row))
+        return FakeResult(updated)
+
+    def _execute_delete(self) -> FakeResult:
+        deleted = self._matching()
+        table = self.db.rows(self.table)
+        for row in deleted:
+            del table[row['id']]
+            self.db._on_delete(self.table, row)
+        return FakeResult(deleted)
+
+    def _store(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        stored = copy.deepcopy(row)
+        stored['id'] = next(self.db._ids)
+        self.db.rows(self.table)[stored['id']] = stored
+        self.db._on_insert(self.table, stored)
+        return copy.deepcopy(stored)
+
+
+def _same(left: Any, right: Any) -> bool:
+    return left == right or (left is not None and right is not None and str(left) == str(right))
+
+
+def _comparable(value: Any) -> Any:
+    # IDs arrive as strings from URLs; compare numerically when possible
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return value if value is not None else ''
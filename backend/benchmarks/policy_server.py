@@ -0,0 +1,79 @@
+import hashlib
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Tuple
+
+_WORDS = (
+    'we collect personal information data share third parties cookies security encrypt access delete '
+    'rights contact email retain process service providers advertising analytics consent opt out law '
+    'request account device location usage improve protect children transfer international update policy'
+).split()
+_SECTIONS = [
+    'Information We Collect', 'How We Use Information', 'Sharing With Third Parties', 'Your Rights',
+    'Data Security', 'Data Retention', 'International Transfers', 'Children', 'Changes to This Policy', 'Contact Us'
+]
+_BOILERPLATE = (
+    '<header><nav><ul>' + ''.join(f'<li><a href="/{w}">{w}</a></li>' for w in _WORDS[:12]) + '</ul></nav></header>'
+    '<script>window.analytics = {track: function() {}};</script><style>body { font-family: sans-serif; }</style>'
+)
+
+
+def render_policy_page(size_kb: int, seed: int, version: int = 0) -> str:
+    """Deterministic privacy-policy-like HTML page of roughly ``size_kb`` kilobytes."""
+    rng = random.Random(f"{seed}:{version}")
+    target = size_kb * 1024
+    parts = [f'<html><head><title>Privacy Policy {seed}</title></head><body>{_BOILERPLATE}<main>'
+             f'<h1>Privacy Policy</h1>']
+    length = sum(len(p) for p in parts)
+    section = 0
+    while length < target:
+        heading = f'<h2>{section + 1}. {_SECTIONS[section % len(_SECTIONS)]}</h2>'
+        paragraphs = ''.join(
+            '<p>' + ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(40, 90))).capitalize() + '.</p>'
+            for _ in range(rng.randint(2, 5))
+        )
+        parts.append(heading + paragraphs)
+        length += len(heading) + len(paragraphs)
+        section += 1
+    parts.append(f'</main><footer>Copyright {seed}</footer></body></html>')
+    return ''.join(parts)
+
+
+class PolicyPageHandler(BaseHTTPRequestHandler):
+    """Serves /policies/<size_kb>/<seed>[?v=<version>] with ETag support."""
+
+    def do_GET(self):
+        try:
+            path, _, query = self.path.partition('?')
+            _, prefix, size_kb, seed = path.split('/')[:4]
+            version = int(query.split('v=', 1)[1]) if 'v=' in query else 0
+            if prefix != 'policies':
+                raise ValueError(path)
+            body = render_policy_page(int(size_kb), int(seed.split('.')[0]), version).encode('utf-8')
+        except ValueError:
+            self.send_error(404)
+            return
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_policy_server(host: str = '127.0.0.1', port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Starts the synthetic policy server in a background thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), PolicyPageHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='policy-server', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
@@ -0,0 +1,255 @@
+"""
+Load-generation harness for the Flask backend.
+
+Usage (from backend/):
+    python -m benchmarks.run --concurrency 1,8,32 --requests 200
+    python -m benchmarks.run --save-baseline main
+    python -m benchmarks.run --compare main --tolerance 0.2
+
+The app runs in-process on a real threaded HTTP server against an in-memory
+Supabase stand-in (optionally with simulated latency per query) and the
+'stub' LLM. Results are latency percentiles, throughput and database round
+trips per request for each scenario and concurrency level.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable
+
+import requests
+
+from benchmarks.fake_supabase import FakeSupabase
+from benchmarks.policy_server import start_policy_server
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+SCENARIOS = ['get_domain', 'get_policies', 'save_policies', 'analyze_policy', 'analyze_policy_e2e']
+
+
+def load_app(db: FakeSupabase):
+    """Imports app.py wired to the in-memory database and the stub LLM."""
+    os.environ.setdefault('LLM_NAME', 'stub')
+    # Every synthetic page is on one local host; politeness delays would only measure themselves
+    os.environ.setdefault('FETCH_HOST_DELAY', '0')
+    os.environ.setdefault('FETCH_MAX_PER_HOST', '64')
+    supabase_config = types.ModuleType('supabase_config')
+    supabase_config.supabase = db
+    sys.modules['supabase_config'] = supabase_config
+    import app as app_module
+    # Request-path logging would dominate the numbers; keep warnings only
+    logging.getLogger().setLevel(logging.WARNING)
+    return app_module
+
+
+def start_app_server(flask_app):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-app', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.db = FakeSupabase(latency=args.db_latency_ms / 1000.0)
+        self.app_module = load_app(self.db)
+        self.app_server, self.base_url = start_app_server(self.app_module.app)
+        self.policy_server, self.policy_url = start_policy_server()
+        self.sizes = [int(size) for size in args.sizes.split(',')]
+        self._local = threading.local()
+        self._counter = 0
+        self._counter_lock = threading.Lock()
+        self.domain_ids: List[Any] = []
+        self.seed()
+
+    def session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def next_index(self) -> int:
+        with self._counter_lock:
+            self._counter += 1
+            return self._counter
+
+    def seed(self) -> None:
+        """Populates domains with a few policies each through the public API."""
+        for i in range(self.args.domains):
+            response = self.session().post(f"{self.base_url}/save-policies", json={
+                'domain': f"site{i}.example",
+                'base_url': f"https://site{i}.example",
+                'policies': [
+                    {'url': f"https://site{i}.example/{kind}", 'title': kind, 'policy_type': kind}
+                    for kind in ('privacy_policy', 'terms_of_service', 'cookie_policy')
+                ]
+            })
+            response.raise_for_status()
+        self.domain_ids = [row['id'] for row in self.db.rows('domains').values()]
+
+    # Scenarios: each performs one logical request and raises on failure
+
+    def get_domain(self, i: int) -> None:
+        # 1 in 10 lookups is for a domain we have never seen
+        name = f"unknown{i}.example" if i % 10 == 0 else f"site{i % self.args.domains}.example"
+        response = self.session().get(f"{self.base_url}/get-domain/{name}")
+        if response.status_code not in (200, 404):
+            response.raise_for_status()
+
+    def get_policies(self, i: int) -> None:
+        domain_id = self.domain_ids[i % len(self.domain_ids)]
+        self.session().get(f"{self.base_url}/get-policies/{domain_id}").raise_for_status()
+
+    def save_policies(self, i: int) -> None:
+        site = i % (self.args.domains * 2)  # half existing domains, half new
+        self.session().post(f"{self.base_url}/save-policies", json={
+            'domain': f"site{site}.example",
+            'base_url': f"https://site{site}.example",
+            'policies': [{'url': f"https://site{site}.example/p{j}", 'title': f"Policy {j}"} for j in range(5)]
+        }).raise_for_status()
+
+    def _policy_page(self, i: int) -> str:
+        return f"{self.policy_url}/policies/{self.sizes[i % len(self.sizes)]}/{i}"
+
+    def analyze_policy(self, i: int) -> Dict[str, Any]:
+        response = self.session().post(f"{self.base_url}/analyze-policy",
+                                       json={'url': self._policy_page(i), 'title': f"Policy {i}"})
+        response.raise_for_status()
+        return response.json()
+
+    def analyze_policy_e2e(self, i: int) -> None:
+        job_id = self.analyze_policy(i)['job_id']
+        deadline = time.monotonic() + self.args.job_timeout
+        while time.monotonic() < deadline:
+            job = self.session().get(f"{self.base_url}/jobs/{job_id}").json()
+            if job['status'] == 'completed':
+                return
+            if job['status'] == 'failed':
+                raise RuntimeError(job['error'])
+            time.sleep(0.02)
+        raise TimeoutError(f"Job {job_id} did not finish in {self.args.job_timeout}s")
+
+    def run_scenario(self, name: str, concurrency: int) -> Dict[str, Any]:
+        scenario: Callable[[int], Any] = getattr(self, name)
+        total = self.args.requests
+        latencies: List[float] = []
+        errors = 0
+        lock = threading.Lock()
+
+        def one(_):
+            nonlocal errors
+            start = time.perf_counter()
+            try:
+                scenario(self.next_index())
+                ok = True
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+        self.db.reset_counters()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(total)))
+        wall = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'requests': total,
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'throughput_rps': round(len(latencies) / wall, 2) if wall else 0.0,
+            'db_round_trips_per_request': round(self.db.round_trips / total, 2)
+        }
+
+    def close(self) -> None:
+        self.app_module.analysis_jobs.stop(timeout=5)
+        self.app_server.shutdown()
+        self.policy_server.shutdown()
+
+
+def compare(results: Dict[str, Dict[str, Dict[str, Any]]], baseline: Dict[str, Dict[str, Dict[str, Any]]],
+            tolerance: float) -> List[str]:
+    """Returns a description of every metric that regressed by more than ``tolerance``."""
+    regressions = []
+    for scenario, levels in results.items():
+        for level, metrics in levels.items():
+            base = baseline.get(scenario, {}).get(level)
+            if not base:
+                continue
+            for key in ('p95_ms', 'p99_ms', 'db_round_trips_per_request'):
+                if base[key] and metrics[key] > base[key] * (1 + tolerance):
+                    regressions.append(f"{scenario} @ c={level}: {key} {base[key]} -> {metrics[key]}")
+            if base['throughput_rps'] and metrics['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+                regressions.append(f"{scenario} @ c={level}: throughput_rps {base['throughput_rps']} -> "
+                                   f"{metrics['throughput_rps']}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the policy analyzer backend')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated scenarios to run')
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario and level')
+    parser.add_argument('--domains', type=int, default=50, help='Domains seeded before the run')
+    parser.add_argument('--sizes', default='20,200,1000', help='Synthetic policy page sizes in KB')
+    parser.add_argument('--db-latency-ms', type=float, default=2.0, help='Simulated latency per database query')
+    parser.add_argument('--job-timeout', type=float, default=120.0, help='Seconds to wait for an analysis job')
+    parser.add_argument('--save-baseline', metavar='NAME', help='Save results as benchmarks/baselines/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='Compare against a saved baseline; exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression for --compare')
+    args = parser.parse_args(argv)
+
+    bench = Bench(args)
+    results: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    try:
+        for scenario in args.scenarios.split(','):
+            if scenario not in SCENARIOS:
+                parser.error(f"Unknown scenario: {scenario}")
+            for level in [int(c) for c in args.concurrency.split(',')]:
+                metrics = bench.run_scenario(scenario, level)
+                results.setdefault(scenario, {})[str(level)] = metrics
+                print(f"{scenario:<20} c={level:<4} p50={metrics['p50_ms']:>8}ms p95={metrics['p95_ms']:>8}ms "
+                      f"p99={metrics['p99_ms']:>8}ms {metrics['throughput_rps']:>8} req/s "
+                      f"db={metrics['db_round_trips_per_request']:>6}/req errors={metrics['errors']}")
+    finally:
+        bench.close()
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {path}")
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against baseline '{args.compare}'")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
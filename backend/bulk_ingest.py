@@ -0,0 +1,686 @@
+"""
+Bulk ingest: fetch, analyze and store a large list of policy URLs without going through the API.
+
+Usage (from backend/):
+    python manage_db.py ingest urls.csv [--fetch-workers 32] [--analyze-workers 8] ...
+
+The input is read one record at a time, so its size doesn't matter. It can
+be CSV with a header row, JSON Lines (.jsonl/.ndjson) or plain text with
+one URL per line, optionally gzipped. Each record needs a ``url`` (the
+policy page). ``domain``, ``policy_type`` and ``page_name`` (or ``title``)
+are optional; the domain defaults to the URL's host.
+
+Records flow through bounded queues between stages, each with its own
+number of workers:
+
+    read/register -> fetch -> extract -> analyze -> write
+
+Registering creates missing domain and policy rows with batched upserts.
+Fetch threads share a HostScheduler, so per-host politeness limits hold
+however many workers there are. Extraction runs in a process pool.
+Analysis threads each own an event loop and share the process-wide LLM
+rate limits. The writer saves results and upserts policies in batches. Policies whose stored
+analysis is current are skipped before fetching (see --refresh). Unchanged
+pages, near-duplicates and changed sections are handled as in the API
+pipeline.
+
+Progress is checkpointed after every write batch to
+``<input>.checkpoint.json`` as the number of leading records fully written,
+so a restarted ingest resumes from there. Records after that point that
+were already written are simply redone: writes are upserts keyed on
+page_url, and current analyses are skipped. Throughput per stage is logged
+every --report-interval seconds.
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Iterator, Tuple, Callable, TextIO
+from urllib.parse import urlsplit
+
+from models import Domain, Policy, PolicyResult
+from fetcher import PolicyFetcher, DEFAULT_TIMEOUT, DEFAULT_MAX_BYTES, dns_cache_from_env
+from politeness import HostScheduler
+from extraction import extract_policy_text
+from cache import content_checksum
+from llm_config import get_llm_config
+from pipeline import get_stored_analysis, find_near_duplicate, result_entry
+from similarity import near_duplicates
+from snapshots import analyze_policy_text, analyze_near_duplicate, record_updates
+from logging_config import setup_logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+# Keys per in_() lookup; they go in the query string, which servers cap in length
+LOOKUP_CHUNK = 50
+
+# Stats counters, in the order they are reported
+COUNTERS = ('read', 'skipped', 'invalid', 'fetched', 'unchanged', 'extracted', 'deduplicated', 'analyzed',
+            'failed_fetch', 'failed_analysis', 'written', 'write_errors')
+
+
+def _chunks(items: List[Any], size: int) -> Iterator[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def open_input(path: str) -> TextIO:
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def input_format(path: str) -> str:
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if name.endswith('.txt'):
+        return 'txt'
+    return 'csv'
+
+
+def read_records(path: str, fmt: Optional[str] = None, start_after: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Yields (record number, record) pairs from a CSV, JSON Lines or text file, numbered from 1.
+
+    Records up to ``start_after`` are skipped. Lines that can't be parsed
+    yield an empty record, so numbering stays stable across runs.
+    """
+    fmt = fmt or input_format(path)
+    with open_input(path) as f:
+        if fmt == 'csv':
+            records = csv.DictReader(f)
+        elif fmt == 'jsonl':
+            records = (_parse_json_line(line) for line in f if line.strip())
+        else:
+            records = ({'url': line.strip()} for line in f if line.strip())
+        for number, record in enumerate(records, 1):
+            if number > start_after:
+                yield number, record
+
+
+def _parse_json_line(line: str) -> Dict[str, Any]:
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return {}
+    return record if isinstance(record, dict) else {}
+
+
+class Checkpoint:
+    """
+    Tracks which records are done and saves the resume point.
+
+    Records finish out of order, so the saved position is the highest
+    record number with every record before it done.
+    """
+
+    def __init__(self, path: str, input_path: str, start_after: int = 0):
+        self.path = path
+        self.input_path = os.path.abspath(input_path)
+        self._lock = threading.Lock()
+        self._open = set()
+        self._read_up_to = start_after
+        self.position = start_after
+
+    @staticmethod
+    def load(path: str, input_path: str) -> int:
+        """Returns the saved position for ``input_path``, or 0 if there is no matching checkpoint."""
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if data.get('input') != os.path.abspath(input_path):
+            logger.warning("Checkpoint %s is for %s; starting from the beginning", path, data.get('input'))
+            return 0
+        return int(data.get('record', 0))
+
+    def opened(self, number: int) -> None:
+        with self._lock:
+            self._open.add(number)
+            self._read_up_to = max(self._read_up_to, number)
+
+    def done(self, numbers: List[int]) -> None:
+        with self._lock:
+            self._open.difference_update(numbers)
+
+    def save(self, stats: Dict[str, int]) -> None:
+        with self._lock:
+            self.position = (min(self._open) - 1) if self._open else self._read_up_to
+            data = {'input': self.input_path, 'record': self.position, 'stats': stats,
+                    'updated_at': datetime.utcnow().isoformat()}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+class Throughput:
+    """Thread-safe stage counters with periodic rate reports."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {name: 0 for name in COUNTERS}
+        self.started = time.monotonic()
+        self._last_counts = dict(self.counts)
+        self._last_report = self.started
+
+    def add(self, name: str, count: int = 1) -> None:
+        with self._lock:
+            self.counts[name] += count
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+    def report(self, queues: Dict[str, int]) -> str:
+        now = time.monotonic()
+        counts = self.snapshot()
+        interval = max(now - self._last_report, 1e-9)
+        elapsed = max(now - self.started, 1e-9)
+        rates = ', '.join(
+            f"{name} {counts[name]} ({(counts[name] - self._last_counts[name]) / interval:.1f}/s)"
+            for name in ('read', 'fetched', 'analyzed', 'written')
+        )
+        others = ', '.join(f"{name} {counts[name]}" for name in COUNTERS
+                           if name not in ('read', 'fetched', 'analyzed', 'written') and counts[name])
+        backlog = ', '.join(f"{name} {size}" for name, size in queues.items())
+        self._last_counts, self._last_report = counts, now
+        return (f"{rates} | overall {counts['written'] / elapsed:.1f} written/s"
+                + (f" | {others}" if others else '') + f" | queued: {backlog}")
+
+
+class _Stage:
+    """
+    Worker threads draining a bounded queue.
+
+    put() blocks while the queue is full, so a slow stage holds back the
+    ones before it. close() lets the workers finish what is queued; when
+    the last one exits, ``on_close`` runs (normally closing the next stage).
+    With ``event_loop``, each worker owns an asyncio loop and the handler
+    is a coroutine function. With ``batch_size``, the handler gets lists of
+    up to that many items, at least every ``flush_interval`` seconds while
+    items are waiting.
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any], Any], workers: int, queue_size: int,
+                 on_close: Optional[Callable[[], None]] = None, event_loop: bool = False,
+                 batch_size: Optional[int] = None, flush_interval: float = 5.0):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue: 'queue.Queue' = queue.Queue(maxsize=max(1, queue_size))
+        self.on_close = on_close
+        self.event_loop = event_loop
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._running = 0
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"ingest-{self.name}-{i}", daemon=True)
+            self._running += 1
+            self._threads.append(thread)
+            thread.start()
+
+    def put(self, item: Any) -> None:
+        self.queue.put(item)
+
+    def close(self) -> None:
+        for _ in range(self.workers):
+            self.queue.put(_DONE)
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self) -> None:
+        loop = None
+        if self.event_loop:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+        try:
+            if self.batch_size:
+                self._run_batches()
+                return
+            while True:
+                item = self.queue.get()
+                if item is _DONE:
+                    return
+                self._handle(loop, item)
+        finally:
+            if loop is not None:
+                loop.close()
+            with self._lock:
+                self._running -= 1
+                last = self._running == 0
+            if last and self.on_close:
+                self.on_close()
+
+    def _run_batches(self) -> None:
+        batch: List[Any] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is _DONE:
+                if batch:
+                    self._handle(None, batch)
+                return
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch:
+                    self._handle(None, batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _handle(self, loop: Optional[asyncio.AbstractEventLoop], item: Any) -> None:
+        # Handlers deal with their own failures; this only keeps the worker alive if one slips through
+        try:
+            if loop is not None:
+                loop.run_until_complete(self.handler(item))
+            else:
+                self.handler(item)
+        except Exception as e:
+            logger.exception("Unexpected error in ingest %s stage: %s", self.name, e)
+
+
+class _Item:
+    __slots__ = ('number', 'record', 'url', 'domain', 'policy', 'stored', 'fetched', 'content', 'checksum',
+                 'signature', 'update', 'result', 'row', 'outcome')
+
+    def __init__(self, number: int, record: Dict[str, Any]):
+        self.number = number
+        self.record = record
+        self.url = str(record.get('url') or '').strip()
+        parts = urlsplit(self.url)
+        self.domain = str(record.get('domain') or parts.netloc).strip().lower()
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            self.url = ''
+        self.policy: Optional[Dict[str, Any]] = None
+        self.stored: Optional[Dict[str, Any]] = None
+        self.fetched = None
+        self.content: Optional[str] = None
+        self.checksum: Optional[str] = None
+        self.signature: Optional[List[int]] = None
+        self.update = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.row: Optional[Dict[str, Any]] = None
+        self.outcome: Optional[str] = None
+
+    def set_row(self, outcome: str, **columns: Any) -> None:
+        # Identity columns are repeated so the batched upsert can insert if the row has gone
+        self.outcome = outcome
+        self.row = {
+            'domain_id': self.policy['domain_id'],
+            'policy_type': self.policy.get('policy_type'),
+            'page_name': self.policy.get('page_name'),
+            'page_url': self.policy['page_url'],
+            'last_updated_at': datetime.utcnow().isoformat(),
+            **columns
+        }
+
+
+class BulkIngest:
+    """
+    Runs one ingest of ``input_path``; see the module docstring.
+
+    Args:
+        fetch_workers: Pages fetched at once (also the HostScheduler's global limit).
+        extract_workers: Extraction processes; 0 extracts in a single thread of this process.
+        analyze_workers: Policies being analyzed at once.
+        batch_size: Records per register batch and per write batch.
+        flush_interval: Maximum seconds a finished record waits for its write batch.
+        refresh: Re-fetch policies whose stored analysis is current too.
+    """
+
+    def __init__(self, input_path: str, fmt: Optional[str] = None, checkpoint_path: Optional[str] = None,
+                 restart: bool = False, fetch_workers: int = 32, extract_workers: int = 4, analyze_workers: int = 8,
+                 batch_size: int = 200, flush_interval: float = 5.0, queue_size: int = 1000,
+                 report_interval: float = 30.0, refresh: bool = False, limit: Optional[int] = None):
+        self.input_path = input_path
+        self.fmt = fmt
+        self.checkpoint_path = checkpoint_path or f"{input_path}.checkpoint.json"
+        start_after = 0 if restart else Checkpoint.load(self.checkpoint_path, input_path)
+        self.checkpoint = Checkpoint(self.checkpoint_path, input_path, start_after)
+        self.batch_size = max(1, batch_size)
+        self.report_interval = report_interval
+        self.refresh = refresh
+        self.limit = limit
+        self.stats = Throughput()
+        self.llm_config = get_llm_config()
+        self.fetcher = PolicyFetcher(
+            timeout=float(os.getenv('FETCH_TIMEOUT', DEFAULT_TIMEOUT)),
+            max_bytes=int(os.getenv('FETCH_MAX_BYTES', DEFAULT_MAX_BYTES)),
+            pool_connections=fetch_workers,
+            pool_maxsize=fetch_workers,
+            scheduler=HostScheduler(
+                max_connections=fetch_workers,
+                max_per_host=int(os.getenv('FETCH_MAX_PER_HOST', 2)),
+                delay=float(os.getenv('FETCH_HOST_DELAY', 1.0))
+            ),
+            queue_timeout=float(os.getenv('FETCH_QUEUE_TIMEOUT', 600)),
+            respect_robots=os.getenv('FETCH_RESPECT_ROBOTS', 'true').lower() in ['true', '1', 't'],
+            robots_ttl=float(os.getenv('ROBOTS_CACHE_TTL', 3600)),
+            dns_cache=dns_cache_from_env()
+        )
+        # Threads are already running (logging, stages), and forking a threaded process is unsafe
+        self.extract_pool = ProcessPoolExecutor(extract_workers, mp_context=multiprocessing.get_context('spawn')) \
+            if extract_workers > 0 else None
+        self.writer = _Stage('write', self._write, 1, queue_size, batch_size=self.batch_size,
+                             flush_interval=flush_interval)
+        self.analyze_stage = _Stage('analyze', self._analyze, analyze_workers, queue_size,
+                                    on_close=self.writer.close, event_loop=True)
+        self.extract_stage = _Stage('extract', self._extract, max(1, extract_workers), queue_size,
+                                    on_close=self.analyze_stage.close)
+        self.fetch_stage = _Stage('fetch', self._fetch, fetch_workers, queue_size,
+                                  on_close=self.extract_stage.close)
+        self._domains_open: Dict[str, int] = {}
+        self._domains_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def run(self) -> Dict[str, int]:
+        """Processes the input to the end (or until interrupted) and returns the final counters."""
+        logger.info("Ingesting %s from record %s", self.input_path, self.checkpoint.position + 1)
+        stages = (self.writer, self.analyze_stage, self.extract_stage, self.fetch_stage)
+        for stage in stages:
+            stage.start()
+        reporter = threading.Thread(target=self._report_loop, name='ingest-report', daemon=True)
+        reporter.start()
+        try:
+            self._read()
+        except KeyboardInterrupt:
+            logger.warning("Interrupted; finishing records already in the pipeline (interrupt again to abort)")
+        finally:
+            self.fetch_stage.close()
+            for stage in reversed(stages):
+                stage.join()
+            self._stopping.set()
+            if self.extract_pool is not None:
+                self.extract_pool.shutdown()
+            self.fetcher.close()
+        self.checkpoint.save(self.stats.snapshot())
+        logger.info("Ingest finished at record %s: %s", self.checkpoint.position,
+                    self.stats.report(self._queue_sizes()))
+        return self.stats.snapshot()
+
+    # Stages
+
+    def _read(self) -> None:
+        batch: List[_Item] = []
+        start_after = self.checkpoint.position
+        for number, record in read_records(self.input_path, self.fmt, start_after=start_after):
+            if self.limit is not None and number > start_after + self.limit:
+                break
+            self.checkpoint.opened(number)
+            self.stats.add('read')
+            batch.append(_Item(number, record))
+            if len(batch) >= self.batch_size:
+                self._register(batch)
+                batch = []
+        self._register(batch)
+
+    def _register(self, batch: List[_Item]) -> None:
+        valid = [item for item in batch if item.url and item.domain]
+        for item in batch:
+            if not (item.url and item.domain):
+                logger.warning("Skipping record %s: no valid url", item.number)
+                self._finish(item, 'invalid')
+        if not valid:
+            return
+
+        schemes = {item.domain: urlsplit(item.url).scheme for item in valid}
+        domains = {}
+        for names in _chunks(list(schemes), LOOKUP_CHUNK):
+            domains.update(Domain.get_by_names(names))
+        missing = [name for name in schemes if name not in domains]
+        if missing:
+            Domain.insert_many([{
+                'name': name,
+                'base_url': f"{schemes[name]}://{name}",
+                'processing_status': 'pending_analysis',
+                'policy_count': 0,
+                'updated_at': datetime.utcnow().isoformat()
+            } for name in missing])
+            for names in _chunks(missing, LOOKUP_CHUNK):
+                domains.update(Domain.get_by_names(names))
+
+        new_rows = {}
+        for item in valid:
+            if item.url not in new_rows and item.domain in domains:
+                new_rows[item.url] = Policy.new_row(
+                    domain_id=domains[item.domain]['id'],
+                    policy_type=item.record.get('policy_type') or 'unknown',
+                    page_name=item.record.get('page_name') or item.record.get('title') or 'Untitled',
+                    page_url=item.url
+                )
+        Policy.upsert_many(list(new_rows.values()))
+        policies = {}
+        for urls in _chunks(list(new_rows), LOOKUP_CHUNK):
+            policies.update((policy['page_url'], policy) for policy in Policy.get_by_urls(urls))
+        results = {}
+        for keys in _chunks([(policy['id'], policy['checksum']) for policy in policies.values()
+                             if policy.get('processing_status') == 'processed' and policy.get('checksum')],
+                            LOOKUP_CHUNK):
+            results.update(PolicyResult.get_many(keys))
+
+        queued = set()
+        for item in valid:
+            item.policy = policies.get(item.url)
+            if item.policy is None or item.url in queued:
+                # Unknown domain/policy after the upserts, or a repeat of a URL in this batch
+                self._finish(item, 'skipped')
+                continue
+            queued.add(item.url)
+            item.stored = get_stored_analysis(item.policy, self.llm_config, results)
+            if item.stored is not None and not self.refresh:
+                self._finish(item, 'skipped')
+                continue
+            with self._domains_lock:
+                self._domains_open[str(item.policy['domain_id'])] = \
+                    self._domains_open.get(str(item.policy['domain_id']), 0) + 1
+            self.fetch_stage.put(item)
+
+    def _fetch(self, item: _Item) -> None:
+        try:
+            if item.stored is not None:
+                fetched = self.fetcher.fetch(item.url, etag=item.policy.get('http_etag'),
+                                             last_modified=item.policy.get('http_last_modified'))
+            else:
+                fetched = self.fetcher.fetch(item.url)
+        except Exception as e:
+            logger.error("Error fetching %s: %s", item.url, e)
+            fetched = None
+        if fetched is not None and fetched.not_modified:
+            self.stats.add('fetched')
+            item.set_row('unchanged', processing_status='processed', **fetched.validators())
+            self.writer.put(item)
+        elif fetched is None or fetched.text is None:
+            item.set_row('failed_fetch', processing_status='failed_fetch')
+            self.writer.put(item)
+        else:
+            self.stats.add('fetched')
+            item.fetched = fetched
+            self.extract_stage.put(item)
+
+    def _extract(self, item: _Item) -> None:
+        fetched = item.fetched
+        try:
+            extracted = self._extract_text(fetched.text, fetched.content_type)
+        except Exception as e:
+            logger.error("Error extracting %s: %s", item.url, e)
+            extracted = None
+        fetched.text = None  # only the validators are needed from here on
+        if extracted is None or not extracted.text:
+            item.set_row('failed_fetch', processing_status='failed_fetch', **fetched.validators())
+            self.writer.put(item)
+            return
+        self.stats.add('extracted')
+        item.content = extracted.text
+        self.analyze_stage.put(item)
+
+    def _extract_text(self, text: str, content_type: str):
+        pool = self.extract_pool
+        if pool is not None:
+            try:
+                return pool.submit(extract_policy_text, text, content_type).result()
+            except BrokenProcessPool:
+                if self.extract_pool is pool:
+                    logger.error("Extraction process pool died; extracting in this process from now on")
+                    self.extract_pool = None
+        return extract_policy_text(text, content_type)
+
+    async def _analyze(self, item: _Item) -> None:
+        try:
+            await self._analyze_item(item)
+        except Exception as e:
+            logger.exception("Error analyzing %s: %s", item.url, e)
+            item.set_row('failed_analysis', processing_status='failed_analysis')
+        item.content = None
+        self.writer.put(item)
+
+    async def _analyze_item(self, item: _Item) -> None:
+        validators = item.fetched.validators()
+        item.checksum = content_checksum(item.content)
+        if item.stored is not None and item.policy.get('checksum') == item.checksum:
+            item.set_row('unchanged', processing_status='processed', **validators)
+            return
+        item.signature = near_duplicates.signature(item.content)
+        found = find_near_duplicate(item.policy, item.signature, self.llm_config) \
+            if item.signature and near_duplicates.enabled else None
+        if found is not None:
+            update = await analyze_near_duplicate(item.policy, item.content, item.checksum, found[0])
+            if update is not None and not update.failed:
+                item.update = update
+                item.result = result_entry(item.policy['id'], item.checksum, update.result, self.llm_config)
+                item.set_row('deduplicated', processing_status='processed', checksum=item.checksum, **validators)
+                return
+        update = await analyze_policy_text(item.policy, item.content, item.checksum, item.stored)
+        if update.failed:
+            logger.error("Analysis failed for %s: %s", item.url, update.result['error'])
+            item.signature = None
+            item.set_row('failed_analysis', processing_status='failed_analysis')
+            return
+        item.update = update
+        item.result = result_entry(item.policy['id'], item.checksum, update.result, self.llm_config)
+        item.set_row('analyzed', processing_status='processed', checksum=item.checksum, **validators)
+
+    def _write(self, batch: List[_Item]) -> None:
+        # Results go first, so no policy is stored as processed without one
+        with_results = [item for item in batch if item.result is not None]
+        if with_results and not self._retry(f"Saving {len(with_results)} results",
+                                            PolicyResult.save_many, [item.result for item in with_results]):
+            self.stats.add('write_errors', len(with_results))
+            batch = [item for item in batch if item.result is None]
+        # Rows with the same columns go in one request; a bulk upsert needs uniform keys
+        groups: Dict[Tuple[str, ...], List[_Item]] = {}
+        for item in batch:
+            groups.setdefault(tuple(sorted(item.row)), []).append(item)
+        written = []
+        for items in groups.values():
+            if self._retry(f"Writing {len(items)} policies", Policy.upsert_many,
+                           [item.row for item in items], ignore_duplicates=False):
+                written.extend(items)
+            else:
+                self.stats.add('write_errors', len(items))
+
+        record_updates([item.update for item in written if item.update is not None])
+        try:
+            near_duplicates.add_many([(item.policy['id'], item.checksum, item.signature)
+                                      for item in written if item.signature and item.outcome != 'failed_analysis'])
+        except Exception as e:
+            logger.warning("Failed to index signatures of %s policies: %s", len(written), e)
+        self._settle_domains(written)
+
+        for item in written:
+            self._finish(item, item.outcome, written=True)
+        self.checkpoint.save(self.stats.snapshot())
+
+    def _retry(self, action: str, write: Callable[..., Any], *args: Any, attempts: int = 3, **kwargs: Any) -> bool:
+        for attempt in range(attempts):
+            try:
+                write(*args, **kwargs)
+                return True
+            except Exception as e:
+                logger.error("%s failed (attempt %s/%s): %s", action, attempt + 1, attempts, e)
+                time.sleep(2 ** attempt)
+        # Left open in the checkpoint, so a rerun picks these records up again
+        return False
+
+    def _settle_domains(self, written: List[_Item]) -> None:
+        finished = []
+        with self._domains_lock:
+            for item in written:
+                key = str(item.policy['domain_id'])
+                self._domains_open[key] -= 1
+                if not self._domains_open[key]:
+                    del self._domains_open[key]
+                    finished.append(item.policy['domain_id'])
+        try:
+            Domain.update_many(finished, {'processing_status': 'processed',
+                                          'updated_at': datetime.utcnow().isoformat()})
+        except Exception as e:
+            logger.warning("Failed to update status of %s domains: %s", len(finished), e)
+
+    # Bookkeeping
+
+    def _finish(self, item: _Item, outcome: str, written: bool = False) -> None:
+        self.stats.add(outcome)
+        if written:
+            self.stats.add('written')
+        self.checkpoint.done([item.number])
+
+    def _queue_sizes(self) -> Dict[str, int]:
+        return {stage.name: stage.queue.qsize()
+                for stage in (self.fetch_stage, self.extract_stage, self.analyze_stage, self.writer)}
+
+    def _report_loop(self) -> None:
+        while not self._stopping.wait(self.report_interval):
+            logger.info("Ingest at record %s: %s", self.checkpoint.position, self.stats.report(self._queue_sizes()))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='manage_db.py ingest', description='Bulk-analyze a list of policy URLs.')
+    parser.add_argument('input', help='CSV, JSON Lines or text file of policy URLs (optionally .gz)')
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'txt'], help='input format (default: from extension)')
+    parser.add_argument('--checkpoint', help='checkpoint file (default: <input>.checkpoint.json)')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start from the top')
+    parser.add_argument('--refresh', action='store_true', help='re-fetch policies whose analysis is current')
+    parser.add_argument('--limit', type=int, help='stop after this many records')
+    parser.add_argument('--fetch-workers', type=int, default=32)
+    parser.add_argument('--extract-workers', type=int, default=os.cpu_count() or 1,
+                        help='extraction processes (0 to extract in threads)')
+    parser.add_argument('--analyze-workers', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--flush-interval', type=float, default=5.0)
+    parser.add_argument('--queue-size', type=int, default=1000, help='items buffered between stages')
+    parser.add_argument('--report-interval', type=float, default=30.0)
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    stats = BulkIngest(
+        args.input, fmt=args.format, checkpoint_path=args.checkpoint, restart=args.restart,
+        fetch_workers=args.fetch_workers, extract_workers=args.extract_workers,
+        analyze_workers=args.analyze_workers, batch_size=args.batch_size, flush_interval=args.flush_interval,
+        queue_size=args.queue_size, report_interval=args.report_interval, refresh=args.refresh, limit=args.limit
+    ).run()
+    return 1 if stats['write_errors'] else 0
@@ -0,0 +1,136 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, Hashable, Iterable, Set, Tuple
+
+
+def normalize_content(content: str) -> str:
+    """Collapses whitespace so formatting-only changes don't alter the checksum."""
+    return ' '.join(content.split())
+
+
+def content_checksum(content: str) -> str:
+    """SHA-256 hex digest of the normalized policy content."""
+    return hashlib.sha256(normalize_content(content).encode('utf-8')).hexdigest()
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters for a named cache."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def to_dict(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / total) if total else 0.0
+            }
+
+
+# Policies whose fetched content and LLM configuration are unchanged reuse
+# their stored analysis result instead of calling the model again.
+analysis_cache_stats = CacheStats('analysis')
+
+
+class TTLCache:
+    """
+    Bounded, thread-safe LRU cache whose entries expire after a TTL.
+
+    ``None`` values are cached too (negative caching), with their own
+    shorter TTL. Entries can be tagged, e.g. with the row ID they were
+    built from, so writes can invalidate every entry derived from a row
+    without knowing the keys it was looked up by.
+    """
+
+    def __init__(self, name: str, maxsize: int = 10000, ttl: float = 60.0, negative_ttl: Optional[float] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.stats = CacheStats(name)
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any, Tuple[Hashable, ...]]]' = OrderedDict()
+        self._tags: Dict[Hashable, Set[Hashable]] = {}
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any],
+                    tags: Optional[Callable[[Any], Iterable[Hashable]]] = None) -> Any:
+        """
+        Returns the cached value for ``key``, calling ``loader`` on a miss.
+
+        Args:
+            key: Cache key.
+            loader: Zero-argument function producing the value.
+            tags: Optional function returning the tags for a loaded value.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.stats.hit()
+                    return entry[1]
+                self._remove(key)
+        self.stats.miss()
+        value = loader()
+        self.set(key, value, tags(value) if (tags and value is not None) else ())
+        return value
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[Hashable] = ()) -> None:
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        tags = tuple(tags)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _remove(self, key: Hashable) -> None:
+        # Caller must hold self._lock
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._entries)
+        return {**self.stats.to_dict(), 'size': size, 'maxsize': self.maxsize, 'ttl': self.ttl}
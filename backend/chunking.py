@@ -0,0 +1,85 @@
+import re
+from typing import List
+
+# Rough ratio for English prose; good enough to size prompts without a tokenizer
+CHARS_PER_TOKEN = 4
+
+_NUMBERED_HEADING = re.compile(r'^(?:\d+(?:\.\d+)*|[IVXLC]+|[A-Z])[.)]\s+\S')
+_SECTION_HEADING = re.compile(r'^(?:section|article|part|chapter)\s+[\dIVXLC]+\b', re.IGNORECASE)
+_TERMINAL_PUNCTUATION = ('.', ',', ';', '!', '?')
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def is_heading(line: str) -> bool:
+    """Heuristic for section headings in extracted policy text (one line per block element)."""
+    line = line.strip()
+    if not line or len(line) > 120 or line.endswith(_TERMINAL_PUNCTUATION):
+        return False
+    if _NUMBERED_HEADING.match(line) or _SECTION_HEADING.match(line):
+        return True
+    if line.isupper() and len(line) > 3:
+        return True
+    # Short title-like lines, e.g. "Data We Collect" or "Your Rights:"
+    return line[0].isupper() and len(line.split()) <= 8
+
+
+def split_into_sections(text: str) -> List[str]:
+    """Splits policy text into sections, each starting at a heading line."""
+    sections: List[List[str]] = [[]]
+    for line in text.split('\n'):
+        if is_heading(line) and any(not is_heading(existing) for existing in sections[-1]):
+            sections.append([])
+        sections[-1].append(line)
+    return ['\n'.join(lines) for lines in sections if any(line.strip() for line in lines)]
+
+
+def split_into_chunks(text: str, max_tokens: int) -> List[str]:
+    """
+    Packs policy sections into chunks of at most ``max_tokens`` (estimated).
+
+    Sections are kept whole where possible; a section that is too large on
+    its own is split by lines, and a single oversized line by words.
+    """
+    max_chars = max(1, max_tokens) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return [text] if text else []
+
+    pieces: List[str] = []
+    for section in split_into_sections(text):
+        if len(section) <= max_chars:
+            pieces.append(section)
+            continue
+        for line in section.split('\n'):
+            if len(line) <= max_chars:
+                pieces.append(line)
+            else:
+                pieces.extend(_split_long_line(line, max_chars))
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_len = 0
+    for piece in pieces:
+        if current and current_len + len(piece) + 1 > max_chars:
+            chunks.append('\n'.join(current))
+            current, current_len = [], 0
+        current.append(piece)
+        current_len += len(piece) + 1
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+
+def _split_long_line(line: str, max_chars: int) -> List[str]:
+    parts: List[str] = []
+    while len(line) > max_chars:
+        cut = line.rfind(' ', 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        parts.append(line[:cut])
+        line = line[cut:].lstrip()
+    if line:
+        parts.append(line)
+    return parts
@@ -0,0 +1,154 @@
+import logging
+import re
+from html.parser import HTMLParser
+from typing import Optional, Dict, List, Iterable
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Elements whose content is never policy text. Everything skipped is dropped up
+# to the matching end tag, so only elements whose end tag is required belong here
+# (<head> is not: minifiers drop </head>, and <meta>/<link> inside it are void).
+SKIP_TAGS = {
+    'script', 'style', 'noscript', 'template', 'svg', 'canvas', 'iframe', 'object',
+    'nav', 'header', 'footer', 'aside', 'form', 'button', 'select', 'title'
+}
+SKIP_ROLES = {'navigation', 'banner', 'contentinfo', 'search', 'dialog', 'menu'}
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+# Elements whose end tag may be left implicit; hiding one of these can't be
+# tracked to its end, so it is not skipped
+OPTIONAL_END_TAGS = {
+    'html', 'head', 'body', 'p', 'li', 'dt', 'dd', 'option', 'optgroup', 'rt', 'rp',
+    'caption', 'colgroup', 'thead', 'tbody', 'tfoot', 'tr', 'td', 'th'
+}
+# Elements that start a new line of text
+BLOCK_TAGS = {
+    'p', 'div', 'section', 'article', 'main', 'br', 'hr', 'li', 'ul', 'ol', 'dl', 'dt', 'dd',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'tr', 'td', 'th', 'blockquote', 'pre', 'address'
+}
+# If the page marks up its main content, nothing outside it is used
+MAIN_TAGS = {'main', 'article'}
+# Minimum amount of text inside <main>/<article> for it to be trusted over the whole body
+MIN_MAIN_CHARS = 500
+
+_SPACES = re.compile(r'[ \t\r\f\v\u00a0]+')
+
+
+class ExtractionResult:
+    def __init__(self, text: str, input_chars: int):
+        self.text = text
+        self.input_chars = input_chars
+        self.output_chars = len(text)
+
+    @property
+    def ratio(self) -> float:
+        return (self.output_chars / self.input_chars) if self.input_chars else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {'input_chars': self.input_chars, 'output_chars': self.output_chars, 'ratio': round(self.ratio, 4)}
+
+
+class PolicyTextExtractor(HTMLParser):
+    """
+    Incremental HTML-to-text converter for policy pages.
+
+    Feed HTML in chunks with ``feed()`` and call ``close()`` to get the
+    text. Scripts, styles and navigation/header/footer boilerplate are
+    dropped, block elements become line breaks and runs of whitespace
+    are collapsed.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._parts: List[str] = []
+        self._main_parts: List[str] = []
+        self._skip_tag: Optional[str] = None
+        self._skip_depth = 0
+        self._main_depth = 0
+        self.input_chars = 0
+
+    def feed(self, data: str) -> None:
+        self.input_chars += len(data)
+        super().feed(data)
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_tag:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        attributes = dict(attrs)
+        if tag in SKIP_TAGS or attributes.get('role') in SKIP_ROLES \
+                or 'hidden' in attributes or attributes.get('aria-hidden') == 'true':
+            if tag in VOID_TAGS:
+                return
+            if tag not in OPTIONAL_END_TAGS:
+                self._skip_tag = tag
+                self._skip_depth = 1
+                return
+        if tag in MAIN_TAGS:
+            self._main_depth += 1
+        if tag in BLOCK_TAGS:
+            self._append('\n')
+
+    def handle_startendtag(self, tag, attrs):
+        if not self._skip_tag and tag in BLOCK_TAGS:
+            self._append('\n')
+
+    def handle_endtag(self, tag):
+        if self._skip_tag:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._skip_tag = None
+            return
+        if tag in BLOCK_TAGS:
+            self._append('\n')
+        if tag in MAIN_TAGS and self._main_depth > 0:
+            self._main_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_tag:
+            # Line breaks in source text are layout, not structure
+            self._append(data.replace('\n', ' '))
+
+    def _append(self, text: str) -> None:
+        self._parts.append(text)
+        if self._main_depth > 0:
+            self._main_parts.append(text)
+
+    def get_text(self) -> str:
+        main_text = _collapse_whitespace(self._main_parts)
+        if len(main_text) >= MIN_MAIN_CHARS:
+            return main_text
+        return _collapse_whitespace(self._parts)
+
+
+def _collapse_whitespace(parts: Iterable[str]) -> str:
+    lines = (_SPACES.sub(' ', line).strip() for line in ''.join(parts).split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+def extract_policy_text(content: str, content_type: str = 'text/html',
+                        chunk_size: int = 64 * 1024) -> ExtractionResult:
+    """
+    Turns a fetched policy page into clean text for the LLM prompt.
+
+    Args:
+        content: The fetched page body.
+        content_type: Content-Type of the response; non-HTML bodies only get whitespace collapsed.
+        chunk_size: Size of the pieces fed to the parser.
+
+    Returns:
+        ExtractionResult with the text and input/output sizes.
+    """
+    if content_type and 'html' not in content_type and '<html' not in content[:1024].lower():
+        result = ExtractionResult(_collapse_whitespace([content]), len(content))
+    else:
+        extractor = PolicyTextExtractor()
+        for start in range(0, len(content), chunk_size):
+            extractor.feed(content[start:start + chunk_size])
+        extractor.close()
+        result = ExtractionResult(extractor.get_text(), extractor.input_chars)
+    logger.info("Extracted %s chars of policy text from %s chars of input (%.1f%%)",
+                result.output_chars, result.input_chars, result.ratio * 100)
+    return result
@@ -0,0 +1,289 @@
+import logging
+import os
+import time
+from typing import Optional, Dict, Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+
+from metrics import fetch_seconds, fetch_bytes, fetch_queue_seconds, record_request_timing
+from politeness import HostScheduler, RobotsCache, DNSCache
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli  # noqa: F401  urllib3 decodes 'br' bodies when brotli is installed
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+USER_AGENT = 'PolicyAnalyzerBot/1.0 (+http://example.com/bot)' # Be a good citizen
+DEFAULT_TIMEOUT = 20
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024  # 5MB of decoded body
+ROBOTS_MAX_BYTES = 512 * 1024  # RFC 9309: crawlers may ignore rules past 500KiB
+MAX_CRAWL_DELAY = 30.0
+CHUNK_SIZE = 64 * 1024
+
+
+class FetchResult:
+    def __init__(self, url: str, status_code: int, text: Optional[str] = None,
+                 etag: Optional[str] = None, last_modified: Optional[str] = None,
+                 content_type: str = '', num_bytes: int = 0):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_type = content_type
+        self.num_bytes = num_bytes
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+
+    def validators(self) -> Dict[str, Optional[str]]:
+        """Column values persisted on the policy row for the next conditional request."""
+        return {'http_etag': self.etag, 'http_last_modified': self.last_modified}
+
+
+class _CachedDNSConnection:
+    # Mixed into urllib3's connection classes. Only the address connected to
+    # changes; TLS SNI and certificate checks still use the hostname.
+    dns_cache: DNSCache
+
+    def _new_conn(self):
+        host, port = self._dns_host, self.port
+        try:
+            addresses = self.dns_cache.resolve(host, port)
+        except OSError:
+            return super()._new_conn()  # let urllib3 report the resolution failure
+        error = None
+        try:
+            for _, _, _, _, sockaddr in addresses:
+                self._dns_host = sockaddr[0]
+                try:
+                    return super()._new_conn()
+                except (NewConnectionError, ConnectTimeoutError) as e:
+                    error = e
+        finally:
+            self._dns_host = host
+        # The host may have moved; resolve it again next time
+        self.dns_cache.forget(host, port)
+        raise error
+
+
+class DNSCachingAdapter(HTTPAdapter):
+    """HTTPAdapter whose new connections look hosts up in ``dns_cache`` rather than asking the resolver each time."""
+
+    def __init__(self, dns_cache: DNSCache, **kwargs: Any):
+        self.dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        attrs = {'dns_cache': self.dns_cache}
+        http = type('CachedDNSHTTPConnection', (_CachedDNSConnection, HTTPConnection), attrs)
+        https = type('CachedDNSHTTPSConnection', (_CachedDNSConnection, HTTPSConnection), attrs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': type('CachedDNSHTTPConnectionPool', (HTTPConnectionPool,), {'ConnectionCls': http}),
+            'https': type('CachedDNSHTTPSConnectionPool', (HTTPSConnectionPool,), {'ConnectionCls': https})
+        }
+
+
+class PolicyFetcher:
+    """
+    Long-lived HTTP client for policy pages.
+
+    Connections are pooled per host through a shared requests.Session.
+    Callers pass the ETag/Last-Modified stored for a page to get a cheap
+    304 when it has not changed. Bodies are streamed and abandoned once
+    they exceed ``max_bytes``.
+
+    If a ``scheduler`` is given, every fetch waits for a slot under its
+    per-host and global limits, up to ``queue_timeout`` seconds. If
+    ``robots`` is given, pages disallowed by robots.txt are not fetched,
+    and a site's Crawl-delay (capped at MAX_CRAWL_DELAY) raises its
+    per-host delay. If a ``dns_cache`` is given, new connections resolve
+    hosts through it.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, max_bytes: int = DEFAULT_MAX_BYTES,
+                 pool_connections: int = 20, pool_maxsize: int = 20,
+                 scheduler: Optional[HostScheduler] = None, queue_timeout: Optional[float] = None,
+                 respect_robots: bool = True, robots_ttl: float = 3600,
+                 dns_cache: Optional[DNSCache] = None):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.scheduler = scheduler
+        self.queue_timeout = queue_timeout
+        self.robots = RobotsCache(self._fetch_robots, USER_AGENT, ttl=robots_ttl) if respect_robots else None
+        self.session = requests.Session()
+        if dns_cache is not None:
+            adapter = DNSCachingAdapter(dns_cache, pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        else:
+            adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'User-Agent': USER_AGENT,
+            'Accept': 'text/html,application/xhtml+xml,text/plain;q=0.9,*/*;q=0.5',
+            'Accept-Encoding': ACCEPT_ENCODING
+        })
+
+    def fetch(self, url: str, etag: Optional[str] = None,
+              last_modified: Optional[str] = None) -> Optional[FetchResult]:
+        """
+        Fetches a policy page, conditionally if validators are given.
+
+        Args:
+            url: The URL to fetch.
+            etag: ETag returned by the previous fetch of this URL.
+            last_modified: Last-Modified returned by the previous fetch of this URL.
+
+        Returns:
+            A FetchResult (status 304 with no text when unchanged), or None if fetching fails.
+        """
+        if self.robots is not None and not self.robots.allowed(url):
+            logger.warning("Fetching %s is disallowed by robots.txt", url)
+            fetch_seconds.observe(0.0, outcome='disallowed')
+            return None
+        host = urlsplit(url).hostname or ''
+        crawl_delay = self.robots.crawl_delay(url) if self.robots is not None else None
+
+        start = time.perf_counter()
+        if self.scheduler is None:
+            result = self._fetch(url, etag, last_modified)
+        else:
+            with self.scheduler.slot(host, delay=min(crawl_delay or 0.0, MAX_CRAWL_DELAY),
+                                     timeout=self.queue_timeout) as slot:
+                fetch_queue_seconds.observe(time.perf_counter() - start)
+                if not slot.acquired:
+                    logger.error("Timed out waiting for a fetch slot for %s", url)
+                    fetch_seconds.observe(time.perf_counter() - start, outcome='queue_timeout')
+                    return None
+                result = self._fetch(url, etag, last_modified)
+        elapsed = time.perf_counter() - start
+        if result is None:
+            outcome = 'error'
+        else:
+            outcome = 'not_modified' if result.not_modified else 'ok'
+            fetch_bytes.inc(result.num_bytes)
+        fetch_seconds.observe(elapsed, outcome=outcome)
+        record_request_timing('fetch', elapsed)
+        return result
+
+    def _fetch(self, url: str, etag: Optional[str], last_modified: Optional[str]) -> Optional[FetchResult]:
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        try:
+            with self.session.get(url, timeout=self.timeout, headers=headers,
+                                  allow_redirects=True, stream=True) as response:
+                if response.status_code == 304:
+                    logger.info("Policy content not modified since last fetch: %s", url)
+                    return FetchResult(url, 304, etag=response.headers.get('ETag', etag),
+                                       last_modified=response.headers.get('Last-Modified', last_modified))
+                response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+
+                # Basic check for HTML content type
+                content_type = response.headers.get('Content-Type', '').lower()
+                if 'html' not in content_type and 'text' not in content_type:
+                    logger.warning("Unexpected content type '%s' for URL: %s", content_type, url)
+
+                body = self._read_body(response)
+                if body is None:
+                    logger.error("Policy content from %s exceeds %s bytes; aborting fetch", url, self.max_bytes)
+                    return None
+
+                encoding = response.encoding or response.apparent_encoding or 'utf-8'
+                logger.info("Successfully fetched %s bytes from %s", len(body), url)
+                return FetchResult(
+                    url,
+                    response.status_code,
+                    text=body.decode(encoding, errors='replace'),
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                    content_type=content_type,
+                    num_bytes=len(body)
+                )
+        except requests.exceptions.Timeout:
+            logger.error("Timeout error fetching policy content from %s", url)
+            return None
+        except requests.exceptions.RequestException as e:
+            logger.exception("Request error fetching policy content from %s: %s", url, e)
+            return None
+        except Exception as e:
+            logger.exception("Unexpected error fetching policy content from %s: %s", url, e)
+            return None
+
+    def _fetch_robots(self, robots_url: str):
+        with self.session.get(robots_url, timeout=self.timeout, stream=True) as response:
+            if response.status_code >= 400:
+                return response.status_code, ''
+            body = b''
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                body += chunk
+                if len(body) >= ROBOTS_MAX_BYTES:
+                    break
+            return response.status_code, body[:ROBOTS_MAX_BYTES].decode(response.encoding or 'utf-8', errors='replace')
+
+    def _read_body(self, response: requests.Response) -> Optional[bytes]:
+        declared_length = response.headers.get('Content-Length')
+        if declared_length and declared_length.isdigit() and int(declared_length) > self.max_bytes \
+                and not response.headers.get('Content-Encoding'):
+            return None
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            size += len(chunk)
+            if size > self.max_bytes:
+                return None
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def dns_cache_from_env() -> Optional[DNSCache]:
+    """The fetcher DNS cache configured by FETCH_DNS_CACHE_TTL (seconds; 0 disables it)."""
+    ttl = float(os.getenv('FETCH_DNS_CACHE_TTL', 60))
+    return DNSCache(ttl=ttl) if ttl > 0 else None
+
+
+policy_fetcher = PolicyFetcher(
+    timeout=float(os.getenv('FETCH_TIMEOUT', DEFAULT_TIMEOUT)),
+    max_bytes=int(os.getenv('FETCH_MAX_BYTES', DEFAULT_MAX_BYTES)),
+    pool_maxsize=int(os.getenv('FETCH_POOL_SIZE', 20)),
+    scheduler=HostScheduler(
+        max_connections=int(os.getenv('FETCH_MAX_CONNECTIONS', 32)),
+        max_per_host=int(os.getenv('FETCH_MAX_PER_HOST', 2)),
+        delay=float(os.getenv('FETCH_HOST_DELAY', 1.0))
+    ),
+    queue_timeout=float(os.getenv('FETCH_QUEUE_TIMEOUT', 120)),
+    respect_robots=os.getenv('FETCH_RESPECT_ROBOTS', 'true').lower() in ['true', '1', 't'],
+    robots_ttl=float(os.getenv('ROBOTS_CACHE_TTL', 3600)),
+    dns_cache=dns_cache_from_env()
+)
+
+
+def fetch_policy_content(url: str) -> Optional[str]:
+    """
+    Fetches the text content of a given URL.
+
+    Args:
+        url: The URL to fetch content from.
+
+    Returns:
+        The text content of the page, or None if fetching fails.
+    """
+    result = policy_fetcher.fetch(url)
+    return result.text if result else None
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any, Callable, Awaitable
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the pending queue is at capacity or shutting down."""
+
+
+class Job:
+    def __init__(self, payload: Dict[str, Any], dedupe_key: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.dedupe_key = dedupe_key
+        self.status = JOB_QUEUED
+        self.stage: Optional[str] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow().isoformat()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self._done = threading.Event()
+
+    def set_stage(self, stage: str) -> None:
+        logger.info("Job %s entering stage '%s'", self.id, stage)
+        self.stage = stage
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_COMPLETED, JOB_FAILED)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the job has finished; returns False on timeout."""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'payload': self.payload,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobQueue:
+    """
+    Runs an async job handler on a pool of worker threads.
+
+    Each worker owns its own event loop, so handlers may await coroutines
+    (e.g. the Gemini client) while blocking calls only hold up that worker.
+    Finished jobs are kept in memory for status lookups, bounded by
+    ``max_retained_jobs``.
+    """
+
+    def __init__(self, handler: Callable[[Job], Awaitable[Any]], num_workers: int = 4,
+                 max_queue_size: int = 1000, max_retained_jobs: int = 10000, name: str = 'job-worker'):
+        self.handler = handler
+        self.num_workers = max(1, num_workers)
+        self.max_retained_jobs = max_retained_jobs
+        self.name = name
+        self._queue: 'queue.Queue[Optional[Job]]' = queue.Queue(maxsize=max_queue_size)
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._active: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._workers = []
+        self._running = False
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        """True once close() or stop() has been called; no further jobs are accepted."""
+        return self._closed
+
+    def start(self) -> None:
+        with self._lock:
+            if self._running or self._closed:
+                return
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f"{self.name}-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+            self._running = True
+        logger.info("Started %s '%s' workers", self.num_workers, self.name)
+
+    def close(self) -> None:
+        """Stops accepting jobs; queued and running jobs carry on until stop()."""
+        with self._lock:
+            self._closed = True
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops accepting jobs and drains the queue.
+
+        Jobs already queued or running are finished first. ``timeout`` bounds
+        the whole drain; workers still busy after it are left to die with
+        the process.
+        """
+        with self._lock:
+            self._closed = True
+            if not self._running:
+                return
+            self._running = False
+            workers, self._workers = self._workers, []
+        logger.info("Draining '%s': %s queued, %s running", self.name, self.pending_count(), self.in_flight_count())
+        for _ in workers:
+            self._queue.put(None)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in workers:
+            worker.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        busy = sum(1 for worker in workers if worker.is_alive())
+        if busy:
+            logger.warning("Stopped '%s' with %s workers still busy after %ss", self.name, busy, timeout)
+        else:
+            logger.info("Stopped '%s' workers", self.name)
+
+    def submit(self, dedupe_key: Optional[str] = None, **payload: Any) -> Job:
+        """
+        Queues a job for the workers.
+
+        Args:
+            dedupe_key: If a job with the same key is still queued or running,
+                that job is returned instead of queueing a new one.
+            **payload: Job parameters, available to the handler as ``job.payload``.
+        """
+        if self._closed:
+            raise QueueFullError(f"Job queue '{self.name}' is shutting down")
+        self.start()
+        job = Job(payload, dedupe_key)
+        with self._lock:
+            if dedupe_key is not None:
+                active = self._active.get(dedupe_key)
+                if active is not None:
+                    logger.info("Reusing in-flight job %s for '%s'", active.id, dedupe_key)
+                    return active
+                self._active[dedupe_key] = job
+            self._jobs[job.id] = job
+            self._evict_finished()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+                if dedupe_key is not None:
+                    self._active.pop(dedupe_key, None)
+            logger.warning("Job queue '%s' is full; rejecting job", self.name)
+            raise QueueFullError(f"Job queue '{self.name}' is full")
+        logger.info("Queued job %s", job.id)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending_count(self) -> int:
+        return self._queue.qsize()
+
+    def in_flight_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == JOB_RUNNING)
+
+    def _evict_finished(self) -> None:
+        # Caller must hold self._lock
+        overflow = len(self._jobs) - self.max_retained_jobs
+        if overflow <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished][:overflow]:
+            del self._jobs[job_id]
+
+    def _worker_loop(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            while True:
+                job = self._queue.get()
+                try:
+                    if job is None:
+                        return
+                    self._run_job(loop, job)
+                finally:
+                    self._queue.task_done()
+        finally:
+            loop.close()
+
+    def _run_job(self, loop: asyncio.AbstractEventLoop, job: Job) -> None:
+        job.status = JOB_RUNNING
+        job.started_at = datetime.utcnow().isoformat()
+        try:
+            job.result = loop.run_until_complete(self.handler(job))
+            job.status = JOB_COMPLETED
+            logger.info("Job %s completed", job.id)
+        except Exception as e:
+            job.error = str(e)
+            job.status = JOB_FAILED
+            logger.exception("Job %s failed: %s", job.id, e)
+        finally:
+            job.finished_at = datetime.utcnow().isoformat()
+            if job.dedupe_key is not None:
+                with self._lock:
+                    if self._active.get(job.dedupe_key) is job:
+                        del self._active[job.dedupe_key]
+            job._done.set()
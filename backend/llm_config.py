@@ -1,16 +1,11 @@
 import os
 from dotenv import load_dotenv
 
+from analysis_schema import RESPONSE_SCHEMA_DESCRIPTION
+
 load_dotenv()
 
-LLM_CONFIGS = {
-    'gemini-1.5': {
-        'name': 'Gemini 1.5',
-        'api_key': os.getenv('GEMINI_API_KEY'),
-        'model': 'gemini-1.5-pro',
-        'max_tokens': 4096,
-        'temperature': 0.7,
-        'default_prompt': """
+DEFAULT_PROMPT = """
             Analyze this privacy policy and extract the following information:
             1. Data Collection Practices
             2. Data Sharing Policies
@@ -20,14 +15,73 @@ LLM_CONFIGS = {
             
             Provide a clear, structured response highlighting key points and potential concerns.
         """.strip()
+
+# JSON-mode prompt; the response is validated against analysis_schema
+STRUCTURED_PROMPT = f"""
+{DEFAULT_PROMPT}
+
+Respond with a single JSON object only, no markdown, matching this schema:
+{RESPONSE_SCHEMA_DESCRIPTION}
+List concerns from most to least severe.
+""".strip()
+
+LLM_CONFIGS = {
+    'gemini-1.5': {
+        'name': 'Gemini 1.5',
+        'provider': 'gemini',
+        'api_key': os.getenv('GEMINI_API_KEY'),
+        'model': 'gemini-1.5-pro',
+        'max_tokens': 4096,
+        'temperature': 0.7,
+        'chunk_tokens': 24000,  # Policies longer than this are analyzed in parallel chunks
+        'max_concurrent_chunks': 4,
+        # Limits shared by all analyses in a process; match these to the API quota
+        'max_concurrency': int(os.getenv('GEMINI_MAX_CONCURRENCY', 8)),
+        'requests_per_minute': int(os.getenv('GEMINI_REQUESTS_PER_MINUTE', 60)),
+        'tokens_per_minute': int(os.getenv('GEMINI_TOKENS_PER_MINUTE', 1000000)),
+        'max_retries': 4,
+        'retry_base_delay': 2.0,
+        'request_timeout': 120,
+        'structured_output': True,
+        'max_parse_retries': 1,
+        'default_prompt': STRUCTURED_PROMPT
+    },
+    # Deterministic local backend for load tests and offline runs (no API calls)
+    'stub': {
+        'name': 'Local Stub',
+        'provider': 'stub',
+        'api_key': None,
+        'model': 'stub-deterministic',
+        'max_tokens': 4096,
+        'temperature': 0.0,
+        'chunk_tokens': 24000,
+        'max_concurrent_chunks': 4,
+        'max_concurrency': int(os.getenv('STUB_LLM_MAX_CONCURRENCY', 64)),
+        'requests_per_minute': 0,  # 0 disables rate limiting
+        'tokens_per_minute': 0,
+        'max_retries': 2,
+        'retry_base_delay': 0.05,
+        'request_timeout': 30,
+        'latency_seconds': float(os.getenv('STUB_LLM_LATENCY', 0.5)),
+        'latency_jitter': float(os.getenv('STUB_LLM_LATENCY_JITTER', 0.1)),
+        'error_rate': float(os.getenv('STUB_LLM_ERROR_RATE', 0.0)),
+        'seed': int(os.getenv('STUB_LLM_SEED', 0)),
+        'structured_output': True,
+        'max_parse_retries': 1,
+        'default_prompt': STRUCTURED_PROMPT
     },
     # Add more LLM configurations here as needed
 }
 
-DEFAULT_LLM = 'gemini-1.5'
+# Select the backend for the whole service, e.g. LLM_NAME=stub for offline runs
+DEFAULT_LLM = os.getenv('LLM_NAME', 'gemini-1.5')
 
 def get_llm_config(llm_name=None):
     """Get configuration for specified LLM or default if none specified"""
     if not llm_name:
         llm_name = DEFAULT_LLM
-    return LLM_CONFIGS.get(llm_name)
\ No newline at end of file
+    return LLM_CONFIGS.get(llm_name)
+
+def describe_llm(config):
+    """Identifier stored in policy_results.llm_details for results produced by this config"""
+    return f"{config['name']} ({config['model']})"
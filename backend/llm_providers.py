@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+from typing import Dict, Any, Type
+
+from analysis_schema import CATEGORIES
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class TransientLLMError(Exception):
+    """Provider error worth retrying (quota exhausted, 5xx, timeouts)."""
+
+
+class LLMProvider:
+    """
+    Interface between the analysis pipeline and a model backend.
+
+    Providers only turn a prompt into response text; concurrency limits,
+    rate limiting and retries are applied around them by analysis.LLMClient.
+    Errors that should be retried are raised as TransientLLMError.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+
+    async def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through google-generativeai."""
+
+    _configure_lock = threading.Lock()
+    _configured_api_key = None
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        import google.generativeai as genai
+        from google.api_core import exceptions as google_exceptions
+
+        self._genai = genai
+        self._retryable = (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.TooManyRequests,
+            google_exceptions.InternalServerError,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded
+        )
+        # genai.configure is process-wide; only redo it when the key changes
+        with GeminiProvider._configure_lock:
+            if GeminiProvider._configured_api_key != config['api_key']:
+                genai.configure(api_key=config['api_key'])
+                GeminiProvider._configured_api_key = config['api_key']
+        self._local = threading.local()
+
+    def _model(self):
+        # One model per worker thread: its async gRPC channel is bound to the
+        # event loop it was first used on
+        model = getattr(self._local, 'model', None)
+        if model is None:
+            generation_config = {
+                'max_output_tokens': self.config['max_tokens'],
+                'temperature': self.config['temperature']
+            }
+            if self.config.get('structured_output'):
+                generation_config['response_mime_type'] = 'application/json'
+            model = self._genai.GenerativeModel(self.config['model'], generation_config=generation_config)
+            self._local.model = model
+        return model
+
+    async def generate(self, prompt: str) -> str:
+        try:
+            response = await self._model().generate_content_async(prompt)
+        except self._retryable as e:
+            raise TransientLLMError(f"{type(e).__name__}: {e}") from e
+        return response.text
+
+
+# Keywords the stub looks for to fill in each analysis category
+_STUB_CATEGORIES = [
+    ('Data Collection Practices', ('collect', 'personal information', 'personal data', 'cookies')),
+    ('Data Sharing Policies', ('share', 'third part', 'disclose', 'sell')),
+    ('User Rights', ('right to', 'access', 'delete', 'opt out', 'opt-out')),
+    ('Security Measures', ('security', 'encrypt', 'safeguard', 'protect')),
+    ('Contact Information', ('contact', 'email', '@', 'address'))
+]
+_STUB_CONCERNS = [
+    (('sell',), 'The policy mentions selling personal information.'),
+    (('third part',), 'Personal data may be shared with third parties.'),
+    (('indefinitely', 'as long as necessary'), 'Retention period is open-ended.'),
+    (('change this policy', 'update this policy', 'modify this policy'), 'The policy can change without explicit consent.')
+]
+
+
+class StubProvider(LLMProvider):
+    """
+    Local, deterministic stand-in for a real model, for load tests and offline runs.
+
+    The response depends only on the prompt. Latency and the failure rate
+    are configurable (``latency_seconds``, ``latency_jitter``,
+    ``error_rate``). Their random draws come from a generator seeded with
+    ``seed``, so a run can be repeated exactly.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.latency = float(config.get('latency_seconds', 0.0))
+        self.jitter = float(config.get('latency_jitter', 0.0))
+        self.error_rate = float(config.get('error_rate', 0.0))
+        self._random = random.Random(config.get('seed', 0))
+        self._lock = threading.Lock()
+
+    async def generate(self, prompt: str) -> str:
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            fail = self._random.random() < self.error_rate
+        if delay:
+            await asyncio.sleep(delay)
+        if fail:
+            raise TransientLLMError('Stub provider simulated a transient failure')
+        return self.render(prompt)
+
+    def render(self, prompt: str) -> str:
+        content = prompt.split('Policy Content:', 1)[-1]
+        lowered = content.lower()
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:12]
+        words = len(re.findall(r'\w+', content))
+
+        key_points = []
+        for category, keywords in _STUB_CATEGORIES:
+            found = [keyword for keyword in keywords if keyword in lowered]
+            detail = f"mentions {', '.join(found)}" if found else 'not described'
+            key_points.append(f"{category}: {detail}")
+        concerns = [concern for keywords, concern in _STUB_CONCERNS if any(k in lowered for k in keywords)]
+
+        summary = f"Stub analysis of a {words}-word policy (content digest {digest})."
+        if self.config.get('structured_output'):
+            return json.dumps({
+                'summary': summary,
+                'categories': {
+                    key: {'summary': point, 'keyPoints': [point]}
+                    for key, point in zip(CATEGORIES, key_points)
+                },
+                'keyPoints': key_points,
+                'concerns': [
+                    {'concern': concern, 'severity': 'high' if 'sell' in concern else 'medium'}
+                    for concern in concerns
+                ]
+            })
+        return '\n\n'.join([summary, '\n'.join(key_points), '\n'.join(concerns or ['No notable concerns found.'])])
+
+
+PROVIDERS: Dict[str, Type[LLMProvider]] = {
+    'gemini': GeminiProvider,
+    'stub': StubProvider
+}
+
+
+def register_provider(name: str, provider_class: Type[LLMProvider]) -> None:
+    """Makes a provider selectable through the 'provider' key of an LLM_CONFIGS entry."""
+    PROVIDERS[name] = provider_class
+
+
+def create_provider(config: Dict[str, Any]) -> LLMProvider:
+    provider_name = config.get('provider', 'gemini')
+    provider_class = PROVIDERS.get(provider_name)
+    if provider_class is None:
+        raise ValueError(f"Unknown LLM provider '{provider_name}' for {config.get('name')}")
+    logger.info("Creating '%s' provider for %s", provider_name, config.get('name'))
+    return provider_class(config)
@@ -0,0 +1,172 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
+
+# Standard LogRecord attributes; anything else on a record came from ``extra=``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional['NonBlockingQueueHandler'] = None
+_setup_lock = threading.Lock()
+# Renders tracebacks on the calling thread (see NonBlockingQueueHandler.prepare)
+_exception_formatter = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any ``extra=`` fields included as keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'thread': record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text or record.exc_info:
+            entry['exception'] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes only a fraction of INFO and DEBUG records.
+
+    Warnings and errors always pass. A record logged with
+    ``extra={'sample': False}`` is never dropped.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0 or record.levelno >= logging.WARNING or not getattr(record, 'sample', True):
+            return True
+        return random.random() < self.rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread, leaving the final formatting to it.
+
+    Like the stdlib QueueHandler, prepare() runs on the thread that logged
+    the record: it merges the message with its args and renders the
+    traceback there, so the queued record no longer refers to objects the
+    caller may change or that only exist during the except block. Keep it
+    that way; deferring this to the listener logs values as they are later,
+    not as they were. Only the configured formatter (layout, JSON encoding)
+    runs on the listener. Records are dropped and counted, rather than
+    blocking the caller, when the queue is full.
+    """
+
+    def __init__(self, log_queue: 'queue.Queue'):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)  # other handlers may still see the original
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level: Optional[str] = None, log_format: Optional[str] = None,
+                  log_dir: Optional[str] = None) -> None:
+    """
+    Routes all logging through a queue drained by a background listener thread.
+
+    Request threads only merge each message with its args (and render any
+    traceback) before appending the record to the queue. Formatting, file
+    rotation and console output happen on the listener thread, so log I/O
+    doesn't add to request latency. Safe to call more than once; only the
+    first call configures logging.
+
+    Args:
+        level: Root log level (env LOG_LEVEL, default INFO).
+        log_format: 'text' or 'json' (env LOG_FORMAT, default text).
+        log_dir: Directory of the rotating log file (env LOG_DIR, default 'logs').
+
+    Other settings come from the environment: LOG_SAMPLE_RATE keeps that
+    fraction of INFO/DEBUG lines (default 1.0), and LOG_QUEUE_SIZE bounds
+    the queue (default 10000). Records that arrive while the queue is full
+    are dropped (see dropped_records).
+    """
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        level = level or os.getenv('LOG_LEVEL', 'INFO')
+        log_format = log_format or os.getenv('LOG_FORMAT', 'text')
+        log_dir = log_dir or os.getenv('LOG_DIR', 'logs')
+        os.makedirs(log_dir, exist_ok=True)
+
+        formatter = JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT)
+
+        # File handler with rotation
+        file_handler = RotatingFileHandler(
+            os.path.join(log_dir, 'policy_analyzer.log'),
+            maxBytes=10485760,  # 10MB
+            backupCount=5
+        )
+        file_handler.setFormatter(formatter)
+
+        # Console handler
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', 10000)))
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(float(os.getenv('LOG_SAMPLE_RATE', 1.0))))
+
+        root_logger = logging.getLogger()
+        root_logger.setLevel(level)
+        for handler in list(root_logger.handlers):
+            root_logger.removeHandler(handler)
+        root_logger.addHandler(queue_handler)
+
+        _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        _listener.start()
+        _queue_handler = queue_handler
+        atexit.register(stop_logging)
+
+
+def dropped_records() -> int:
+    """Number of records discarded because the log queue was full."""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def stop_logging() -> None:
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    with _setup_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
@@ -31,7 +31,7 @@ def reset_development_db():
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python manage_db.py [migrate|reset]")
+        print("Usage: python manage_db.py [migrate|reset|ingest <file> [options]]")
         sys.exit(1)
 
     command = sys.argv[1]
@@ -42,5 +42,9 @@ if __name__ == "__main__":
             run_migration(migration)
     elif command == 'reset':
         reset_development_db()
+    elif command == 'ingest':
+        # Bulk fetch + analysis of a URL list; see bulk_ingest.py or `ingest --help` for options
+        from bulk_ingest import main as ingest_main
+        sys.exit(ingest_main(sys.argv[2:]))
     else:
         print(f"Unknown command: {command}")
\ No newline at end of file
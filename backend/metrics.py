@@ -0,0 +1,273 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Callable, Iterator, List, Tuple
+
+# Latency buckets in seconds, from cache hits up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Per-request breakdown of where time went, keyed by timing group (see begin_request_timings)
+_request_timings: contextvars.ContextVar = contextvars.ContextVar('request_timings', default=None)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metric:
+    """Base class for a named, optionally labelled metric in a Registry."""
+
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """Gauge whose value is either set directly or read from a callback at scrape time."""
+
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self) -> Iterator[str]:
+        if self.callback is not None:
+            yield f"{self.name} {_format_value(self.callback())}"
+            return
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    """Cumulative histogram with fixed bucket bounds, as Prometheus expects."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+registry = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def counter(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+          callback: Optional[Callable[[], float]] = None) -> Gauge:
+    return registry.register(Gauge(name, documentation, labelnames, callback))
+
+
+def histogram(name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+              buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Hot-path metrics shared by the modules that record them
+http_request_seconds = histogram('policy_http_request_seconds', 'HTTP request latency by endpoint',
+                                 ('method', 'endpoint', 'status'))
+db_call_seconds = histogram('policy_db_call_seconds', 'Latency of Domain/Policy model calls',
+                            ('model', 'operation'))
+db_call_errors = counter('policy_db_call_errors_total', 'Domain/Policy model calls that raised',
+                         ('model', 'operation'))
+fetch_seconds = histogram('policy_fetch_seconds', 'Policy page fetch latency', ('outcome',))
+fetch_bytes = counter('policy_fetch_bytes_total', 'Policy page bytes downloaded')
+fetch_queue_seconds = histogram('policy_fetch_queue_seconds', 'Time spent waiting for a per-host fetch slot')
+extraction_seconds = histogram('policy_extraction_seconds', 'HTML to text extraction latency')
+content_chars = counter('policy_content_chars_total', 'Characters of extracted policy text', ('stage',))
+pipeline_stage_seconds = histogram('policy_pipeline_stage_seconds', 'Time spent in each analysis pipeline stage',
+                                   ('stage',))
+analysis_seconds = histogram('policy_analysis_seconds', 'perform_analysis latency, all chunks included',
+                             ('outcome',))
+llm_call_seconds = histogram('policy_llm_call_seconds', 'Latency of individual LLM calls', ('llm', 'outcome'))
+llm_prompt_tokens = counter('policy_llm_prompt_tokens_total', 'Estimated prompt tokens sent to the LLM', ('llm',))
+llm_retries = counter('policy_llm_retries_total', 'LLM calls retried after a transient error', ('llm',))
+parse_seconds = histogram('policy_llm_parse_seconds', 'Time to parse an LLM response', ('parser',),
+                          buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5))
+
+
+@contextmanager
+def timer(histogram_metric: Histogram, group: Optional[str] = None, **labels) -> Iterator[None]:
+    """
+    Observes the duration of the block in ``histogram_metric``.
+
+    If ``group`` is given and the block runs inside begin_request_timings(), the
+    duration is also added to that request's Server-Timing breakdown.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram_metric.observe(elapsed, **labels)
+        if group:
+            record_request_timing(group, elapsed)
+
+
+def timed(histogram_metric: Histogram, group: Optional[str] = None,
+          errors: Optional[Counter] = None, **labels) -> Callable:
+    """Decorator form of timer() for plain and async functions; optionally counts exceptions in ``errors``."""
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timer(histogram_metric, group, **labels):
+                    try:
+                        return await func(*args, **kwargs)
+                    except Exception:
+                        if errors is not None:
+                            errors.inc(**labels)
+                        raise
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(histogram_metric, group, **labels):
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    if errors is not None:
+                        errors.inc(**labels)
+                    raise
+        return wrapper
+    return decorator
+
+
+def begin_request_timings() -> Tuple[contextvars.Token, Dict[str, List[float]]]:
+    """
+    Starts collecting timer() groups for the current request as {group: [total, count]}.
+
+    Returns the token to pass to end_request_timings() and the dict being filled.
+    """
+    timings: Dict[str, List[float]] = {}
+    return _request_timings.set(timings), timings
+
+
+def end_request_timings(token: contextvars.Token) -> None:
+    _request_timings.reset(token)
+
+
+def record_request_timing(group: str, elapsed: float) -> None:
+    timings = _request_timings.get()
+    if timings is not None:
+        entry = timings.setdefault(group, [0.0, 0])
+        entry[0] += elapsed
+        entry[1] += 1
+
+
+def server_timing_header(timings: Dict[str, List[float]], total: float) -> str:
+    """Formats a request's timings as a Server-Timing header value (durations in milliseconds)."""
+    parts = [f'{group};dur={elapsed * 1000:.2f};desc="{count} calls"'
+             for group, (elapsed, count) in timings.items()]
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
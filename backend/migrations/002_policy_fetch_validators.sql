@@ -0,0 +1,9 @@
+-- Store HTTP validators from the last policy fetch so refreshes can be conditional
+alter table policies add column if not exists http_etag text;
+alter table policies add column if not exists http_last_modified text;
+
+-- Down migration (for rollback)
+/*
+alter table policies drop column if exists http_etag;
+alter table policies drop column if exists http_last_modified;
+*/
@@ -0,0 +1,44 @@
+-- One policy row per page_url so saves can be bulk upserts keyed on the URL
+delete from policies a
+  using policies b
+  where a.page_url = b.page_url and a.id > b.id;
+
+do $$
+begin
+  if not exists (select 1 from pg_constraint where conname = 'policies_page_url_key') then
+    alter table policies
+      add constraint policies_page_url_key unique (page_url);
+  end if;
+end $$;
+
+-- Keep domains.policy_count in sync on the database side instead of
+-- recounting every policy row after each save
+create or replace function update_domain_policy_count() returns trigger as $$
+begin
+  if (tg_op = 'INSERT') then
+    update domains set policy_count = policy_count + 1 where id = new.domain_id;
+  elsif (tg_op = 'DELETE') then
+    update domains set policy_count = greatest(policy_count - 1, 0) where id = old.domain_id;
+  elsif (tg_op = 'UPDATE' and new.domain_id is distinct from old.domain_id) then
+    update domains set policy_count = greatest(policy_count - 1, 0) where id = old.domain_id;
+    update domains set policy_count = policy_count + 1 where id = new.domain_id;
+  end if;
+  return null;
+end;
+$$ language plpgsql;
+
+drop trigger if exists policies_domain_policy_count on policies;
+create trigger policies_domain_policy_count
+  after insert or delete or update of domain_id on policies
+  for each row execute function update_domain_policy_count();
+
+-- Backfill counts for existing domains
+update domains d
+  set policy_count = (select count(*) from policies p where p.domain_id = d.id);
+
+-- Down migration (for rollback)
+/*
+drop trigger if exists policies_domain_policy_count on policies;
+drop function if exists update_domain_policy_count();
+alter table policies drop constraint if exists policies_page_url_key;
+*/
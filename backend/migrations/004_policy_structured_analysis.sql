@@ -0,0 +1,7 @@
+-- Typed analysis result (see analysis_schema.py), so readers don't re-parse processing_output text
+alter table policies add column if not exists analysis jsonb;
+
+-- Down migration (for rollback)
+/*
+alter table policies drop column if exists analysis;
+*/
@@ -0,0 +1,14 @@
+-- Keyset pagination for /domains and /policies: each filter is served by an
+-- index on (filter column, id) so a page is a range scan at any depth
+create index if not exists idx_domains_status_id on domains(processing_status, id);
+create index if not exists idx_policies_domain_id_id on policies(domain_id, id);
+create index if not exists idx_policies_status_id on policies(processing_status, id);
+create index if not exists idx_policies_type_id on policies(policy_type, id);
+
+-- Down migration (for rollback)
+/*
+drop index if exists idx_domains_status_id;
+drop index if exists idx_policies_domain_id_id;
+drop index if exists idx_policies_status_id;
+drop index if exists idx_policies_type_id;
+*/
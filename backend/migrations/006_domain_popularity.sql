@@ -0,0 +1,19 @@
+-- Recent visits per domain, used to prioritize background re-crawls
+create index if not exists idx_user_history_domain_visited on user_history(domain_id, visited_at);
+-- Re-crawl scheduler picks pending/stale policies oldest first
+create index if not exists idx_policies_status_updated on policies(processing_status, last_updated_at);
+
+create or replace view domain_popularity as
+select domain_id,
+       count(*) as visits,
+       max(visited_at) as last_visited_at
+from user_history
+where visited_at > timezone('utc'::text, now()) - interval '30 days'
+group by domain_id;
+
+-- Down migration (for rollback)
+/*
+drop view if exists domain_popularity;
+drop index if exists idx_policies_status_updated;
+drop index if exists idx_user_history_domain_visited;
+*/
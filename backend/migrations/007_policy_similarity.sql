@@ -0,0 +1,24 @@
+-- MinHash signature of each analyzed policy's extracted text (see similarity.py)
+create table if not exists policy_signatures (
+    policy_id bigint primary key references policies(id) on delete cascade,
+    checksum text not null,
+    signature bigint[] not null,
+    updated_at timestamp with time zone default timezone('utc'::text, now())
+);
+
+-- LSH band buckets: policies sharing a bucket are near-duplicate candidates
+create table if not exists policy_lsh_buckets (
+    bucket bigint not null,
+    policy_id bigint not null references policies(id) on delete cascade,
+    primary key (bucket, policy_id)
+);
+create index if not exists idx_policy_lsh_buckets_policy on policy_lsh_buckets(policy_id);
+
+alter table policy_signatures enable row level security;
+alter table policy_lsh_buckets enable row level security;
+
+-- Down migration (for rollback)
+/*
+drop table if exists policy_lsh_buckets;
+drop table if exists policy_signatures;
+*/
@@ -0,0 +1,38 @@
+-- Section-segmented text of each analyzed policy version, with the analysis of
+-- each part keyed by the sections it covers (see snapshots.py)
+create table if not exists policy_snapshots (
+    id bigint primary key generated always as identity,
+    policy_id bigint not null references policies(id) on delete cascade,
+    checksum text not null,
+    sections jsonb not null,
+    parts jsonb not null,
+    changed_chars_since_full integer not null default 0,
+    created_at timestamp with time zone default timezone('utc'::text, now())
+);
+create index if not exists idx_policy_snapshots_policy on policy_snapshots(policy_id, id);
+
+-- What changed between two analyzed versions of a policy
+create table if not exists policy_changes (
+    id bigint primary key generated always as identity,
+    policy_id bigint not null references policies(id) on delete cascade,
+    from_checksum text,
+    to_checksum text not null,
+    mode text not null check (mode in ('full', 'incremental')),
+    added jsonb not null default '[]'::jsonb,
+    modified jsonb not null default '[]'::jsonb,
+    removed jsonb not null default '[]'::jsonb,
+    changed_chars integer not null default 0,
+    total_chars integer not null default 0,
+    analyzed_chars integer not null default 0,
+    created_at timestamp with time zone default timezone('utc'::text, now())
+);
+create index if not exists idx_policy_changes_policy on policy_changes(policy_id, id);
+
+alter table policy_snapshots enable row level security;
+alter table policy_changes enable row level security;
+
+-- Down migration (for rollback)
+/*
+drop table if exists policy_changes;
+drop table if exists policy_snapshots;
+*/
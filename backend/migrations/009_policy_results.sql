@@ -0,0 +1,64 @@
+-- Analysis prompts, stored once and referenced by hash from each result
+create table if not exists llm_prompts (
+    hash text primary key,
+    prompt text not null,
+    created_at timestamp with time zone default timezone('utc'::text, now())
+);
+
+-- Analysis results, kept out of the policies row so policy lookups stay small.
+-- A policy's current result is the one for its current checksum (see models.PolicyResult).
+create table if not exists policy_results (
+    policy_id bigint not null references policies(id) on delete cascade,
+    checksum text not null,
+    llm_details text not null,
+    prompt_hash text not null references llm_prompts(hash),
+    schema_version smallint,
+    -- 'zlib': base64 of the zlib-compressed analysis JSON; 'json': plain JSON (rows migrated below)
+    encoding text not null default 'zlib' check (encoding in ('zlib', 'json')),
+    output text not null,
+    created_at timestamp with time zone default timezone('utc'::text, now()),
+    primary key (policy_id, checksum)
+);
+
+-- Backfill from the old columns; skipped on re-runs once they have been dropped
+do $$
+begin
+  if exists (select 1 from information_schema.columns
+             where table_name = 'policies' and column_name = 'llm_prompt') then
+    insert into llm_prompts (hash, prompt)
+    select distinct encode(sha256(convert_to(llm_prompt, 'UTF8')), 'hex'), llm_prompt
+    from policies
+    where llm_prompt is not null and llm_prompt <> ''
+    on conflict (hash) do nothing;
+
+    insert into policy_results (policy_id, checksum, llm_details, prompt_hash, schema_version, encoding, output)
+    select id, checksum, coalesce(llm_details, ''), encode(sha256(convert_to(llm_prompt, 'UTF8')), 'hex'),
+           (analysis->>'schema_version')::smallint, 'json', coalesce(analysis::text, processing_output)
+    from policies
+    where checksum <> '' and llm_prompt <> '' and coalesce(analysis::text, processing_output, '') <> ''
+    on conflict (policy_id, checksum) do nothing;
+  end if;
+end $$;
+
+alter table policies drop column if exists analysis;
+alter table policies drop column if exists processing_output;
+alter table policies drop column if exists llm_prompt;
+alter table policies drop column if exists llm_details;
+
+alter table llm_prompts enable row level security;
+alter table policy_results enable row level security;
+
+-- Down migration (for rollback)
+/*
+alter table policies add column if not exists llm_details text;
+alter table policies add column if not exists llm_prompt text;
+alter table policies add column if not exists processing_output text;
+alter table policies add column if not exists analysis jsonb;
+-- Only plain-JSON rows can be restored in SQL; re-analyze policies whose result was zlib-encoded
+update policies p set llm_details = r.llm_details, llm_prompt = l.prompt, processing_output = r.output,
+                      analysis = r.output::jsonb
+from policy_results r join llm_prompts l on l.hash = r.prompt_hash
+where r.policy_id = p.id and r.checksum = p.checksum and r.encoding = 'json';
+drop table if exists policy_results;
+drop table if exists llm_prompts;
+*/
@@ -1,15 +1,101 @@
 from datetime import datetime
+import base64
+import hashlib
+import json
 import logging
-from typing import Optional, Dict, Any, List
+import os
+import zlib
+from typing import Optional, Dict, Any, List, Tuple, Set, Callable, Iterator
 from postgrest.exceptions import APIError
 from supabase_config import supabase
+from cache import TTLCache
+from metrics import timed, db_call_seconds, db_call_errors
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Read-through caches for hot lookups. Writes below invalidate the affected
+# entries; the TTL bounds staleness from writes made by other processes.
+domain_cache = TTLCache(
+    'domains',
+    maxsize=int(os.getenv('MODEL_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('MODEL_CACHE_TTL', 60)),
+    negative_ttl=float(os.getenv('MODEL_CACHE_NEGATIVE_TTL', 30))
+)
+policy_cache = TTLCache(
+    'policies',
+    maxsize=int(os.getenv('MODEL_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('MODEL_CACHE_TTL', 60)),
+    negative_ttl=float(os.getenv('MODEL_CACHE_NEGATIVE_TTL', 30))
+)
+
+def _timed(model: str, operation: str):
+    # Cache hits are included, so these also show what the caches save
+    return timed(db_call_seconds, group='db', errors=db_call_errors, model=model, operation=operation)
+
+# Columns a listing may project with fields=; 'id' is always included as the pagination key
+DOMAIN_COLUMNS = ('id', 'name', 'base_url', 'legal_entity_name', 'processing_status', 'created_at', 'updated_at',
+                  'policy_count')
+# Columns of the policies row itself; analysis results live in policy_results
+POLICY_ROW_COLUMNS = ('id', 'domain_id', 'policy_type', 'page_name', 'page_url', 'processing_status',
+                      'last_updated_at', 'checksum', 'http_etag', 'http_last_modified')
+# Fields loaded from the policy's current result (see PolicyResult), only when asked for
+POLICY_RESULT_FIELDS = ('llm_details', 'analysis')
+POLICY_COLUMNS = POLICY_ROW_COLUMNS + POLICY_RESULT_FIELDS
+# Default policy projection: leaves out the result fields and fetch validators
+POLICY_SUMMARY_COLUMNS = ('id', 'domain_id', 'policy_type', 'page_name', 'page_url', 'processing_status',
+                          'last_updated_at', 'checksum')
+_POLICY_SELECT = ','.join(POLICY_ROW_COLUMNS)
+MAX_PAGE_SIZE = 1000
+
+def select_columns(fields: Optional[List[str]], allowed: Tuple[str, ...], default: Tuple[str, ...]) -> str:
+    """
+    Builds a select() column list from requested field names.
+
+    Raises:
+        ValueError: If a field is not one of ``allowed``.
+    """
+    fields = [field.strip() for field in fields if field.strip()] if fields else list(default)
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return ','.join(['id'] + [field for field in dict.fromkeys(fields) if field != 'id'])
+
+def iter_pages(list_page: Callable[..., List[Dict[str, Any]]], page_size: int = MAX_PAGE_SIZE,
+               **kwargs: Any) -> Iterator[Dict[str, Any]]:
+    """Yields every row of a keyset-paginated listing, one page in memory at a time."""
+    after_id = kwargs.pop('after_id', None)
+    while True:
+        page = list_page(after_id=after_id, limit=page_size, **kwargs)
+        yield from page
+        if len(page) < page_size:
+            return
+        after_id = page[-1]['id']
+
+def _policy_tags(policy: Dict[str, Any]) -> List[Any]:
+    return [('policy', str(policy['id'])), ('domain_policies', str(policy.get('domain_id')))]
+
+def _split_result_fields(columns: str) -> Tuple[str, List[str], bool]:
+    # Result fields aren't policies columns: select the checksum they are keyed by instead.
+    # Returns the select list, the result fields and whether checksum was only added for them.
+    requested = [column.strip() for column in columns.split(',') if column.strip()]
+    fields = [column for column in requested if column in POLICY_RESULT_FIELDS]
+    if not fields:
+        return columns, [], False
+    selected = [column for column in requested if column not in POLICY_RESULT_FIELDS] or ['id']
+    added = 'checksum' not in selected and '*' not in selected
+    return ','.join(selected + ['checksum'] if added else selected), fields, added
+
 class Domain:
     @staticmethod
+    @_timed('domain', 'create')
     def create(name: str, base_url: str, legal_entity_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Creates a domain, or returns the existing row if another process created it first.
+
+        get_by_name may have cached the name as missing, so a concurrent
+        create must not turn into a unique violation here.
+        """
         try:
             data = {
                 'name': name,
@@ -19,125 +105,678 @@ class Domain:
                 'policy_count': 0,
                 'updated_at': datetime.utcnow().isoformat()
             }
-            result = supabase.table('domains').insert(data).execute()
-            logger.info(f"Created domain: {name}")
+            result = supabase.table('domains').upsert(data, on_conflict='name', ignore_duplicates=True).execute()
+            domain_cache.invalidate(('name', name))
+            if not result.data:
+                logger.info("Domain %s already exists", name)
+                return supabase.table('domains').select('*').eq('name', name).execute()
+            logger.info("Created domain: %s", name)
             return result
         except APIError as e:
-            logger.error(f"Failed to create domain {name}: {str(e)}")
+            logger.error("Failed to create domain %s: %s", name, e)
             raise
 
     @staticmethod
+    @_timed('domain', 'get_by_name')
     def get_by_name(name: str) -> Optional[Dict[str, Any]]:
+        def load() -> Optional[Dict[str, Any]]:
+            try:
+                result = supabase.table('domains').select('*').eq('name', name).execute()
+                if result.data:
+                    return result.data[0]
+                logger.debug("No domain found for name: %s", name)
+                return None
+            except APIError as e:
+                logger.error("Error fetching domain %s: %s", name, e)
+                raise
+        return domain_cache.get_or_load(('name', name), load, tags=lambda domain: [('domain', str(domain['id']))])
+
+    @staticmethod
+    @_timed('domain', 'get_by_names')
+    def get_by_names(names: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Returns the domains with the given names, keyed by name; unknown names are omitted."""
+        if not names:
+            return {}
         try:
-            result = supabase.table('domains').select('*').eq('name', name).execute()
-            if result.data:
-                return result.data[0]
-            logger.debug(f"No domain found for name: {name}")
-            return None
+            result = supabase.table('domains').select('*').in_('name', list(names)).execute()
+            return {domain['name']: domain for domain in result.data}
+        except APIError as e:
+            logger.error("Failed to fetch %s domains by name: %s", len(names), e)
+            raise
+
+    @staticmethod
+    @_timed('domain', 'insert_many')
+    def insert_many(rows: List[Dict[str, Any]]) -> None:
+        """Inserts domain rows (name, base_url, ...) in one request, skipping names that already exist."""
+        if not rows:
+            return
+        try:
+            supabase.table('domains').upsert(rows, on_conflict='name', ignore_duplicates=True,
+                                             returning='minimal').execute()
+            for row in rows:
+                domain_cache.invalidate(('name', row['name']))
+            logger.info("Inserted up to %s domains", len(rows))
         except APIError as e:
-            logger.error(f"Error fetching domain {name}: {str(e)}")
+            logger.error("Failed to insert %s domains: %s", len(rows), e)
             raise
 
     @staticmethod
+    @_timed('domain', 'update_many')
+    def update_many(ids: List[Any], data: Dict[str, Any]) -> None:
+        """Applies the same update to several domains in one request."""
+        if not ids:
+            return
+        try:
+            supabase.table('domains').update(data).in_('id', list(ids)).execute()
+            for id in ids:
+                domain_cache.invalidate_tag(('domain', str(id)))
+            logger.info("Updated %s domains", len(ids))
+        except APIError as e:
+            logger.error("Failed to update %s domains: %s", len(ids), e)
+            raise
+
+    @staticmethod
+    @_timed('domain', 'update')
     def update(id: str, data: Dict[str, Any]) -> Dict[str, Any]:
         try:
             result = supabase.table('domains').update(data).eq('id', id).execute()
-            logger.info(f"Updated domain {id}")
+            domain_cache.invalidate_tag(('domain', str(id)))
+            logger.info("Updated domain %s", id)
             return result
         except APIError as e:
-            logger.error(f"Failed to update domain {id}: {str(e)}")
+            logger.error("Failed to update domain %s: %s", id, e)
             raise
 
     @staticmethod
-    def get_all() -> List[Dict[str, Any]]:
+    @_timed('domain', 'list_page')
+    def list_page(after_id: Optional[int] = None, limit: int = 100, columns: str = '*',
+                  processing_status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Returns up to ``limit`` domains with an ID greater than ``after_id``, in ID order.
+
+        Keyset pagination: each page is an index range scan, however deep
+        into the table it is. Pass the last ID of a page as ``after_id``
+        to get the next one.
+        """
         try:
-            result = supabase.table('domains').select('*').execute()
+            query = supabase.table('domains').select(columns)
+            if after_id is not None:
+                query = query.gt('id', after_id)
+            if processing_status:
+                query = query.eq('processing_status', processing_status)
+            result = query.order('id').limit(min(limit, MAX_PAGE_SIZE)).execute()
             return result.data
         except APIError as e:
-            logger.error(f"Failed to fetch all domains: {str(e)}")
+            logger.error("Failed to list domains after %s: %s", after_id, e)
             raise
 
     @staticmethod
+    def get_all() -> List[Dict[str, Any]]:
+        # Paged, so the result isn't silently cut off at the API's max-rows limit
+        return list(iter_pages(Domain.list_page))
+
+    @staticmethod
+    @_timed('domain', 'delete')
     def delete(id: str) -> Dict[str, Any]:
         try:
             result = supabase.table('domains').delete().eq('id', id).execute()
-            logger.info(f"Deleted domain {id}")
+            domain_cache.invalidate_tag(('domain', str(id)))
+            policy_cache.invalidate_tag(('domain_policies', str(id)))
+            logger.info("Deleted domain %s", id)
             return result
         except APIError as e:
-            logger.error(f"Failed to delete domain {id}: {str(e)}")
+            logger.error("Failed to delete domain %s: %s", id, e)
             raise
 
 class Policy:
     @staticmethod
+    def new_row(domain_id: str, policy_type: str, page_name: str, page_url: str) -> Dict[str, Any]:
+        return {
+            'domain_id': domain_id,
+            'policy_type': policy_type,
+            'page_name': page_name,
+            'page_url': page_url,
+            'processing_status': 'not_processed',
+            'last_updated_at': datetime.utcnow().isoformat(),
+            'checksum': ''
+        }
+
+    @staticmethod
+    @_timed('policy', 'create')
     def create(domain_id: str, policy_type: str, page_name: str, page_url: str) -> Dict[str, Any]:
         try:
-            data = {
-                'domain_id': domain_id,
-                'policy_type': policy_type,
-                'page_name': page_name,
-                'page_url': page_url,
-                'processing_status': 'not_processed',
-                'last_updated_at': datetime.utcnow().isoformat(),
-                'checksum': '',
-                'llm_details': '',
-                'llm_prompt': '',
-                'processing_output': ''
-            }
+            data = Policy.new_row(domain_id, policy_type, page_name, page_url)
             result = supabase.table('policies').insert(data).execute()
-            logger.info(f"Created policy for domain {domain_id}: {policy_type}")
+            Policy._invalidate_membership(data)
+            logger.info("Created policy for domain %s: %s", domain_id, policy_type)
             return result
         except APIError as e:
-            logger.error(f"Failed to create policy for domain {domain_id}: {str(e)}")
+            logger.error("Failed to create policy for domain %s: %s", domain_id, e)
             raise
 
     @staticmethod
-    def get_by_domain(domain_id: str) -> List[Dict[str, Any]]:
+    @_timed('policy', 'upsert_many')
+    def upsert_many(rows: List[Dict[str, Any]], ignore_duplicates: bool = True) -> List[Dict[str, Any]]:
+        """
+        Inserts several policy rows (see new_row) in a single request, keyed on page_url.
+
+        With ignore_duplicates, rows whose page_url already exists are left
+        untouched and only the newly inserted rows are returned; otherwise
+        existing rows are overwritten with the given values.
+        """
+        if not rows:
+            return []
         try:
-            result = supabase.table('policies').select('*').eq('domain_id', domain_id).execute()
+            result = supabase.table('policies').upsert(
+                rows, on_conflict='page_url', ignore_duplicates=ignore_duplicates
+            ).execute()
+            for row in rows:
+                Policy._invalidate_membership(row)
+            logger.info("Upserted %s policies (%s rows written)", len(rows), len(result.data))
             return result.data
         except APIError as e:
-            logger.error(f"Failed to fetch policies for domain {domain_id}: {str(e)}")
+            logger.error("Failed to upsert %s policies: %s", len(rows), e)
             raise
 
     @staticmethod
+    def get_or_create(domain_id: str, policy_type: str, page_name: str, page_url: str) -> Dict[str, Any]:
+        """
+        Returns the policy row for page_url, inserting it if it doesn't exist.
+
+        Relies on the unique constraint on page_url, so concurrent callers
+        end up with the same row instead of duplicates.
+        """
+        created = Policy.upsert_many([Policy.new_row(domain_id, policy_type, page_name, page_url)])
+        if created:
+            return created[0]
+        policy = Policy.get_by_url(page_url)
+        if not policy:
+            logger.error("Policy for URL %s neither inserted nor found", page_url)
+            raise Exception("Failed to create policy entry")
+        return policy
+
+    @staticmethod
+    def _invalidate_membership(row: Dict[str, Any]) -> None:
+        # Adding or removing a policy changes its domain's policy list and (via trigger) policy_count
+        policy_cache.invalidate(('url', row['page_url']))
+        policy_cache.invalidate_tag(('domain_policies', str(row['domain_id'])))
+        domain_cache.invalidate_tag(('domain', str(row['domain_id'])))
+
+    @staticmethod
+    @_timed('policy', 'get_by_domain')
+    def get_by_domain(domain_id: str) -> List[Dict[str, Any]]:
+        def load() -> List[Dict[str, Any]]:
+            try:
+                result = supabase.table('policies').select(_POLICY_SELECT).eq('domain_id', domain_id).execute()
+                return result.data
+            except APIError as e:
+                logger.error("Failed to fetch policies for domain %s: %s", domain_id, e)
+                raise
+        return policy_cache.get_or_load(
+            ('domain', str(domain_id)), load,
+            tags=lambda policies: [('domain_policies', str(domain_id))] + [('policy', str(p['id'])) for p in policies]
+        )
+
+    @staticmethod
+    @_timed('policy', 'update')
     def update(id: str, data: Dict[str, Any]) -> Dict[str, Any]:
         try:
             if 'last_updated_at' not in data:
                 data['last_updated_at'] = datetime.utcnow().isoformat()
             result = supabase.table('policies').update(data).eq('id', id).execute()
-            logger.info(f"Updated policy {id}")
+            policy_cache.invalidate_tag(('policy', str(id)))
+            logger.info("Updated policy %s", id)
             return result
         except APIError as e:
-            logger.error(f"Failed to update policy {id}: {str(e)}")
+            logger.error("Failed to update policy %s: %s", id, e)
             raise
 
     @staticmethod
+    @_timed('policy', 'get_by_id')
+    def get_by_id(id: str) -> Optional[Dict[str, Any]]:
+        def load() -> Optional[Dict[str, Any]]:
+            try:
+                result = supabase.table('policies').select(_POLICY_SELECT).eq('id', id).execute()
+                if result.data:
+                    return result.data[0]
+                logger.debug("No policy found for ID: %s", id)
+                return None
+            except APIError as e:
+                logger.error("Failed to fetch policy %s: %s", id, e)
+                raise
+        return policy_cache.get_or_load(('id', str(id)), load, tags=_policy_tags)
+
+    @staticmethod
+    @_timed('policy', 'get_by_url')
     def get_by_url(url: str) -> Optional[Dict[str, Any]]:
+        def load() -> Optional[Dict[str, Any]]:
+            try:
+                result = supabase.table('policies').select(_POLICY_SELECT).eq('page_url', url).execute()
+                if result.data:
+                    return result.data[0]
+                logger.debug("No policy found for URL: %s", url)
+                return None
+            except APIError as e:
+                logger.error("Failed to fetch policy by URL %s: %s", url, e)
+                raise
+        return policy_cache.get_or_load(('url', url), load, tags=_policy_tags)
+
+    @staticmethod
+    @_timed('policy', 'get_by_urls')
+    def get_by_urls(urls: List[str]) -> List[Dict[str, Any]]:
+        if not urls:
+            return []
         try:
-            result = supabase.table('policies').select('*').eq('page_url', url).execute()
-            if result.data:
-                return result.data[0]
-            logger.debug(f"No policy found for URL: {url}")
-            return None
+            result = supabase.table('policies').select(_POLICY_SELECT).in_('page_url', urls).execute()
+            return result.data
         except APIError as e:
-            logger.error(f"Failed to fetch policy by URL {url}: {str(e)}")
+            logger.error("Failed to fetch policies for %s URLs: %s", len(urls), e)
             raise
 
     @staticmethod
+    @_timed('policy', 'delete')
     def delete(id: str) -> Dict[str, Any]:
         try:
             result = supabase.table('policies').delete().eq('id', id).execute()
-            logger.info(f"Deleted policy {id}")
+            policy_cache.invalidate_tag(('policy', str(id)))
+            for row in result.data or []:
+                Policy._invalidate_membership(row)
+            logger.info("Deleted policy %s", id)
             return result
         except APIError as e:
-            logger.error(f"Failed to delete policy {id}: {str(e)}")
+            logger.error("Failed to delete policy %s: %s", id, e)
+            raise
+
+    @staticmethod
+    @_timed('policy', 'list_page')
+    def list_page(after_id: Optional[int] = None, limit: int = 100, columns: str = '*',
+                  domain_id: Optional[str] = None, processing_status: Optional[str] = None,
+                  policy_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Returns up to ``limit`` policies with an ID greater than ``after_id``, in ID order.
+
+        See Domain.list_page. Filters are combined with AND. ``columns`` may
+        name POLICY_RESULT_FIELDS, which are loaded with one more request
+        (see with_results); select them only if you need them.
+        """
+        columns, result_fields, drop_checksum = _split_result_fields(columns)
+        try:
+            query = supabase.table('policies').select(columns)
+            if after_id is not None:
+                query = query.gt('id', after_id)
+            if domain_id is not None:
+                query = query.eq('domain_id', domain_id)
+            if processing_status:
+                query = query.eq('processing_status', processing_status)
+            if policy_type:
+                query = query.eq('policy_type', policy_type)
+            result = query.order('id').limit(min(limit, MAX_PAGE_SIZE)).execute()
+        except APIError as e:
+            logger.error("Failed to list policies after %s: %s", after_id, e)
+            raise
+        if not result_fields:
+            return result.data
+        policies = Policy.with_results(result.data, result_fields)
+        if drop_checksum:
+            for policy in policies:
+                del policy['checksum']
+        return policies
+
+    @staticmethod
+    @_timed('policy', 'list_due')
+    def list_due(statuses: List[str], updated_before: str, limit: int = 100,
+                 columns: str = ','.join(POLICY_SUMMARY_COLUMNS),
+                 domain_ids: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Returns policies in one of ``statuses`` last updated before ``updated_before``, oldest first.
+
+        Used by the re-crawl scheduler to find pending and stale policies.
+        ``domain_ids`` restricts the result to those domains.
+        """
+        if domain_ids is not None and not domain_ids:
+            return []
+        try:
+            query = supabase.table('policies').select(columns).in_('processing_status', statuses) \
+                .lt('last_updated_at', updated_before)
+            if domain_ids is not None:
+                query = query.in_('domain_id', list(domain_ids))
+            result = query.order('last_updated_at').limit(limit).execute()
+            return result.data
+        except APIError as e:
+            logger.error("Failed to list policies due for %s: %s", statuses, e)
             raise
 
     @staticmethod
     def get_all() -> List[Dict[str, Any]]:
+        # Paged, so the result isn't silently cut off at the API's max-rows limit
+        return list(iter_pages(Policy.list_page, columns=f"{_POLICY_SELECT},domains(*)"))
+
+    @staticmethod
+    def get_result(policy: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Loads the stored result for the policy's current content (see PolicyResult.get), or None."""
+        if not policy or not policy.get('checksum'):
+            return None
+        return PolicyResult.get(policy['id'], policy['checksum'])
+
+    @staticmethod
+    def with_results(policies: List[Dict[str, Any]],
+                     fields: Tuple[str, ...] = POLICY_RESULT_FIELDS) -> List[Dict[str, Any]]:
+        """
+        Returns copies of ``policies`` with the given POLICY_RESULT_FIELDS of their current results.
+
+        Loads all results in one request. Policies without a stored result
+        for their checksum get None for each field.
+        """
+        results = PolicyResult.get_many([(policy['id'], policy['checksum'])
+                                         for policy in policies if policy.get('checksum')])
+        empty: Dict[str, Any] = {}
+        return [{
+            **policy,
+            **{field: results.get(PolicyResult.key(policy['id'], policy.get('checksum')), empty).get(field)
+               for field in fields}
+        } for policy in policies]
+
+def _encode_output(analysis: Dict[str, Any]) -> str:
+    return base64.b64encode(zlib.compress(json.dumps(analysis, separators=(',', ':')).encode('utf-8'))).decode('ascii')
+
+def _decode_result(row: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        if row.get('encoding') == 'json':
+            analysis = json.loads(row['output'])
+        else:
+            analysis = json.loads(zlib.decompress(base64.b64decode(row['output'])))
+    except (ValueError, TypeError, zlib.error) as e:
+        logger.warning("Stored result of policy %s is unreadable: %s", row.get('policy_id'), e)
+        analysis = None
+    return {
+        'policy_id': row['policy_id'],
+        'checksum': row['checksum'],
+        'llm_details': row.get('llm_details'),
+        'prompt_hash': row.get('prompt_hash'),
+        'schema_version': row.get('schema_version'),
+        'analysis': analysis if isinstance(analysis, dict) else None
+    }
+
+_RESULT_SELECT = 'policy_id,checksum,llm_details,prompt_hash,schema_version,encoding,output'
+
+class PolicyResult:
+    """
+    Analysis results, one per policy and content checksum (see migration 009).
+
+    The analysis is stored as compressed JSON and the prompt it came from
+    by hash, in llm_prompts, so neither weighs on the policies row. Loaded
+    results are dicts with policy_id, checksum, llm_details, prompt_hash,
+    schema_version and analysis (None if the stored output is unreadable).
+    """
+
+    # Prompt hashes known to be in llm_prompts, so saves don't re-send the prompt text
+    _known_prompts: Set[str] = set()
+
+    @staticmethod
+    def prompt_hash(prompt: str) -> str:
+        return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def key(policy_id: Any, checksum: Optional[str]) -> Tuple[str, Optional[str]]:
+        return str(policy_id), checksum
+
+    @staticmethod
+    def save(policy_id: Any, checksum: str, llm_details: str, prompt: str, analysis: Dict[str, Any]) -> None:
+        PolicyResult.save_many([{'policy_id': policy_id, 'checksum': checksum, 'llm_details': llm_details,
+                                 'prompt': prompt, 'analysis': analysis}])
+
+    @staticmethod
+    @_timed('policy_result', 'save_many')
+    def save_many(entries: List[Dict[str, Any]]) -> None:
+        """
+        Stores results given as dicts with policy_id, checksum, llm_details, prompt and analysis.
+
+        A result already stored for the same policy and checksum is
+        replaced. Takes one request, plus one when a prompt is new to this
+        process.
+        """
+        if not entries:
+            return
+        rows = {}
+        prompts = {}
+        for entry in entries:
+            prompt_hash = PolicyResult.prompt_hash(entry['prompt'])
+            if prompt_hash not in PolicyResult._known_prompts:
+                prompts[prompt_hash] = entry['prompt']
+            # One row per key: an upsert can't touch the same row twice
+            rows[PolicyResult.key(entry['policy_id'], entry['checksum'])] = {
+                'policy_id': entry['policy_id'],
+                'checksum': entry['checksum'],
+                'llm_details': entry['llm_details'],
+                'prompt_hash': prompt_hash,
+                'schema_version': entry['analysis'].get('schema_version'),
+                'encoding': 'zlib',
+                'output': _encode_output(entry['analysis'])
+            }
+        try:
+            if prompts:
+                supabase.table('llm_prompts').upsert(
+                    [{'hash': prompt_hash, 'prompt': prompt} for prompt_hash, prompt in prompts.items()],
+                    on_conflict='hash', ignore_duplicates=True, returning='minimal'
+                ).execute()
+                PolicyResult._known_prompts.update(prompts)
+            supabase.table('policy_results').upsert(list(rows.values()), on_conflict='policy_id,checksum',
+                                                    returning='minimal').execute()
+            logger.debug("Saved results for %s policies", len(rows))
+        except APIError as e:
+            logger.error("Failed to save results for %s policies: %s", len(rows), e)
+            raise
+
+    @staticmethod
+    @_timed('policy_result', 'get')
+    def get(policy_id: Any, checksum: str) -> Optional[Dict[str, Any]]:
+        try:
+            result = supabase.table('policy_results').select(_RESULT_SELECT).eq('policy_id', policy_id) \
+                .eq('checksum', checksum).execute()
+            return _decode_result(result.data[0]) if result.data else None
+        except APIError as e:
+            logger.error("Failed to fetch result of policy %s: %s", policy_id, e)
+            raise
+
+    @staticmethod
+    @_timed('policy_result', 'get_many')
+    def get_many(keys: List[Tuple[Any, str]]) -> Dict[Tuple[str, Optional[str]], Dict[str, Any]]:
+        """Returns the results for several (policy_id, checksum) keys in one request, keyed by PolicyResult.key."""
+        wanted = {PolicyResult.key(policy_id, checksum) for policy_id, checksum in keys}
+        if not wanted:
+            return {}
+        try:
+            result = supabase.table('policy_results').select(_RESULT_SELECT) \
+                .in_('policy_id', sorted({policy_id for policy_id, _ in wanted})) \
+                .in_('checksum', sorted({checksum for _, checksum in wanted})).execute()
+        except APIError as e:
+            logger.error("Failed to fetch results of %s policies: %s", len(wanted), e)
+            raise
+        # The two IN filters can also match other pairings of the same IDs and checksums
+        results = {}
+        for row in result.data:
+            key = PolicyResult.key(row['policy_id'], row['checksum'])
+            if key in wanted:
+                results[key] = _decode_result(row)
+        return results
+
+    @staticmethod
+    @_timed('policy_result', 'copy')
+    def copy(source_policy_id: Any, checksum: str, policy_id: Any) -> bool:
+        """Stores the source policy's result for ``checksum`` as ``policy_id``'s too; False if there is none."""
+        try:
+            result = supabase.table('policy_results').select(_RESULT_SELECT).eq('policy_id', source_policy_id) \
+                .eq('checksum', checksum).execute()
+            if not result.data:
+                return False
+            supabase.table('policy_results').upsert({**result.data[0], 'policy_id': policy_id},
+                                                    on_conflict='policy_id,checksum',
+                                                    returning='minimal').execute()
+            return True
+        except APIError as e:
+            logger.error("Failed to copy result of policy %s to %s: %s", source_policy_id, policy_id, e)
+            raise
+
+class PolicySignature:
+    @staticmethod
+    def save(policy_id: str, checksum: str, signature: List[int], buckets: List[int]) -> None:
+        """Stores a policy's MinHash signature and replaces its LSH bucket rows (see similarity.py)."""
+        PolicySignature.save_many([(policy_id, checksum, signature, buckets)])
+
+    @staticmethod
+    @_timed('policy_signature', 'save_many')
+    def save_many(entries: List[Tuple[Any, str, List[int], List[int]]]) -> None:
+        """Like save, for several (policy_id, checksum, signature, buckets) entries in three requests."""
+        if not entries:
+            return
+        policy_ids = [entry[0] for entry in entries]
+        try:
+            supabase.table('policy_signatures').upsert([{
+                'policy_id': policy_id,
+                'checksum': checksum,
+                'signature': signature,
+                'updated_at': datetime.utcnow().isoformat()
+            } for policy_id, checksum, signature, _ in entries], on_conflict='policy_id').execute()
+            supabase.table('policy_lsh_buckets').delete().in_('policy_id', policy_ids).execute()
+            supabase.table('policy_lsh_buckets').insert([
+                {'bucket': bucket, 'policy_id': policy_id}
+                for policy_id, _, _, buckets in entries for bucket in dict.fromkeys(buckets)
+            ], returning='minimal').execute()
+            logger.debug("Saved signatures for %s policies", len(entries))
+        except APIError as e:
+            logger.error("Failed to save signatures for %s policies: %s", len(entries), e)
+            raise
+
+    @staticmethod
+    @_timed('policy_signature', 'find_by_buckets')
+    def find_by_buckets(buckets: List[int], limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Returns signatures of the policies sharing the most LSH buckets, at most ``limit``.
+
+        Each row has policy_id, checksum, signature and ``shared_buckets``.
+        """
+        if not buckets:
+            return []
+        try:
+            result = supabase.table('policy_lsh_buckets').select('policy_id').in_('bucket', buckets).execute()
+            shared: Dict[Any, int] = {}
+            for row in result.data:
+                shared[row['policy_id']] = shared.get(row['policy_id'], 0) + 1
+            if not shared:
+                return []
+            policy_ids = sorted(shared, key=shared.get, reverse=True)[:limit]
+            result = supabase.table('policy_signatures').select('policy_id,checksum,signature') \
+                .in_('policy_id', policy_ids).execute()
+            return [{**row, 'shared_buckets': shared[row['policy_id']]} for row in result.data]
+        except APIError as e:
+            logger.error("Failed to look up %s similarity buckets: %s", len(buckets), e)
+            raise
+
+class PolicySnapshot:
+    @staticmethod
+    @_timed('policy_snapshot', 'create')
+    def create(data: Dict[str, Any], keep: int = 5) -> None:
+        """Stores a snapshot (see snapshots.py) and deletes all but the newest ``keep`` for the policy."""
+        try:
+            result = supabase.table('policy_snapshots').insert(data).execute()
+            if keep > 0 and result.data:
+                old = supabase.table('policy_snapshots').select('id').eq('policy_id', data['policy_id']) \
+                    .order('id', desc=True).range(keep, keep + 99).execute()
+                if old.data:
+                    supabase.table('policy_snapshots').delete() \
+                        .in_('id', [row['id'] for row in old.data]).execute()
+            logger.debug("Saved snapshot of policy %s", data['policy_id'])
+        except APIError as e:
+            logger.error("Failed to save snapshot of policy %s: %s", data.get('policy_id'), e)
+            raise
+
+    @staticmethod
+    @_timed('policy_snapshot', 'get_latest')
+    def get_latest(policy_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            result = supabase.table('policy_snapshots').select('*').eq('policy_id', policy_id) \
+                .order('id', desc=True).limit(1).execute()
+            return result.data[0] if result.data else None
+        except APIError as e:
+            logger.error("Failed to fetch latest snapshot of policy %s: %s", policy_id, e)
+            raise
+
+    @staticmethod
+    @_timed('policy_snapshot', 'create_many')
+    def create_many(rows: List[Dict[str, Any]]) -> None:
+        """Stores several snapshots in one request. Unlike create, older snapshots are not pruned."""
+        if not rows:
+            return
+        try:
+            supabase.table('policy_snapshots').insert(rows, returning='minimal').execute()
+            logger.debug("Saved %s snapshots", len(rows))
+        except APIError as e:
+            logger.error("Failed to save %s snapshots: %s", len(rows), e)
+            raise
+
+class PolicyChange:
+    @staticmethod
+    @_timed('policy_change', 'create_many')
+    def create_many(rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        try:
+            supabase.table('policy_changes').insert(rows, returning='minimal').execute()
+            logger.info("Recorded %s policy changes", len(rows))
+        except APIError as e:
+            logger.error("Failed to record %s policy changes: %s", len(rows), e)
+            raise
+
+    @staticmethod
+    @_timed('policy_change', 'list_for_policy')
+    def list_for_policy(policy_id: str, before_id: Optional[int] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Returns a policy's changelog, newest first; pass the last ID of a page as ``before_id`` for the next."""
+        try:
+            query = supabase.table('policy_changes').select('*').eq('policy_id', policy_id)
+            if before_id is not None:
+                query = query.lt('id', before_id)
+            result = query.order('id', desc=True).limit(min(limit, MAX_PAGE_SIZE)).execute()
+            return result.data
+        except APIError as e:
+            logger.error("Failed to list changes of policy %s: %s", policy_id, e)
+            raise
+
+class UserHistory:
+    @staticmethod
+    @_timed('user_history', 'insert_many')
+    def insert_many(rows: List[Dict[str, Any]]) -> None:
+        """Writes visit rows (user_id, domain_id, visited_at) in a single request."""
+        if not rows:
+            return
+        try:
+            supabase.table('user_history').insert(rows, returning='minimal').execute()
+            logger.debug("Inserted %s user_history rows", len(rows))
+        except APIError as e:
+            logger.error("Failed to insert %s user_history rows: %s", len(rows), e)
+            raise
+
+    @staticmethod
+    @_timed('user_history', 'get_domain_popularity')
+    def get_domain_popularity(domain_ids: List[Any]) -> Dict[str, int]:
+        """Recent visit counts per domain (see the domain_popularity view); domains without visits are omitted."""
+        if not domain_ids:
+            return {}
+        try:
+            result = supabase.table('domain_popularity').select('domain_id,visits') \
+                .in_('domain_id', list(domain_ids)).execute()
+            return {str(row['domain_id']): row['visits'] for row in result.data}
+        except APIError as e:
+            logger.error("Failed to fetch popularity for %s domains: %s", len(domain_ids), e)
+            raise
+
+    @staticmethod
+    @_timed('user_history', 'get_popular_domains')
+    def get_popular_domains(limit: int = 10) -> List[Dict[str, Any]]:
+        """The most visited domains over the domain_popularity window, with visits and last_visited_at."""
         try:
-            result = supabase.table('policies').select('*, domains(*)').execute()
+            result = supabase.table('domain_popularity').select('domain_id,visits,last_visited_at') \
+                .order('visits', desc=True).limit(limit).execute()
             return result.data
         except APIError as e:
-            logger.error(f"Failed to fetch all policies: {str(e)}")
+            logger.error("Failed to fetch the %s most popular domains: %s", limit, e)
             raise
\ No newline at end of file
@@ -0,0 +1,330 @@
+import logging
+import time
+from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit
+from typing import Optional, Dict, Any, Callable, List, Tuple
+
+from models import Policy, PolicyResult
+from snapshots import analyze_policy_text, analyze_near_duplicate, record_update
+from llm_config import get_llm_config, describe_llm
+from cache import content_checksum, analysis_cache_stats
+from fetcher import policy_fetcher, FetchResult
+from extraction import extract_policy_text
+from singleflight import SingleFlight
+from similarity import near_duplicates, near_duplicate_stats
+from metrics import timer, pipeline_stage_seconds, extraction_seconds, content_chars
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+# Concurrent analyses of the same page share one fetch + LLM call
+analysis_flights = SingleFlight('analysis')
+
+# Policy columns that carry the outcome of an analysis; the result itself is a PolicyResult
+ANALYSIS_COLUMNS = ('processing_status', 'checksum', 'http_etag', 'http_last_modified')
+
+
+class PipelineError(Exception):
+    """Raised when a policy could not be taken through fetch -> analyze -> persist."""
+
+    def __init__(self, message: str, processing_status: str):
+        super().__init__(message)
+        self.processing_status = processing_status
+
+
+def get_stored_analysis(policy: Optional[Dict[str, Any]], llm_config: Dict[str, Any],
+                        results: Optional[Dict[Any, Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Returns the stored analysis of a policy if it was produced by the current LLM config.
+
+    Whether the content itself is unchanged is decided by the caller, either
+    from a 304 response or by comparing content checksums.
+
+    Args:
+        policy: The policy row.
+        llm_config: The LLM config analyses are run with now.
+        results: Results already loaded with PolicyResult.get_many; by
+            default the policy's result is loaded on its own.
+    """
+    if not policy or policy.get('processing_status') != 'processed' or not policy.get('checksum'):
+        return None
+    if results is not None:
+        result = results.get(PolicyResult.key(policy['id'], policy['checksum']))
+    else:
+        result = Policy.get_result(policy)
+    if not result or result['analysis'] is None:
+        return None
+    if result['prompt_hash'] != PolicyResult.prompt_hash(llm_config['default_prompt']) \
+            or result['llm_details'] != describe_llm(llm_config):
+        return None
+    return result['analysis']
+
+
+def normalize_policy_url(url: str) -> str:
+    """Canonical form of a policy URL: lowercase scheme/host, no default port, fragment or trailing slash."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and not (scheme == 'http' and parts.port == 80) and not (scheme == 'https' and parts.port == 443):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((scheme, host, path, parts.query, ''))
+
+
+async def analyze_policy_url(policy_id: str, url: str,
+                             on_stage: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Runs the fetch -> analyze -> persist pipeline for a single policy row.
+
+    Args:
+        policy_id: ID of the policy row to update.
+        url: The policy page URL.
+        on_stage: Optional callback notified as the pipeline moves between stages.
+
+    Returns:
+        Dict with the policy ID, its final processing status and the analysis.
+
+    Raises:
+        PipelineError: If fetching or analysis failed. The policy row has
+            already been moved to the matching failure status.
+    """
+    led = []
+
+    async def lead() -> Dict[str, Any]:
+        led.append(True)
+        return await _analyze_guarded(policy_id, url, on_stage)
+
+    try:
+        result, shared = await analysis_flights.run(normalize_policy_url(url), lead)
+    except PipelineError as e:
+        if not led:
+            # Another request ran the pipeline for this page; mirror its failure on our row
+            _record_shared_failure(policy_id, e)
+        raise
+    if shared and str(result['policy_id']) != str(policy_id):
+        # Same page stored under a URL variant (e.g. with a fragment); copy the outcome
+        _copy_analysis(result['policy_id'], policy_id)
+        result = {**result, 'policy_id': policy_id}
+    return result
+
+
+class _StageTimer:
+    """Forwards stage changes to on_stage and records how long each stage took."""
+
+    def __init__(self, on_stage: Optional[Callable[[str], None]]):
+        self.on_stage = on_stage
+        self.current = 'loading'
+        self.started = time.perf_counter()
+
+    def __call__(self, name: str) -> None:
+        self.finish()
+        self.current = name
+        if self.on_stage:
+            self.on_stage(name)
+
+    def finish(self) -> None:
+        now = time.perf_counter()
+        pipeline_stage_seconds.observe(now - self.started, stage=self.current)
+        self.started = now
+
+
+async def _analyze_guarded(policy_id: str, url: str,
+                           on_stage: Optional[Callable[[str], None]]) -> Dict[str, Any]:
+    stage_timer = _StageTimer(on_stage)
+    try:
+        return await _run_pipeline(policy_id, url, stage_timer)
+    except PipelineError:
+        raise
+    except Exception as e:
+        logger.exception("Unexpected error analyzing policy %s: %s", policy_id, e)
+        try:
+            Policy.update(policy_id, {'processing_status': 'failed_analysis'})
+        except Exception as update_e:
+            logger.error("Failed to update policy status to failed_analysis for %s: %s", policy_id, update_e)
+        raise
+    finally:
+        stage_timer.finish()
+
+
+async def _run_pipeline(policy_id: str, url: str, stage: Callable[[str], None]) -> Dict[str, Any]:
+    llm_config = get_llm_config()
+    policy = Policy.get_by_id(policy_id)
+    stored_result = get_stored_analysis(policy, llm_config)
+
+    stage('fetching')
+    logger.info("Fetching content for policy URL: %s", url)
+    if stored_result is not None:
+        # Only send validators when a 304 would let us reuse the stored analysis
+        fetched = policy_fetcher.fetch(url, etag=policy.get('http_etag'), last_modified=policy.get('http_last_modified'))
+    else:
+        fetched = policy_fetcher.fetch(url)
+    if fetched and fetched.not_modified:
+        return _reuse_stored_analysis(policy_id, stored_result, fetched, stage)
+    if fetched is None or fetched.text is None:
+        logger.error("Failed to fetch content for URL: %s", url)
+        Policy.update(policy_id, {'processing_status': 'failed_fetch'})
+        raise PipelineError('Failed to fetch policy content.', 'failed_fetch')
+
+    stage('extracting')
+    with timer(extraction_seconds):
+        extracted = extract_policy_text(fetched.text, fetched.content_type)
+    content_chars.inc(extracted.input_chars, stage='fetched')
+    content_chars.inc(extracted.output_chars, stage='extracted')
+    if not extracted.text:
+        logger.error("No policy text could be extracted from %s", url)
+        Policy.update(policy_id, {'processing_status': 'failed_fetch'})
+        raise PipelineError('No policy text found in fetched content.', 'failed_fetch')
+    content = extracted.text
+
+    checksum = content_checksum(content)
+    if stored_result is not None and policy['checksum'] == checksum:
+        logger.info("Content of policy %s unchanged (checksum %s).", policy_id, checksum[:12])
+        return _reuse_stored_analysis(policy_id, stored_result, fetched, stage)
+    analysis_cache_stats.miss()
+
+    signature = near_duplicates.signature(content)
+    if signature and near_duplicates.enabled:
+        reused = await _reuse_near_duplicate(policy or {'id': policy_id}, content, checksum, signature, llm_config,
+                                             fetched, stage)
+        if reused is not None:
+            return reused
+
+    stage('analyzing')
+    logger.info("Performing analysis for policy ID: %s", policy_id)
+    Policy.update(policy_id, {'processing_status': 'processing'})
+    update = await analyze_policy_text(policy or {'id': policy_id}, content, checksum, stored_result)
+    analysis_result = update.result
+    if update.failed:
+        logger.error("Analysis failed for policy ID %s: %s", policy_id, analysis_result['error'])
+        Policy.update(policy_id, {'processing_status': 'failed_analysis'})
+        raise PipelineError(f"Analysis failed: {analysis_result['error']}", 'failed_analysis')
+
+    stage('saving')
+    logger.info("Analysis complete for policy ID: %s. Updating database.", policy_id)
+    # Result first: a processed policy's checksum must always have one
+    PolicyResult.save_many([result_entry(policy_id, checksum, analysis_result, llm_config)])
+    Policy.update(policy_id, {
+        'processing_status': 'processed',
+        'last_updated_at': datetime.utcnow().isoformat(),
+        'checksum': checksum,
+        **fetched.validators()
+    })
+    _index_signature(policy_id, checksum, signature)
+    record_update(update)
+
+    logger.info("Policy %s analyzed and saved successfully.", policy_id)
+    return {'policy_id': policy_id, 'processing_status': 'processed', 'analysis': analysis_result, 'cached': False,
+            'extraction': extracted.to_dict(), 'change': {'mode': update.change['mode'],
+                                                          'analyzed_chars': update.analyzed_chars}}
+
+
+def _reuse_stored_analysis(policy_id: str, stored_result: Dict[str, Any], fetched: FetchResult,
+                           stage: Callable[[str], None]) -> Dict[str, Any]:
+    analysis_cache_stats.hit()
+    stage('cached')
+    logger.info("Reusing stored analysis for policy %s.", policy_id)
+    Policy.update(policy_id, {'processing_status': 'processed', **fetched.validators()})
+    return {'policy_id': policy_id, 'processing_status': 'processed', 'analysis': stored_result, 'cached': True}
+
+
+def find_near_duplicate(policy: Dict[str, Any], signature: List[int],
+                        llm_config: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], Dict[str, Any], float]]:
+    """
+    Finds an already processed policy of the same domain with nearly the same text whose analysis can be reused.
+
+    Only the same domain qualifies: a reused analysis keeps its summary and
+    key points, which usually name the company, its product and how to
+    contact it, so another company's policy would put its name on this one.
+
+    Returns:
+        (source policy row, its stored analysis, estimated similarity), or
+        None if no indexed policy is similar enough or the lookup failed.
+    """
+    domain_id = policy.get('domain_id')
+    if domain_id is None:
+        return None
+    try:
+        matches = near_duplicates.find(signature, exclude=policy['id'])
+    except Exception as e:
+        logger.warning("Near-duplicate lookup failed for policy %s: %s", policy['id'], e)
+        return None
+    for match, similarity in matches:
+        source = Policy.get_by_id(match['policy_id'])
+        # A checksum mismatch means the source changed since its signature was stored
+        if not source or source.get('checksum') != match['checksum'] or str(source.get('domain_id')) != str(domain_id):
+            continue
+        source_result = get_stored_analysis(source, llm_config)
+        if source_result is not None:
+            near_duplicate_stats.hit()
+            return source, source_result, similarity
+    near_duplicate_stats.miss()
+    return None
+
+
+def result_entry(policy_id: Any, checksum: str, analysis_result: Dict[str, Any],
+                 llm_config: Dict[str, Any]) -> Dict[str, Any]:
+    """PolicyResult.save_many entry for an analysis of the content with ``checksum`` produced with ``llm_config``."""
+    return {
+        'policy_id': policy_id,
+        'checksum': checksum,
+        'llm_details': describe_llm(llm_config),
+        'prompt': llm_config['default_prompt'],
+        'analysis': analysis_result
+    }
+
+
+async def _reuse_near_duplicate(policy: Dict[str, Any], content: str, checksum: str, signature: List[int],
+                                llm_config: Dict[str, Any], fetched: FetchResult,
+                                stage: Callable[[str], None]) -> Optional[Dict[str, Any]]:
+    # Builds on the analysis of an already processed policy of the same domain with nearly the
+    # same text, e.g. one policy published under several URLs or in regional variants; only the
+    # sections that differ are analyzed
+    policy_id = policy['id']
+    found = find_near_duplicate(policy, signature, llm_config)
+    if found is None:
+        return None
+    source, _, similarity = found
+    stage('deduplicated')
+    update = await analyze_near_duplicate(policy, content, checksum, source)
+    if update is None or update.failed:
+        logger.info("Policy %s is a near-duplicate of policy %s (similarity %.3f) but its analysis can't be "
+                    "adapted; analyzing in full.", policy_id, source['id'], similarity)
+        return None
+    logger.info("Policy %s is a near-duplicate of policy %s (similarity %.3f); reused its analysis, "
+                "analyzing %s changed chars.", policy_id, source['id'], similarity, update.analyzed_chars)
+    PolicyResult.save_many([result_entry(policy_id, checksum, update.result, llm_config)])
+    Policy.update(policy_id, {
+        'processing_status': 'processed',
+        'last_updated_at': datetime.utcnow().isoformat(),
+        'checksum': checksum,
+        **fetched.validators()
+    })
+    _index_signature(policy_id, checksum, signature)
+    record_update(update)
+    return {'policy_id': policy_id, 'processing_status': 'processed', 'analysis': update.result,
+            'cached': not update.analyzed_chars, 'reused_from': source['id'], 'similarity': round(similarity, 4),
+            'change': {'mode': update.change['mode'], 'analyzed_chars': update.analyzed_chars}}
+
+
+def _index_signature(policy_id: str, checksum: str, signature: List[int]) -> None:
+    try:
+        near_duplicates.add(policy_id, checksum, signature)
+    except Exception as e:
+        # The analysis is already saved; the policy just won't be found as a near-duplicate
+        logger.warning("Failed to index signature of policy %s: %s", policy_id, e)
+
+
+def _copy_analysis(source_policy_id: str, policy_id: str) -> None:
+    source = Policy.get_by_id(source_policy_id)
+    if source:
+        if source.get('checksum'):
+            PolicyResult.copy(source_policy_id, source['checksum'], policy_id)
+        Policy.update(policy_id, {column: source.get(column) for column in ANALYSIS_COLUMNS})
+
+
+def _record_shared_failure(policy_id: str, error: PipelineError) -> None:
+    try:
+        Policy.update(policy_id, {'processing_status': error.processing_status})
+    except Exception as update_e:
+        logger.error("Failed to update policy status to %s for %s: %s", error.processing_status, policy_id, update_e)
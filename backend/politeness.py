@@ -0,0 +1,237 @@
+import logging
+import socket
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, Any, Deque, Callable, List, Tuple
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+from cache import TTLCache
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class _HostState:
+    __slots__ = ('active', 'ready_at', 'waiters')
+
+    def __init__(self):
+        self.active = 0
+        self.ready_at = 0.0
+        self.waiters: Deque['_Ticket'] = deque()
+
+
+class _Ticket:
+    __slots__ = ('host', 'delay', 'granted')
+
+    def __init__(self, host: str, delay: float):
+        self.host = host
+        self.delay = delay
+        self.granted = False
+
+
+class HostScheduler:
+    """
+    Hands out fetch slots across threads with politeness limits.
+
+    Limits: at most ``max_per_host`` requests in flight to one host, at
+    least ``delay`` seconds between request starts to the same host, and at
+    most ``max_connections`` requests in flight overall. Free slots go
+    round-robin across hosts with waiters, so a batch of URLs on one site
+    can't starve fetches for other sites.
+    """
+
+    def __init__(self, max_connections: int = 32, max_per_host: int = 2, delay: float = 1.0):
+        self.max_connections = max(1, max_connections)
+        self.max_per_host = max(1, max_per_host)
+        self.delay = delay
+        self._cond = threading.Condition()
+        self._hosts: Dict[str, _HostState] = {}
+        self._ring: Deque[str] = deque()  # hosts with waiters, in round-robin order
+        self._active = 0
+
+    def acquire(self, host: str, delay: Optional[float] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until a slot for ``host`` is granted; returns False if ``timeout`` passes first.
+
+        Args:
+            host: Host name the request goes to.
+            delay: Minimum seconds between request starts to this host, if
+                larger than the scheduler default (e.g. a robots.txt Crawl-delay).
+            timeout: Maximum seconds to wait for a slot.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = _Ticket(host, max(self.delay, delay or 0.0))
+        with self._cond:
+            state = self._hosts.setdefault(host, _HostState())
+            state.waiters.append(ticket)
+            if len(state.waiters) == 1:
+                self._ring.append(host)
+            while True:
+                wake_at = self._dispatch()
+                if ticket.granted:
+                    return True
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    self._withdraw(ticket)
+                    return False
+                wake_times = [t for t in (wake_at, deadline) if t is not None]
+                self._cond.wait(max(0.0, min(wake_times) - now) if wake_times else None)
+
+    def release(self, host: str) -> None:
+        with self._cond:
+            state = self._hosts[host]
+            state.active -= 1
+            self._active -= 1
+            if len(self._hosts) > 1024:
+                self._prune(time.monotonic())
+            self._cond.notify_all()
+
+    def slot(self, host: str, delay: Optional[float] = None, timeout: Optional[float] = None) -> '_Slot':
+        """Context manager form of acquire()/release(); check ``.acquired`` inside the block."""
+        return _Slot(self, host, delay, timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'active': self._active,
+                'hosts': len(self._hosts),
+                'waiting': sum(len(state.waiters) for state in self._hosts.values())
+            }
+
+    def _dispatch(self) -> Optional[float]:
+        # Caller must hold self._cond. Grants as many head-of-line tickets as
+        # the limits allow, one per host per pass; returns when the next
+        # host delay expires if some host is only waiting on that.
+        granted_any = False
+        wake_at = None
+        progress = True
+        while progress and self._active < self.max_connections:
+            progress = False
+            now = time.monotonic()
+            for _ in range(len(self._ring)):
+                host = self._ring[0]
+                self._ring.rotate(-1)
+                state = self._hosts[host]
+                if state.active >= self.max_per_host:
+                    continue
+                if state.ready_at > now:
+                    wake_at = state.ready_at if wake_at is None else min(wake_at, state.ready_at)
+                    continue
+                ticket = state.waiters.popleft()
+                ticket.granted = True
+                state.active += 1
+                state.ready_at = now + ticket.delay
+                self._active += 1
+                granted_any = progress = True
+                if not state.waiters:
+                    self._ring.remove(host)
+                if self._active >= self.max_connections:
+                    break
+        if granted_any:
+            self._cond.notify_all()
+        return wake_at
+
+    def _prune(self, now: float) -> None:
+        # Caller must hold self._cond. Forgets hosts with nothing in flight or queued whose delay has passed.
+        for host in [host for host, state in self._hosts.items()
+                     if not state.active and not state.waiters and state.ready_at <= now]:
+            del self._hosts[host]
+
+    def _withdraw(self, ticket: _Ticket) -> None:
+        # Caller must hold self._cond
+        state = self._hosts[ticket.host]
+        state.waiters.remove(ticket)
+        if not state.waiters:
+            self._ring.remove(ticket.host)
+
+
+class _Slot:
+    def __init__(self, scheduler: HostScheduler, host: str, delay: Optional[float], timeout: Optional[float]):
+        self.scheduler = scheduler
+        self.host = host
+        self.delay = delay
+        self.timeout = timeout
+        self.acquired = False
+
+    def __enter__(self) -> '_Slot':
+        self.acquired = self.scheduler.acquire(self.host, self.delay, self.timeout)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.acquired:
+            self.scheduler.release(self.host)
+
+
+class RobotsCache:
+    """
+    Cached robots.txt rules per origin (scheme://host[:port]).
+
+    Rules are cached for ``ttl`` seconds. Following RFC 9309, a 4xx
+    robots.txt allows everything. A 5xx or unreachable one disallows
+    everything, and that result is cached only for ``error_ttl`` seconds.
+
+    Args:
+        fetch: Function taking a URL and returning (status_code, text), or
+            raising on network errors.
+        user_agent: Product token matched against User-agent lines.
+    """
+
+    def __init__(self, fetch: Callable[[str], Any], user_agent: str, ttl: float = 3600,
+                 error_ttl: float = 300, maxsize: int = 10000):
+        self.fetch = fetch
+        self.user_agent = user_agent
+        self.cache = TTLCache('robots', maxsize=maxsize, ttl=ttl, negative_ttl=error_ttl)
+
+    def _rules(self, url: str) -> Optional[RobotFileParser]:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+
+        def load() -> Optional[RobotFileParser]:
+            robots_url = f"{origin}/robots.txt"
+            try:
+                status_code, text = self.fetch(robots_url)
+            except Exception as e:
+                logger.warning("Could not fetch %s: %s", robots_url, e)
+                return None
+            if status_code >= 500:
+                logger.warning("%s returned %s; treating site as disallowed for now", robots_url, status_code)
+                return None
+            parser = RobotFileParser(robots_url)
+            if status_code >= 400:
+                parser.allow_all = True
+            else:
+                parser.parse(text.splitlines())
+            return parser
+
+        return self.cache.get_or_load(origin, load)
+
+    def allowed(self, url: str) -> bool:
+        rules = self._rules(url)
+        return rules is not None and rules.can_fetch(self.user_agent, url)
+
+    def crawl_delay(self, url: str) -> Optional[float]:
+        rules = self._rules(url)
+        delay = rules.crawl_delay(self.user_agent) if rules is not None else None
+        return float(delay) if delay is not None else None
+
+
+class DNSCache:
+    """
+    Caches getaddrinfo answers for the fetcher's own connections (see fetcher.DNSCachingAdapter).
+
+    Nothing else in the process is affected. getaddrinfo doesn't report
+    record TTLs, so answers are kept for a fixed ``ttl``; callers drop an
+    answer early with forget() when none of its addresses accept a
+    connection. Failed lookups are not cached.
+    """
+
+    def __init__(self, ttl: float = 60, maxsize: int = 10000):
+        self.cache = TTLCache('dns', maxsize=maxsize, ttl=ttl, negative_ttl=0)
+
+    def resolve(self, host: str, port: int) -> List[Tuple[Any, ...]]:
+        return self.cache.get_or_load((host, port), lambda: socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM))
+
+    def forget(self, host: str, port: int) -> None:
+        self.cache.invalidate((host, port))
@@ -0,0 +1,107 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional, Deque, Tuple
+
+
+class Semaphore:
+    """
+    Async semaphore that can be shared across threads and event loops.
+
+    asyncio.Semaphore is bound to a single loop, but analysis workers each
+    run their own loop; this one hands permits to waiters on any loop.
+    """
+
+    def __init__(self, value: int):
+        self._value = max(1, value)
+        self.limit = self._value
+        self._lock = threading.Lock()
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._value > 0 and not self._waiters:
+                self._value -= 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            if waiter[1].done() and not waiter[1].cancelled():
+                # Granted just before the cancellation landed: the permit is ours, pass it on
+                self.release()
+            # If the permit was handed over but not granted yet, _grant() sees the
+            # cancelled future and passes the permit on
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._waiters:
+                self._value += 1
+                return
+            loop, future = self._waiters.popleft()
+        loop.call_soon_threadsafe(self._grant, future)
+
+    def _grant(self, future: asyncio.Future) -> None:
+        if future.done():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def in_use(self) -> int:
+        with self._lock:
+            return self.limit - self._value
+
+    async def __aenter__(self) -> 'Semaphore':
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at ``rate`` tokens per second.
+
+    ``acquire`` reserves tokens immediately (the balance may go negative) and
+    sleeps until the reservation is covered, so waiters are served in order
+    without polling.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """Reserves ``amount`` tokens and returns how long to wait before using them."""
+        if self.rate <= 0:
+            return 0.0
+        # A request larger than the bucket can never be covered; cap it to one full bucket
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        delay = self.reserve(amount)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with full jitter for the given 0-based retry attempt."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,266 @@
+"""
+Background re-crawl scheduler.
+
+Keeps analyses fresh before users ask for them by re-running the analysis
+pipeline for policies that were never analyzed, have gone stale, failed a
+while ago, or have been 'processing' for too long. Run it as its own service (from backend/):
+
+    python recrawl.py
+
+Work is picked in priority order (recent visits to the domain, then age),
+with at most one fetch in flight per host and a minimum delay between
+fetches to the same host. Global caps limit policies per minute and the
+LLM spend per hour. Unchanged pages cost no LLM call: the pipeline
+revalidates with ETag/Last-Modified and compares content checksums. Changed
+pages usually only send their changed sections (see snapshots.py).
+"""
+import logging
+import math
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urlsplit
+
+from models import Domain, Policy, UserHistory
+from pipeline import analyze_policy_url
+from jobs import Job, JobQueue, QueueFullError, JOB_COMPLETED
+from ratelimit import TokenBucket
+from chunking import CHARS_PER_TOKEN
+from logging_config import setup_logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PENDING_STATUSES = ['not_processed']
+STALE_STATUSES = ['processed']
+FAILED_STATUSES = ['failed_fetch', 'failed_analysis']
+# Left behind by a worker or ingest that died mid-analysis
+STUCK_STATUSES = ['processing']
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """Parses a stored timestamp into naive UTC, like datetime.utcnow()."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class RecrawlScheduler:
+    """
+    Picks pending and stale policies and queues them for analysis within the configured caps.
+
+    Args:
+        job_queue: Queue whose handler runs the analysis pipeline for a
+            ``policy_id``/``url`` payload.
+        max_age_hours: Processed policies older than this are refreshed.
+        failed_retry_hours: Failed policies are retried after this long.
+        stuck_minutes: Policies still 'processing' after this long are
+            assumed abandoned and picked up again.
+        policies_per_minute: Global cap on policies dispatched.
+        max_in_flight: Policies being processed at once.
+        host_delay: Minimum seconds between fetches to the same host.
+        max_analyses_per_hour: LLM analyses (checksum changed) per hour; 0 for no cap.
+        max_tokens_per_hour: Estimated LLM prompt tokens per hour; 0 for no cap.
+        batch_size: Candidates loaded per status group on each refresh, once
+            from all domains and once from the most visited ones.
+        popular_domains: How many of the most visited domains get their due
+            policies loaded separately, so they are picked first even when
+            the backlog of older policies is larger than ``batch_size``.
+        poll_interval: Seconds between candidate refreshes when idle.
+    """
+
+    def __init__(self, job_queue: JobQueue, max_age_hours: float = 168, failed_retry_hours: float = 24,
+                 stuck_minutes: float = 30, policies_per_minute: float = 30, max_in_flight: int = 4, host_delay: float = 10.0,
+                 max_analyses_per_hour: float = 60, max_tokens_per_hour: float = 0,
+                 batch_size: int = 200, popular_domains: int = 100, poll_interval: float = 30.0):
+        self.job_queue = job_queue
+        self.max_age = timedelta(hours=max_age_hours)
+        self.failed_retry = timedelta(hours=failed_retry_hours)
+        self.stuck_after = timedelta(minutes=stuck_minutes)
+        self.max_in_flight = max(1, max_in_flight)
+        self.host_delay = host_delay
+        self.batch_size = batch_size
+        self.popular_domains = popular_domains
+        self.poll_interval = poll_interval
+        self.throughput = TokenBucket(policies_per_minute / 60.0, capacity=max(1, policies_per_minute / 6.0))
+        # Spent after the fact, once a job reports whether it needed the LLM;
+        # dispatching pauses while either bucket is in debt
+        self.analysis_budget = TokenBucket(max_analyses_per_hour / 3600.0, capacity=max(1, max_analyses_per_hour))
+        self.token_budget = TokenBucket(max_tokens_per_hour / 3600.0, capacity=max(1, max_tokens_per_hour))
+        self._in_flight: Dict[str, Tuple[Job, str, Dict[str, Any]]] = {}
+        self._host_ready_at: Dict[str, float] = {}
+        self._backlog: List[Dict[str, Any]] = []
+        self._next_refresh = 0.0
+        self._stop = threading.Event()
+        self.stats = {'dispatched': 0, 'analyzed': 0, 'unchanged': 0, 'failed': 0}
+
+    def candidates(self) -> List[Dict[str, Any]]:
+        """Loads pending, stale, retryable failed and stuck policies, highest priority first."""
+        now = datetime.utcnow()
+        popular = UserHistory.get_popular_domains(self.popular_domains) if self.popular_domains > 0 else []
+        # The oldest due policies only fill batch_size; the most visited domains' due
+        # policies are loaded on their own so an old backlog can't crowd them out
+        scopes = [None, [row['domain_id'] for row in popular]] if popular else [None]
+        policies = {}
+        for statuses, cutoff in ((PENDING_STATUSES, now), (STALE_STATUSES, now - self.max_age),
+                                 (FAILED_STATUSES, now - self.failed_retry),
+                                 (STUCK_STATUSES, now - self.stuck_after)):
+            for domain_ids in scopes:
+                for policy in Policy.list_due(statuses, cutoff.isoformat(), limit=self.batch_size,
+                                              domain_ids=domain_ids):
+                    policies[str(policy['id'])] = policy
+        popularity = {str(row['domain_id']): row['visits'] for row in popular}
+        popularity.update(UserHistory.get_domain_popularity(
+            {policy['domain_id'] for policy in policies.values() if str(policy['domain_id']) not in popularity}))
+        return sorted(
+            policies.values(),
+            key=lambda policy: self.priority(policy, popularity.get(str(policy['domain_id']), 0), now),
+            reverse=True
+        )
+
+    def priority(self, policy: Dict[str, Any], visits: int, now: datetime) -> float:
+        """
+        Higher is sooner. Visits count on a log scale and age in units of
+        max_age. Never-analyzed policies get a bonus, since users see
+        nothing for them until they run.
+        """
+        updated_at = _parse_timestamp(policy.get('last_updated_at'))
+        age = min((now - updated_at) / self.max_age, 10.0) if updated_at else 10.0
+        score = math.log1p(visits) + age
+        if policy.get('processing_status') in PENDING_STATUSES:
+            score += 1.0
+        return score
+
+    def budget_exhausted(self) -> bool:
+        return self.analysis_budget.reserve(0) > 0 or self.token_budget.reserve(0) > 0
+
+    def run_forever(self) -> None:
+        logger.info("Re-crawl scheduler started (max %s in flight, %.1fs per-host delay)",
+                    self.max_in_flight, self.host_delay)
+        while not self._stop.is_set():
+            self.run_once()
+            idle = not self._backlog and not self._in_flight
+            self._stop.wait(self.poll_interval if idle else 1.0)
+        logger.info("Re-crawl scheduler stopped: %s", self.stats)
+
+    def run_once(self) -> int:
+        """Collects finished jobs, refreshes the backlog if due, and dispatches what the limits allow."""
+        self._collect_finished()
+        if self.budget_exhausted():
+            logger.info("LLM budget exhausted; pausing re-crawl dispatch")
+            return 0
+        if time.monotonic() >= self._next_refresh:
+            self._backlog = [p for p in self.candidates() if str(p['id']) not in self._in_flight]
+            self._next_refresh = time.monotonic() + self.poll_interval
+            if self._backlog:
+                logger.info("Re-crawl backlog: %s policies due", len(self._backlog))
+        return self._dispatch()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _dispatch(self) -> int:
+        dispatched = 0
+        busy_hosts = {host for _, host, _ in self._in_flight.values()}
+        remaining = []
+        for policy in self._backlog:
+            host = urlsplit(policy['page_url']).hostname or ''
+            if self._stop.is_set() or len(self._in_flight) >= self.max_in_flight or self.budget_exhausted() \
+                    or host in busy_hosts or self._host_ready_at.get(host, 0.0) > time.monotonic():
+                remaining.append(policy)
+                continue
+            delay = self.throughput.reserve(1)
+            if delay and self._stop.wait(delay):
+                remaining.append(policy)
+                continue
+            try:
+                job = self.job_queue.submit(dedupe_key=str(policy['id']), policy_id=policy['id'],
+                                            url=policy['page_url'])
+            except QueueFullError as e:
+                logger.warning("Re-crawl queue unavailable: %s", e)
+                remaining.append(policy)
+                continue
+            self._in_flight[str(policy['id'])] = (job, host, policy)
+            self._host_ready_at[host] = time.monotonic() + self.host_delay
+            busy_hosts.add(host)
+            dispatched += 1
+        if self._backlog and not remaining:
+            # Everything loaded was dispatched; more may be due right away
+            self._next_refresh = 0.0
+        self._backlog = remaining
+        self.stats['dispatched'] += dispatched
+        return dispatched
+
+    def _collect_finished(self) -> None:
+        for policy_id, (job, host, policy) in list(self._in_flight.items()):
+            if not job.finished:
+                continue
+            del self._in_flight[policy_id]
+            if job.status != JOB_COMPLETED:
+                self.stats['failed'] += 1
+                continue
+            result = job.result or {}
+            if result.get('cached'):
+                self.stats['unchanged'] += 1
+            else:
+                self.stats['analyzed'] += 1
+                self.analysis_budget.reserve(1)
+                # Incremental re-analyses only send the changed sections to the LLM
+                extraction = result.get('extraction') or {}
+                analyzed_chars = (result.get('change') or {}).get('analyzed_chars', extraction.get('output_chars', 0))
+                self.token_budget.reserve(analyzed_chars / CHARS_PER_TOKEN)
+            if policy.get('processing_status') in PENDING_STATUSES + STUCK_STATUSES:
+                self._settle_domain(policy['domain_id'])
+
+    def _settle_domain(self, domain_id: Any) -> None:
+        # A domain left 'pending_analysis' by /save-policies is done once none of its policies are
+        # unprocessed or still being processed
+        remaining = any(Policy.list_page(limit=1, columns='id', domain_id=domain_id, processing_status=status)
+                        for status in PENDING_STATUSES + STUCK_STATUSES)
+        if not remaining:
+            Domain.update(domain_id, {'processing_status': 'processed',
+                                      'updated_at': datetime.utcnow().isoformat()})
+
+
+async def run_recrawl_job(job: Job) -> Dict[str, Any]:
+    return await analyze_policy_url(job.payload['policy_id'], job.payload['url'], on_stage=job.set_stage)
+
+
+def main() -> None:
+    setup_logging()
+    max_in_flight = int(os.getenv('RECRAWL_MAX_IN_FLIGHT', 4))
+    job_queue = JobQueue(run_recrawl_job, num_workers=max_in_flight, max_queue_size=max_in_flight * 2,
+                         name='recrawl-worker')
+    scheduler = RecrawlScheduler(
+        job_queue,
+        max_age_hours=float(os.getenv('RECRAWL_MAX_AGE_HOURS', 168)),
+        failed_retry_hours=float(os.getenv('RECRAWL_FAILED_RETRY_HOURS', 24)),
+        stuck_minutes=float(os.getenv('RECRAWL_STUCK_MINUTES', 30)),
+        policies_per_minute=float(os.getenv('RECRAWL_POLICIES_PER_MINUTE', 30)),
+        max_in_flight=max_in_flight,
+        host_delay=float(os.getenv('RECRAWL_HOST_DELAY', 10)),
+        max_analyses_per_hour=float(os.getenv('RECRAWL_MAX_ANALYSES_PER_HOUR', 60)),
+        max_tokens_per_hour=float(os.getenv('RECRAWL_MAX_TOKENS_PER_HOUR', 0)),
+        batch_size=int(os.getenv('RECRAWL_BATCH_SIZE', 200)),
+        popular_domains=int(os.getenv('RECRAWL_POPULAR_DOMAINS', 100)),
+        poll_interval=float(os.getenv('RECRAWL_POLL_INTERVAL', 30))
+    )
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: scheduler.stop())
+    try:
+        scheduler.run_forever()
+    finally:
+        job_queue.stop(timeout=float(os.getenv('ANALYSIS_DRAIN_TIMEOUT', 60)))
+
+
+if __name__ == '__main__':
+    main()
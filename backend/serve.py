@@ -0,0 +1,121 @@
+"""
+Production server for the backend: gunicorn with threaded workers.
+
+Usage (from backend/):
+    python serve.py
+
+Settings come from the environment:
+    HOST, PORT                 Bind address (default 0.0.0.0:8000)
+    WEB_WORKERS                Worker processes (default 1; see below before raising it)
+    WEB_CLIENT_AFFINITY        "true" if the load balancer routes each client to one
+                               worker process; required for WEB_WORKERS > 1
+    WEB_THREADS                Request threads per worker (default 32)
+    WEB_WORKER_CLASS           gunicorn worker class (default gthread)
+    WEB_WORKER_CONNECTIONS     Max concurrent clients per worker for gevent/eventlet workers
+    WEB_BACKLOG                Pending connections queued by the OS (default 2048)
+    WEB_TIMEOUT                Seconds before a silent worker is restarted (default 120)
+    WEB_KEEPALIVE              Keep-alive seconds (default 5)
+    WEB_MAX_REQUESTS           Recycle a worker after this many requests (default 0, never)
+    ANALYSIS_DRAIN_TIMEOUT     Seconds a stopping worker waits for analyses (default 60)
+    SHUTDOWN_READY_GRACE       Seconds a stopping worker keeps serving with /readyz
+                               failing, so load balancers stop sending traffic (default 5)
+
+Request handlers are short Supabase calls; analyses run on each worker's
+analysis job queue (see app.analysis_jobs), whose threads each own an event
+loop. So one process serves WEB_THREADS requests at once while up to
+ANALYSIS_WORKERS analyses await fetches and the LLM in the background.
+
+Each worker process has its own job registry, in-flight analysis
+coalescing and LLM rate limiters: /jobs/<id> only knows jobs submitted to
+the same process, and the per-model requests/tokens per minute in
+llm_config.py apply per process. So the server refuses to start with
+WEB_WORKERS > 1 unless WEB_CLIENT_AFFINITY=true confirms that each client
+is routed to the same process.
+
+On SIGTERM a worker first stops taking new analyses and fails /readyz
+while it keeps serving for SHUTDOWN_READY_GRACE seconds. Then it stops
+accepting connections, finishes in-flight requests and drains its
+analysis queue, waiting up to ANALYSIS_DRAIN_TIMEOUT seconds, before it
+exits. Health checks: /healthz (liveness) and /readyz (readiness; 503
+from SIGTERM until exit).
+"""
+import os
+import signal
+import sys
+import threading
+
+from gunicorn.app.base import BaseApplication
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def gunicorn_options():
+    drain_timeout = float(os.environ.get('ANALYSIS_DRAIN_TIMEOUT', 60))
+    ready_grace = float(os.environ.get('SHUTDOWN_READY_GRACE', 5))
+    options = {
+        'bind': f"{os.environ.get('HOST', '0.0.0.0')}:{_env_int('PORT', 8000)}",
+        'workers': _env_int('WEB_WORKERS', 1),
+        'threads': _env_int('WEB_THREADS', 32),
+        'worker_class': os.environ.get('WEB_WORKER_CLASS', 'gthread'),
+        'backlog': _env_int('WEB_BACKLOG', 2048),
+        'timeout': _env_int('WEB_TIMEOUT', 120),
+        'keepalive': _env_int('WEB_KEEPALIVE', 5),
+        'max_requests': _env_int('WEB_MAX_REQUESTS', 0),
+        'max_requests_jitter': _env_int('WEB_MAX_REQUESTS', 0) // 10,
+        # Leave time for the readiness grace and the analysis drain before gunicorn kills the worker
+        'graceful_timeout': int(ready_grace + drain_timeout) + 10,
+        'post_worker_init': _drain_on_sigterm(ready_grace),
+        'worker_exit': worker_exit,
+    }
+    if 'WEB_WORKER_CONNECTIONS' in os.environ:
+        options['worker_connections'] = _env_int('WEB_WORKER_CONNECTIONS', 1000)
+    return options
+
+
+def check_workers(options):
+    """Refuses more than one worker process unless clients are pinned to a process."""
+    if options['workers'] > 1 and os.environ.get('WEB_CLIENT_AFFINITY', 'false').lower() not in ['true', '1', 't']:
+        sys.exit(f"WEB_WORKERS={options['workers']}: analysis jobs live in process memory, so /jobs/<id> "
+                 "polling fails when a client reaches another worker. Use one worker, or set "
+                 "WEB_CLIENT_AFFINITY=true if the load balancer routes each client to the same process.")
+
+
+def _drain_on_sigterm(ready_grace):
+    def post_worker_init(worker):
+        """gunicorn hook: on SIGTERM, fail /readyz and refuse new analyses before the worker stops serving."""
+        def handle_term(sig, frame):
+            from app import begin_drain
+            begin_drain()
+            threading.Timer(ready_grace, worker.handle_exit, (sig, frame)).start()
+        signal.signal(signal.SIGTERM, handle_term)
+    return post_worker_init
+
+
+def worker_exit(server, worker):
+    """gunicorn hook, run in the worker after it stops serving: finish analyses and write buffered visits."""
+    from app import drain_analysis_jobs
+    drain_analysis_jobs()
+
+
+class PolicyAnalyzerApplication(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        # Imported per worker, so every process gets its own Supabase client and job queue
+        from app import app
+        return app
+
+
+if __name__ == '__main__':
+    options = gunicorn_options()
+    check_workers(options)
+    PolicyAnalyzerApplication(options).run()
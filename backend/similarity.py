@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import os
+import re
+from typing import Optional, Dict, Any, List, Set, Tuple
+
+from models import PolicySignature
+from cache import CacheStats
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r'\w+')
+
+# Policies whose text nearly matches an already analyzed policy build on its
+# analysis, sending only the sections that differ to the model
+near_duplicate_stats = CacheStats('near_duplicates')
+
+
+def shingles(text: str, size: int = 5) -> Set[str]:
+    """Overlapping ``size``-word sequences of the lowercased text, ignoring punctuation and spacing."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _hash64(value: str) -> int:
+    # Stable across processes, unlike hash(); signatures are stored
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class MinHasher:
+    """
+    MinHash signatures and LSH band buckets for policy text.
+
+    Uses one-permutation hashing: each shingle is hashed once and only
+    kept if it is the minimum of its bin, so a signature costs one hash per
+    shingle instead of one per shingle per permutation. Empty bins are
+    filled from the next non-empty bin (rotation densification), which
+    keeps the fraction of equal bins an unbiased estimate of the Jaccard
+    similarity.
+
+    Signatures are split into ``bands`` bands of ``num_perm / bands`` rows.
+    Two policies land in the same bucket for some band with probability
+    1 - (1 - J^rows)^bands. With the defaults (16 bands of 8 rows) that is
+    above 99.9% at J = 0.9 and about 6% at J = 0.5.
+
+    Signatures and buckets are persisted, so changing any of these
+    parameters requires re-indexing the stored policies.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, shingle_words: int = 5):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_words = shingle_words
+
+    def signature(self, text: str) -> List[int]:
+        """MinHash signature of ``text``; empty if the text has no words."""
+        bins: List[Optional[int]] = [None] * self.num_perm
+        for shingle in shingles(text, self.shingle_words):
+            hashed = _hash64(shingle)
+            index = hashed % self.num_perm
+            value = hashed >> 32
+            if bins[index] is None or value < bins[index]:
+                bins[index] = value
+        filled = [i for i, value in enumerate(bins) if value is not None]
+        if not filled:
+            return []
+        signature = []
+        for i, value in enumerate(bins):
+            distance = 0
+            while value is None:
+                distance += 1
+                value = bins[(i + distance) % self.num_perm]
+            # Offset borrowed values so they can't collide with the source bin's own value
+            signature.append(value + (distance << 32))
+        return signature
+
+    def buckets(self, signature: List[int]) -> List[int]:
+        """One bucket key per band (positive 63-bit ints, so they fit a bigint column)."""
+        if not signature:
+            return []
+        return [
+            _hash64(f"{band}:" + ','.join(map(str, signature[band * self.rows:(band + 1) * self.rows]))) >> 1
+            for band in range(self.bands)
+        ]
+
+    @staticmethod
+    def similarity(a: List[int], b: List[int]) -> float:
+        """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+        if not a or len(a) != len(b):
+            return 0.0
+        return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+class NearDuplicateIndex:
+    """
+    Finds stored policies whose text is nearly identical to a new one.
+
+    Lookups read only the LSH buckets of the new signature, so they cost
+    two queries however many policies are indexed. Candidates are then
+    checked against the estimated similarity, and those below ``threshold``
+    are dropped.
+    """
+
+    def __init__(self, hasher: Optional[MinHasher] = None, threshold: float = 0.95, max_candidates: int = 20,
+                 enabled: bool = True):
+        self.hasher = hasher or MinHasher()
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.enabled = enabled
+
+    def signature(self, text: str) -> List[int]:
+        return self.hasher.signature(text)
+
+    def find(self, signature: List[int], exclude: Optional[Any] = None) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Returns (signature row, similarity) pairs at or above the threshold, most similar first.
+
+        Rows have policy_id and the checksum of the text the signature was
+        computed from. ``exclude`` is a policy ID to leave out, normally
+        the policy being analyzed.
+        """
+        rows = PolicySignature.find_by_buckets(self.hasher.buckets(signature), limit=self.max_candidates)
+        matches = []
+        for row in rows:
+            if exclude is not None and str(row['policy_id']) == str(exclude):
+                continue
+            similarity = self.hasher.similarity(signature, row['signature'])
+            if similarity >= self.threshold:
+                matches.append((row, similarity))
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return matches
+
+    def add(self, policy_id: Any, checksum: str, signature: List[int]) -> None:
+        self.add_many([(policy_id, checksum, signature)])
+
+    def add_many(self, entries: List[Tuple[Any, str, List[int]]]) -> None:
+        """Indexes several (policy_id, checksum, signature) entries at once."""
+        PolicySignature.save_many([(policy_id, checksum, signature, self.hasher.buckets(signature))
+                                   for policy_id, checksum, signature in entries if signature])
+
+
+near_duplicates = NearDuplicateIndex(
+    threshold=float(os.getenv('NEAR_DUPLICATE_THRESHOLD', 0.95)),
+    max_candidates=int(os.getenv('NEAR_DUPLICATE_MAX_CANDIDATES', 20)),
+    enabled=os.getenv('NEAR_DUPLICATE_REUSE', 'true').lower() in ['true', '1', 't']
+)
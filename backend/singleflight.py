@@ -0,0 +1,62 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Dict, Any, Callable, Awaitable, Hashable, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one execution.
+
+    The first caller for a key (the leader) runs the coroutine; callers that
+    arrive while it is in flight wait for and share its outcome. Works
+    across threads and event loops, so analysis workers running in
+    separate threads are coalesced too.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, concurrent.futures.Future] = {}
+        self.shared = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Runs ``factory()`` unless a call for ``key`` is already in flight.
+
+        Returns:
+            Tuple of (result, shared) where shared is True if the result
+            came from another caller's execution.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._calls[key] = future
+            else:
+                self.shared += 1
+
+        if not leader:
+            logger.info("Joining in-flight '%s' call for %s", self.name, key)
+            return await asyncio.wrap_future(future), True
+
+        try:
+            result = await factory()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
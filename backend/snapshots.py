@@ -0,0 +1,288 @@
+import logging
+import os
+from typing import Optional, Dict, Any, List
+
+from models import PolicySnapshot, PolicyChange
+from analysis import perform_analysis, merge_analysis_results
+from chunking import split_into_sections
+from cache import content_checksum
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+INCREMENTAL_ANALYSIS = os.getenv('INCREMENTAL_ANALYSIS', 'true').lower() in ['true', '1', 't']
+# Re-analyze the whole policy once this fraction of it has changed since its last full analysis
+INCREMENTAL_MAX_CHANGE = float(os.getenv('INCREMENTAL_MAX_CHANGE', 0.3))
+# ... or once its analysis is merged from this many incremental parts
+INCREMENTAL_MAX_PARTS = int(os.getenv('INCREMENTAL_MAX_PARTS', 8))
+SNAPSHOT_HISTORY = int(os.getenv('SNAPSHOT_HISTORY', 5))
+
+# Categories holding the company's contact details; cleared from reused near-duplicate parts whose sections changed
+ENTITY_CATEGORIES = ('contact',)
+
+EXCERPT_NOTE = ("The content below is an excerpt: only the sections of the policy that were added or changed "
+                "since it was last analyzed. Analyze only this excerpt.")
+
+
+def segment(text: str) -> List[Dict[str, Any]]:
+    """Splits policy text into sections, each with a content hash, its heading line and size."""
+    sections = []
+    for section in split_into_sections(text):
+        heading = next((line.strip() for line in section.split('\n') if line.strip()), '')
+        sections.append({
+            'hash': content_checksum(section)[:16],
+            'heading': heading[:200],
+            'chars': len(section),
+            'text': section
+        })
+    return sections
+
+
+class SectionDiff:
+    """
+    Section-level difference between two versions of a policy.
+
+    Sections are matched by content hash, so moving a section is not a
+    change. A new section whose heading matches a section that is gone
+    counts as modified, and otherwise as added.
+    """
+
+    def __init__(self, old: List[Dict[str, Any]], new: List[Dict[str, Any]]):
+        old_hashes = {section['hash'] for section in old}
+        new_hashes = {section['hash'] for section in new}
+        gone = [section for section in old if section['hash'] not in new_hashes]
+        gone_headings = {section['heading'] for section in gone}
+        changed = [section for section in new if section['hash'] not in old_hashes]
+        self.added = [section for section in changed if section['heading'] not in gone_headings]
+        self.modified = [section for section in changed if section['heading'] in gone_headings]
+        modified_headings = {section['heading'] for section in self.modified}
+        self.removed = [section for section in gone if section['heading'] not in modified_headings]
+        self.gone_hashes = {section['hash'] for section in gone}
+        self.changed = changed
+        self.changed_chars = sum(section['chars'] for section in changed) \
+            + sum(section['chars'] for section in self.removed)
+        self.total_chars = sum(section['chars'] for section in new)
+
+    def to_dict(self) -> Dict[str, Any]:
+        def describe(sections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            return [{'heading': section['heading'], 'chars': section['chars']} for section in sections]
+
+        return {
+            'added': describe(self.added),
+            'modified': describe(self.modified),
+            'removed': describe(self.removed),
+            'changed_chars': self.changed_chars,
+            'total_chars': self.total_chars
+        }
+
+
+class AnalysisUpdate:
+    """Outcome of analyze_policy_text: the analysis to store, plus the snapshot and changelog entry to record."""
+
+    def __init__(self, result: Dict[str, Any], snapshot: Dict[str, Any], change: Dict[str, Any],
+                 reused_from: Optional[Any] = None):
+        self.result = result
+        self.snapshot = snapshot
+        self.change = change
+        # ID of the near-duplicate policy the analysis was built from, if any
+        self.reused_from = reused_from
+
+    @property
+    def failed(self) -> bool:
+        return 'error' in self.result
+
+    @property
+    def analyzed_chars(self) -> int:
+        return self.change.get('analyzed_chars', 0)
+
+
+async def analyze_policy_text(policy: Dict[str, Any], content: str, checksum: str,
+                              stored_result: Optional[Dict[str, Any]]) -> AnalysisUpdate:
+    """
+    Analyzes a new version of a policy, sending only its changed sections to the LLM when possible.
+
+    The latest snapshot records which sections each part of the stored
+    analysis came from. If it matches the stored analysis, the added and
+    modified sections are analyzed as one excerpt, and that result is
+    merged with the parts still backed by sections in the new text. Parts
+    whose sections are all gone are dropped with their findings. A full
+    analysis runs instead when there is no usable snapshot, or when too
+    much has changed or too many parts have piled up since the last full
+    analysis (see INCREMENTAL_MAX_CHANGE and INCREMENTAL_MAX_PARTS).
+
+    Args:
+        policy: The policy row as stored before this analysis.
+        content: Extracted text of the new version.
+        checksum: Checksum of ``content``.
+        stored_result: The stored analysis if it was produced by the current
+            LLM config (see pipeline.get_stored_analysis), else None.
+
+    Returns:
+        The update to persist; check ``failed`` before saving it.
+    """
+    sections = segment(content)
+    previous = _load_previous_snapshot(policy, stored_result)
+    diff = SectionDiff(previous['sections'] if previous else [], sections)
+
+    if previous is not None:
+        parts = []
+        for part in previous['parts']:
+            kept = [section_hash for section_hash in part['sections'] if section_hash not in diff.gone_hashes]
+            if kept:
+                parts.append({**part, 'sections': kept})
+        drift = previous.get('changed_chars_since_full', 0) + diff.changed_chars
+        if drift > INCREMENTAL_MAX_CHANGE * max(1, diff.total_chars):
+            logger.info("Policy %s changed by %s of %s chars since its last full analysis; re-analyzing in full.",
+                        policy['id'], drift, diff.total_chars)
+        elif len(parts) + bool(diff.changed) > INCREMENTAL_MAX_PARTS:
+            logger.info("Policy %s has %s analysis parts; re-analyzing in full.", policy['id'], len(parts))
+        elif parts or diff.changed:
+            return await _analyze_changes(policy, checksum, sections, diff, parts, drift)
+
+    result = await perform_analysis(content)
+    snapshot = _snapshot_row(policy['id'], checksum, sections,
+                             [{'sections': [section['hash'] for section in sections], 'analysis': result}], 0)
+    return AnalysisUpdate(result, snapshot, _change_row(policy, checksum, 'full', diff, len(content)))
+
+
+async def analyze_near_duplicate(policy: Dict[str, Any], content: str, checksum: str,
+                                 source: Dict[str, Any]) -> Optional[AnalysisUpdate]:
+    """
+    Analyzes a policy starting from the analysis of a near-duplicate, re-analyzing only the sections that differ.
+
+    This works like an incremental update, with the source policy's latest
+    snapshot in place of the policy's own. The source must be a policy of
+    the same domain, since the reused summary and key points are kept (see
+    pipeline.find_near_duplicate). Reused parts that lost sections to the
+    diff still have ENTITY_CATEGORIES cleared: those sections may be the
+    few sentences with different contact details, and their replacements
+    are in the re-analyzed excerpt.
+
+    Args:
+        policy: The policy row being analyzed.
+        content: Its extracted text.
+        checksum: Checksum of ``content``.
+        source: The near-duplicate policy row of the same domain, whose
+            stored analysis is current (see pipeline.find_near_duplicate).
+
+    Returns:
+        The update to persist (check ``failed``), or None if the source has
+        no usable snapshot or too much differs; analyze in full then.
+    """
+    try:
+        previous = PolicySnapshot.get_latest(source['id'])
+    except Exception as e:
+        logger.warning("Could not load snapshot of policy %s: %s", source['id'], e)
+        return None
+    if not previous or previous.get('checksum') != source.get('checksum') or not previous.get('parts'):
+        return None
+    sections = segment(content)
+    diff = SectionDiff(previous['sections'], sections)
+    if diff.changed_chars > INCREMENTAL_MAX_CHANGE * max(1, diff.total_chars):
+        return None
+    parts = []
+    for part in previous['parts']:
+        kept = [section_hash for section_hash in part['sections'] if section_hash not in diff.gone_hashes]
+        if not kept:
+            continue
+        analysis = part['analysis']
+        if len(kept) < len(part['sections']):
+            analysis = _without_entity_details(analysis)
+            if analysis is None:
+                return None
+        parts.append({'sections': kept, 'analysis': analysis})
+    if not parts or len(parts) + bool(diff.changed) > INCREMENTAL_MAX_PARTS:
+        return None
+    update = await _analyze_changes(policy, checksum, sections, diff, parts, diff.changed_chars)
+    update.reused_from = source['id']
+    return update
+
+
+def record_update(update: AnalysisUpdate) -> None:
+    """Saves the snapshot and changelog entry of a stored analysis; failures only cost future incremental runs."""
+    try:
+        PolicySnapshot.create(update.snapshot, keep=SNAPSHOT_HISTORY)
+        # The changelog follows a policy's own versions, so a diff against a near-duplicate isn't logged
+        if update.reused_from is None:
+            PolicyChange.create_many([update.change])
+    except Exception as e:
+        logger.warning("Failed to record snapshot of policy %s: %s", update.snapshot.get('policy_id'), e)
+
+
+def record_updates(updates: List[AnalysisUpdate]) -> None:
+    """Like record_update for a batch, in two requests; older snapshots are left for the next single update to prune."""
+    try:
+        PolicySnapshot.create_many([update.snapshot for update in updates])
+        PolicyChange.create_many([update.change for update in updates if update.reused_from is None])
+    except Exception as e:
+        logger.warning("Failed to record snapshots of %s policies: %s", len(updates), e)
+
+
+async def _analyze_changes(policy: Dict[str, Any], checksum: str, sections: List[Dict[str, Any]],
+                           diff: SectionDiff, parts: List[Dict[str, Any]], drift: int) -> AnalysisUpdate:
+    analyzed_chars = 0
+    if diff.changed:
+        excerpt = '\n\n'.join(section['text'] for section in diff.changed)
+        analyzed_chars = len(excerpt)
+        logger.info("Analyzing %s changed sections (%s of %s chars) of policy %s.",
+                    len(diff.changed), analyzed_chars, diff.total_chars, policy['id'])
+        delta = await perform_analysis(excerpt, note=EXCERPT_NOTE)
+        if 'error' in delta:
+            return AnalysisUpdate(delta, {}, {})
+        parts = parts + [{'sections': [section['hash'] for section in diff.changed], 'analysis': delta}]
+    else:
+        logger.info("Policy %s only lost or reordered sections; no analysis needed.", policy['id'])
+
+    results = [part['analysis'] for part in parts]
+    result = results[0] if len(results) == 1 else merge_analysis_results(results)
+    snapshot = _snapshot_row(policy['id'], checksum, sections, parts, drift)
+    return AnalysisUpdate(result, snapshot, _change_row(policy, checksum, 'incremental', diff, analyzed_chars))
+
+
+def _without_entity_details(analysis: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # Unstructured results have no categories to clear, so they can't be reused safely
+    if not isinstance(analysis.get('categories'), dict):
+        return None
+    categories = dict(analysis['categories'])
+    for key in ENTITY_CATEGORIES:
+        categories[key] = {'summary': '', 'keyPoints': []}
+    return {**analysis, 'categories': categories}
+
+
+def _load_previous_snapshot(policy: Dict[str, Any],
+                            stored_result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    # Only a snapshot of the version behind the stored analysis can be built on
+    if not INCREMENTAL_ANALYSIS or stored_result is None or not policy.get('checksum'):
+        return None
+    try:
+        snapshot = PolicySnapshot.get_latest(policy['id'])
+    except Exception as e:
+        logger.warning("Could not load snapshot of policy %s; analyzing in full: %s", policy['id'], e)
+        return None
+    if not snapshot or snapshot.get('checksum') != policy['checksum'] or not snapshot.get('parts'):
+        return None
+    return snapshot
+
+
+def _snapshot_row(policy_id: Any, checksum: str, sections: List[Dict[str, Any]], parts: List[Dict[str, Any]],
+                  changed_chars_since_full: int) -> Dict[str, Any]:
+    return {
+        'policy_id': policy_id,
+        'checksum': checksum,
+        'sections': sections,
+        'parts': parts,
+        'changed_chars_since_full': changed_chars_since_full
+    }
+
+
+def _change_row(policy: Dict[str, Any], checksum: str, mode: str, diff: SectionDiff,
+                analyzed_chars: int) -> Dict[str, Any]:
+    return {
+        'policy_id': policy['id'],
+        'from_checksum': policy.get('checksum') or None,
+        'to_checksum': checksum,
+        'mode': mode,
+        **diff.to_dict(),
+        'analyzed_chars': analyzed_chars
+    }
+
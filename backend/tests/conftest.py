@@ -0,0 +1,29 @@
+"""
+Shared test setup.
+
+Modules that talk to the database are imported against the in-memory
+Supabase stand-in from the benchmarks, so the tests need neither a
+database nor credentials.
+"""
+import sys
+import types
+
+import pytest
+
+from benchmarks.fake_supabase import FakeSupabase
+
+_db = FakeSupabase()
+_supabase_config = types.ModuleType('supabase_config')
+_supabase_config.supabase = _db
+sys.modules['supabase_config'] = _supabase_config
+
+
+@pytest.fixture
+def db() -> FakeSupabase:
+    """The in-memory database, emptied and with model caches cleared for each test."""
+    import models
+    _db.tables.clear()
+    _db.reset_counters()
+    models.domain_cache.clear()
+    models.policy_cache.clear()
+    return _db
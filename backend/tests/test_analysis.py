@@ -0,0 +1,35 @@
+from analysis import merge_analysis_results
+from analysis_schema import validate_analysis
+
+
+def test_merge_plain_results_dedupes_points_and_concerns():
+    merged = merge_analysis_results([
+        {'summary': 'Part one.', 'keyPoints': ['Collects email', 'Uses cookies'], 'concerns': ['Sells data']},
+        {'summary': ' ', 'keyPoints': ['collects email '], 'concerns': []},
+        {'summary': 'Part three.', 'keyPoints': ['Keeps logs'], 'concerns': ['sells data', 'No deletion']},
+    ])
+    assert merged == {
+        'summary': 'Part one.\n\nPart three.',
+        'keyPoints': ['Collects email', 'Uses cookies', 'Keeps logs'],
+        'concerns': ['Sells data', 'No deletion'],
+    }
+
+
+def test_merge_structured_results_keeps_highest_severity():
+    first = validate_analysis({
+        'summary': 'Part one.',
+        'categories': {'security': {'summary': 'Encrypted.', 'keyPoints': ['TLS']}},
+        'concerns': [{'concern': 'Sells data', 'severity': 'low'}],
+    })
+    second = validate_analysis({
+        'summary': 'Part two.',
+        'categories': {'security': {'summary': 'Audited.', 'keyPoints': ['tls', 'Audits']}},
+        'concerns': [{'concern': 'sells data', 'severity': 'high'}, {'concern': 'No deletion', 'severity': 'medium'}],
+    })
+    merged = merge_analysis_results([first, second])
+    assert merged['summary'] == 'Part one.\n\nPart two.'
+    assert merged['categories']['security'] == {'summary': 'Encrypted. Audited.', 'keyPoints': ['TLS', 'Audits']}
+    assert merged['concernDetails'] == [
+        {'concern': 'sells data', 'severity': 'high'},
+        {'concern': 'No deletion', 'severity': 'medium'},
+    ]
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from analysis_schema import (parse_structured_response, validate_analysis, repair_json_text, build_analysis,
+                             AnalysisParseError, CATEGORIES, SCHEMA_VERSION)
+
+RESPONSE = {
+    'summary': 'Collects contact and usage data.',
+    'categories': {
+        'data_collection': {'summary': 'Email and IP.', 'keyPoints': ['Collects email']},
+        'contact': 'privacy@example.com',
+    },
+    'keyPoints': ['Collects email', ' '],
+    'concerns': [
+        {'concern': 'Vague retention', 'severity': 'low'},
+        {'concern': 'Sells data', 'severity': 'HIGH'},
+        'Shares with partners',
+        {'severity': 'high'},
+    ],
+}
+
+
+def test_validates_and_normalizes():
+    analysis = parse_structured_response(json.dumps(RESPONSE))
+    assert analysis['schema_version'] == SCHEMA_VERSION
+    assert analysis['keyPoints'] == ['Collects email']
+    assert analysis['concernDetails'] == [
+        {'concern': 'Sells data', 'severity': 'high'},
+        {'concern': 'Shares with partners', 'severity': 'medium'},
+        {'concern': 'Vague retention', 'severity': 'low'},
+    ]
+    assert analysis['concerns'] == ['Sells data', 'Shares with partners', 'Vague retention']
+    assert set(analysis['categories']) == set(CATEGORIES)
+    assert analysis['categories']['contact'] == {'summary': 'privacy@example.com', 'keyPoints': []}
+    assert analysis['categories']['security'] == {'summary': '', 'keyPoints': []}
+
+
+def test_repairs_fences_prose_and_trailing_commas():
+    text = 'Here is the analysis:\n```json\n{"summary": “Short.”, "keyPoints": ["a",],}\n```'
+    assert repair_json_text(text) == '{"summary": "Short.", "keyPoints": ["a"]}'
+    assert parse_structured_response(text)['keyPoints'] == ['a']
+
+
+def test_unrepairable_response_raises():
+    with pytest.raises(AnalysisParseError):
+        parse_structured_response('Summary: the policy collects data.')
+
+
+@pytest.mark.parametrize('data', [
+    ['not', 'an', 'object'],
+    {'keyPoints': []},
+    {'summary': '   '},
+    {'summary': 'ok', 'categories': ['data_collection']},
+    {'summary': 'ok', 'categories': {'security': 3}},
+    {'summary': 'ok', 'concerns': {'concern': 'x'}},
+])
+def test_invalid_shapes_raise(data):
+    with pytest.raises(AnalysisParseError):
+        validate_analysis(data)
+
+
+def test_string_concerns_are_not_split_into_characters():
+    assert validate_analysis({'summary': 'ok', 'concerns': 'Sells data'})['concerns'] == ['Sells data']
+
+
+def test_unknown_severity_defaults_to_medium():
+    concern = validate_analysis({'summary': 'ok', 'concerns': [{'concern': 'x', 'severity': 'urgent'}]})
+    assert concern['concernDetails'] == [{'concern': 'x', 'severity': 'medium'}]
+
+
+def test_build_analysis_fills_empty_categories():
+    analysis = build_analysis('ok', [], [])
+    assert analysis['categories'] == {key: {'summary': '', 'keyPoints': []} for key in CATEGORIES}
@@ -0,0 +1,62 @@
+import gzip
+import json
+
+from bulk_ingest import Checkpoint, read_records, input_format
+
+
+def test_checkpoint_saves_highest_fully_done_record(tmp_path):
+    path = str(tmp_path / 'urls.csv.checkpoint.json')
+    checkpoint = Checkpoint(path, 'urls.csv')
+    for number in range(1, 6):
+        checkpoint.opened(number)
+    checkpoint.done([1, 2, 4])
+    checkpoint.save({'written': 3})
+    assert checkpoint.position == 2
+    assert Checkpoint.load(path, 'urls.csv') == 2
+    checkpoint.done([3, 5])
+    checkpoint.save({'written': 5})
+    assert Checkpoint.load(path, 'urls.csv') == 5
+
+
+def test_checkpoint_resumes_from_start_after(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = Checkpoint(path, 'urls.csv', start_after=10)
+    checkpoint.save({})
+    assert checkpoint.position == 10
+    checkpoint.opened(11)
+    checkpoint.save({})
+    assert checkpoint.position == 10
+
+
+def test_checkpoint_for_other_input_is_ignored(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    Checkpoint(path, 'a.csv', start_after=7).save({})
+    assert Checkpoint.load(path, 'a.csv') == 7
+    assert Checkpoint.load(path, 'b.csv') == 0
+    assert Checkpoint.load(str(tmp_path / 'missing.json'), 'a.csv') == 0
+
+
+def test_read_records_formats(tmp_path):
+    csv_path = tmp_path / 'urls.csv'
+    csv_path.write_text('url,policy_type\nhttps://a.example/privacy,privacy_policy\nhttps://b.example/terms,terms\n')
+    assert list(read_records(str(csv_path))) == [
+        (1, {'url': 'https://a.example/privacy', 'policy_type': 'privacy_policy'}),
+        (2, {'url': 'https://b.example/terms', 'policy_type': 'terms'}),
+    ]
+
+    jsonl_path = tmp_path / 'urls.jsonl.gz'
+    with gzip.open(jsonl_path, 'wt') as f:
+        f.write(json.dumps({'url': 'https://a.example/privacy'}) + '\nnot json\n\n[1]\n')
+    assert list(read_records(str(jsonl_path))) == [(1, {'url': 'https://a.example/privacy'}), (2, {}), (3, {})]
+
+    txt_path = tmp_path / 'urls.txt'
+    txt_path.write_text('https://a.example/privacy\n\nhttps://b.example/privacy\nhttps://c.example/privacy\n')
+    assert list(read_records(str(txt_path), start_after=1)) == [
+        (2, {'url': 'https://b.example/privacy'}), (3, {'url': 'https://c.example/privacy'})
+    ]
+
+
+def test_input_format():
+    assert input_format('urls.ndjson.gz') == 'jsonl'
+    assert input_format('urls.txt') == 'txt'
+    assert input_format('export.tsv') == 'csv'
@@ -0,0 +1,81 @@
+from cache import TTLCache, content_checksum
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(monkeypatch, **kwargs):
+    clock = FakeClock()
+    monkeypatch.setattr('cache.time.monotonic', clock)
+    return TTLCache('test', **kwargs), clock
+
+
+def test_loads_once_then_hits(monkeypatch):
+    cache, _ = make_cache(monkeypatch, ttl=60)
+    calls = []
+    load = lambda: calls.append(1) or 'value'
+    assert cache.get_or_load('k', load) == 'value'
+    assert cache.get_or_load('k', load) == 'value'
+    assert len(calls) == 1
+    assert cache.stats.to_dict() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    cache, clock = make_cache(monkeypatch, ttl=60)
+    cache.set('k', 'old')
+    clock.now += 61
+    assert cache.get_or_load('k', lambda: 'new') == 'new'
+
+
+def test_none_uses_negative_ttl(monkeypatch):
+    cache, clock = make_cache(monkeypatch, ttl=60, negative_ttl=5)
+    assert cache.get_or_load('k', lambda: None) is None
+    assert cache.get_or_load('k', lambda: 'found') is None
+    clock.now += 6
+    assert cache.get_or_load('k', lambda: 'found') == 'found'
+
+
+def test_zero_negative_ttl_does_not_cache_misses(monkeypatch):
+    cache, _ = make_cache(monkeypatch, ttl=60, negative_ttl=0)
+    cache.get_or_load('k', lambda: None)
+    assert cache.get_or_load('k', lambda: 'found') == 'found'
+
+
+def test_evicts_least_recently_used(monkeypatch):
+    cache, _ = make_cache(monkeypatch, maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get_or_load('a', lambda: None)
+    cache.set('c', 3)
+    assert cache.get_or_load('a', lambda: 'reloaded') == 1
+    assert cache.get_or_load('b', lambda: 'reloaded') == 'reloaded'
+
+
+def test_invalidate_tag_drops_every_tagged_key(monkeypatch):
+    cache, _ = make_cache(monkeypatch)
+    cache.get_or_load(('name', 'example.com'), lambda: {'id': 1}, tags=lambda d: [('domain', d['id'])])
+    cache.get_or_load(('id', 1), lambda: {'id': 1}, tags=lambda d: [('domain', d['id'])])
+    cache.set('other', 'x', tags=[('domain', 2)])
+    cache.invalidate_tag(('domain', 1))
+    assert cache.get_or_load(('name', 'example.com'), lambda: 'reloaded') == 'reloaded'
+    assert cache.get_or_load(('id', 1), lambda: 'reloaded') == 'reloaded'
+    assert cache.get_or_load('other', lambda: 'reloaded') == 'x'
+
+
+def test_invalidate_single_key(monkeypatch):
+    cache, _ = make_cache(monkeypatch)
+    cache.set('k', 'old', tags=['t'])
+    cache.invalidate('k')
+    assert cache.get_or_load('k', lambda: 'new') == 'new'
+    cache.invalidate_tag('t')
+    assert cache.get_or_load('k', lambda: 'newer') == 'new'
+
+
+def test_content_checksum_ignores_whitespace():
+    assert content_checksum('We  collect\n data.') == content_checksum('We collect data.')
+    assert content_checksum('We collect data.') != content_checksum('We share data.')
@@ -0,0 +1,56 @@
+from chunking import is_heading, split_into_sections, split_into_chunks, estimate_tokens, CHARS_PER_TOKEN
+
+POLICY = '\n'.join([
+    'Privacy Policy',
+    '1. Data We Collect',
+    'We collect your email address and IP address.',
+    'We also collect usage data.',
+    '2. How We Use Data',
+    'We use data to provide the service.',
+    'YOUR RIGHTS',
+    'You may request deletion of your data.',
+])
+
+
+def test_is_heading():
+    assert is_heading('1. Data We Collect')
+    assert is_heading('Section 4 Retention')
+    assert is_heading('YOUR RIGHTS')
+    assert is_heading('Data We Collect')
+    assert not is_heading('We collect your email address and IP address.')
+    assert not is_heading('')
+
+
+def test_sections_start_at_headings():
+    sections = split_into_sections(POLICY)
+    assert sections == [
+        'Privacy Policy\n1. Data We Collect\nWe collect your email address and IP address.\nWe also collect usage data.',
+        '2. How We Use Data\nWe use data to provide the service.',
+        'YOUR RIGHTS\nYou may request deletion of your data.',
+    ]
+
+
+def test_short_text_is_one_chunk():
+    assert split_into_chunks(POLICY, max_tokens=10000) == [POLICY]
+    assert split_into_chunks('', max_tokens=10) == []
+
+
+def test_chunks_respect_limit_and_keep_sections_whole():
+    max_tokens = 30
+    chunks = split_into_chunks(POLICY, max_tokens)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= max_tokens * CHARS_PER_TOKEN for chunk in chunks)
+    assert '\n'.join(chunks) == POLICY
+    assert any(chunk.startswith('2. How We Use Data') for chunk in chunks)
+
+
+def test_oversized_line_is_split_by_words():
+    line = ' '.join(['word'] * 100)
+    chunks = split_into_chunks(line, max_tokens=5)
+    assert all(len(chunk) <= 5 * CHARS_PER_TOKEN for chunk in chunks)
+    assert ' '.join(chunks).split() == line.split()
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 1
+    assert estimate_tokens('x' * 400) == 400 // CHARS_PER_TOKEN + 1
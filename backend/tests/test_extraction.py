@@ -0,0 +1,57 @@
+from extraction import PolicyTextExtractor, extract_policy_text, MIN_MAIN_CHARS
+
+
+def test_drops_scripts_styles_and_boilerplate():
+    html = ('<html><head><title>Privacy</title><style>p {}</style></head><body>'
+            '<nav>Home | About</nav><script>track()</script>'
+            '<p>We collect data.</p><footer>(c) Example</footer></body></html>')
+    assert extract_policy_text(html).text == 'We collect data.'
+
+
+def test_block_elements_become_lines():
+    html = '<html><body><h1>Privacy</h1><p>We  collect\n data.</p><ul><li>Email</li><li>IP</li></ul></body></html>'
+    assert extract_policy_text(html).text == 'Privacy\nWe collect data.\nEmail\nIP'
+
+
+def test_head_without_end_tag():
+    html = '<html><head><title>x</title><body><p>We collect data.</p>'
+    assert extract_policy_text(html).text == 'We collect data.'
+
+
+def test_hidden_element_without_end_tag():
+    html = '<html><body><p aria-hidden="true">*<p>We collect data.</p></body></html>'
+    assert 'We collect data.' in extract_policy_text(html).text
+
+
+def test_hidden_element_is_skipped_to_its_end_tag():
+    html = '<html><body><div hidden><div>Cookie banner</div></div><p>We collect data.</p></body></html>'
+    assert extract_policy_text(html).text == 'We collect data.'
+
+
+def test_main_content_preferred_when_long_enough():
+    body = 'We collect data. ' * (MIN_MAIN_CHARS // 10)
+    html = f'<html><body><div>Sign up today</div><main><p>{body}</p></main></body></html>'
+    text = extract_policy_text(html).text
+    assert 'Sign up today' not in text
+    assert text.startswith('We collect data.')
+
+
+def test_short_main_falls_back_to_body():
+    html = '<html><body><div>Intro</div><main><p>Short</p></main></body></html>'
+    assert extract_policy_text(html).text == 'Intro\nShort'
+
+
+def test_feed_in_chunks_matches_single_feed():
+    html = '<html><body>' + '<p>We collect &amp; share data.</p>' * 50 + '</body></html>'
+    extractor = PolicyTextExtractor()
+    for start in range(0, len(html), 7):
+        extractor.feed(html[start:start + 7])
+    extractor.close()
+    assert extractor.get_text() == extract_policy_text(html).text
+    assert extractor.input_chars == len(html)
+
+
+def test_plain_text_only_collapses_whitespace():
+    result = extract_policy_text('We  collect\n\n data.', content_type='text/plain')
+    assert result.text == 'We collect\ndata.'
+    assert result.input_chars == len('We  collect\n\n data.')
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+
+import pytest
+
+from jobs import JobQueue, QueueFullError, JOB_RUNNING, JOB_COMPLETED, JOB_FAILED
+
+
+def test_runs_async_handler():
+    async def handler(job):
+        await asyncio.sleep(0)
+        return job.payload['x'] * 2
+
+    jobs = JobQueue(handler, num_workers=2)
+    job = jobs.submit(x=21)
+    assert job.wait(5)
+    assert job.status == JOB_COMPLETED
+    assert job.result == 42
+    assert jobs.get(job.id) is job
+    jobs.stop(5)
+
+
+def test_failed_job_records_error():
+    async def handler(job):
+        raise ValueError('boom')
+
+    jobs = JobQueue(handler, num_workers=1)
+    job = jobs.submit()
+    assert job.wait(5)
+    assert job.status == JOB_FAILED
+    assert job.error == 'boom'
+    jobs.stop(5)
+
+
+def test_dedupe_key_reuses_in_flight_job():
+    release = threading.Event()
+
+    async def handler(job):
+        await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+        return 'done'
+
+    jobs = JobQueue(handler, num_workers=2)
+    first = jobs.submit(dedupe_key='https://example.com/privacy')
+    second = jobs.submit(dedupe_key='https://example.com/privacy')
+    assert second is first
+    release.set()
+    assert first.wait(5)
+    third = jobs.submit(dedupe_key='https://example.com/privacy')
+    assert third is not first
+    assert third.wait(5)
+    jobs.stop(5)
+
+
+def test_full_queue_rejects_and_forgets_job():
+    release = threading.Event()
+
+    async def handler(job):
+        await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+
+    jobs = JobQueue(handler, num_workers=1, max_queue_size=1)
+    running = jobs.submit(dedupe_key='a')
+    while running.status != JOB_RUNNING:
+        running.wait(0.01)
+    jobs.submit(dedupe_key='b')
+    with pytest.raises(QueueFullError):
+        jobs.submit(dedupe_key='c')
+    release.set()
+    jobs.stop(5)
+    assert jobs.get(running.id).finished
+
+
+def test_stop_drains_queued_jobs_and_rejects_new_ones():
+    async def handler(job):
+        await asyncio.sleep(0.01)
+        return job.payload['n']
+
+    jobs = JobQueue(handler, num_workers=1)
+    submitted = [jobs.submit(n=n) for n in range(5)]
+    jobs.stop(5)
+    assert [job.result for job in submitted] == list(range(5))
+    assert jobs.closed
+    with pytest.raises(QueueFullError):
+        jobs.submit(n=6)
+
+
+def test_finished_jobs_are_evicted_beyond_retention():
+    async def handler(job):
+        return None
+
+    jobs = JobQueue(handler, num_workers=1, max_retained_jobs=2)
+    submitted = []
+    for _ in range(4):
+        job = jobs.submit()
+        job.wait(5)
+        submitted.append(job)
+    jobs.stop(5)
+    assert jobs.get(submitted[0].id) is None
+    assert jobs.get(submitted[-1].id) is submitted[-1]
+
+
+def test_close_refuses_new_jobs_but_keeps_running_queued_ones():
+    release = threading.Event()
+
+    async def handler(job):
+        await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+        return job.payload['n']
+
+    jobs = JobQueue(handler, num_workers=1)
+    submitted = [jobs.submit(n=n) for n in range(2)]
+    jobs.close()
+    assert jobs.closed
+    with pytest.raises(QueueFullError):
+        jobs.submit(n=2)
+    release.set()
+    assert all(job.wait(5) for job in submitted)
+    assert [job.result for job in submitted] == [0, 1]
+    jobs.stop(5)
@@ -0,0 +1,95 @@
+import pytest
+
+from metrics import (Counter, Gauge, Histogram, Registry, begin_request_timings, end_request_timings,
+                     server_timing_header, timed, timer)
+
+
+def test_counter_renders_labelled_samples():
+    requests = Counter('test_requests_total', 'Requests', ('method',))
+    requests.inc(method='GET')
+    requests.inc(2, method='GET')
+    requests.inc(0.5, method='POST')
+
+    assert requests.value(method='GET') == 3
+    assert requests.render().split('\n') == [
+        '# HELP test_requests_total Requests',
+        '# TYPE test_requests_total counter',
+        'test_requests_total{method="GET"} 3',
+        'test_requests_total{method="POST"} 0.5',
+    ]
+
+
+def test_label_values_are_escaped():
+    errors = Counter('test_errors_total', 'Errors', ('message',))
+    errors.inc(message='say "hi"\nback\\slash')
+    assert list(errors.samples()) == ['test_errors_total{message="say \\"hi\\"\\nback\\\\slash"} 1']
+
+
+def test_wrong_labels_are_rejected():
+    requests = Counter('test_requests_total', 'Requests', ('method',))
+    with pytest.raises(ValueError):
+        requests.inc(status='200')
+
+
+def test_gauge_callback_is_read_at_scrape_time():
+    depth = [3]
+    gauge = Gauge('test_queue_depth', 'Queue depth', callback=lambda: depth[0])
+    depth[0] = 7
+    assert list(gauge.samples()) == ['test_queue_depth 7']
+
+
+def test_histogram_buckets_are_cumulative():
+    latency = Histogram('test_latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    assert list(latency.samples()) == [
+        'test_latency_seconds_bucket{le="0.1"} 1',
+        'test_latency_seconds_bucket{le="1"} 2',
+        'test_latency_seconds_bucket{le="+Inf"} 3',
+        'test_latency_seconds_sum 5.55',
+        'test_latency_seconds_count 3',
+    ]
+
+
+def test_registry_rejects_duplicate_names():
+    registry = Registry()
+    registry.register(Counter('test_total', 'Test'))
+    with pytest.raises(ValueError):
+        registry.register(Counter('test_total', 'Test'))
+    assert registry.render().endswith('\n')
+
+
+def test_timed_counts_errors_and_records_request_timings():
+    latency = Histogram('test_call_seconds', 'Calls', ('op',))
+    errors = Counter('test_call_errors_total', 'Errors', ('op',))
+
+    @timed(latency, group='db', errors=errors, op='get')
+    def fail():
+        raise RuntimeError('boom')
+
+    token, timings = begin_request_timings()
+    try:
+        with timer(latency, group='db', op='get'):
+            pass
+        with pytest.raises(RuntimeError):
+            fail()
+    finally:
+        end_request_timings(token)
+
+    assert errors.value(op='get') == 1
+    assert timings['db'][1] == 2
+    assert list(latency.samples())[-1] == 'test_call_seconds_count{op="get"} 2'
+
+
+def test_timer_outside_a_request_only_observes():
+    latency = Histogram('test_call_seconds', 'Calls')
+    with timer(latency, group='db'):
+        pass
+    assert list(latency.samples())[-1] == 'test_call_seconds_count 1'
+
+
+def test_server_timing_header():
+    header = server_timing_header({'db': [0.0125, 3]}, 0.05)
+    assert header == 'db;dur=12.50;desc="3 calls", total;dur=50.00'
@@ -0,0 +1,40 @@
+from models import Domain, Policy
+
+
+def create_domain(name='example.com'):
+    return Domain.create(name, f'https://{name}').data[0]
+
+
+def test_domain_create_returns_existing_row(db):
+    first = create_domain()
+    again = Domain.create('example.com', 'https://example.com')
+    assert again.data[0]['id'] == first['id']
+    assert len(db.rows('domains')) == 1
+
+
+def test_domain_lookup_is_cached(db):
+    create_domain()
+    Domain.get_by_name('example.com')
+    db.reset_counters()
+    assert Domain.get_by_name('example.com')['name'] == 'example.com'
+    assert db.round_trips == 0
+
+
+def test_cached_miss_is_dropped_when_domain_is_created(db):
+    assert Domain.get_by_name('example.com') is None
+    create_domain()
+    assert Domain.get_by_name('example.com') is not None
+
+
+def test_policy_writes_refresh_cached_policy_count(db):
+    domain = create_domain()
+    assert Domain.get_by_name('example.com')['policy_count'] == 0
+
+    policy = Policy.create(domain['id'], 'privacy_policy', 'Privacy', 'https://example.com/privacy').data[0]
+    assert Domain.get_by_name('example.com')['policy_count'] == 1
+    assert [p['id'] for p in Policy.get_by_domain(domain['id'])] == [policy['id']]
+
+    Policy.delete(policy['id'])
+    assert Domain.get_by_name('example.com')['policy_count'] == 0
+    assert Policy.get_by_domain(domain['id']) == []
+    assert Policy.get_by_url('https://example.com/privacy') is None
@@ -0,0 +1,134 @@
+import threading
+import time
+
+from politeness import HostScheduler, RobotsCache, DNSCache
+
+ROBOTS = """
+User-agent: *
+Disallow: /private
+Crawl-delay: 3
+
+User-agent: PolicyAnalyzer
+Disallow: /admin
+"""
+
+
+def test_per_host_limit_and_timeout():
+    scheduler = HostScheduler(max_connections=10, max_per_host=2, delay=0)
+    assert scheduler.acquire('a.example')
+    assert scheduler.acquire('a.example')
+    assert not scheduler.acquire('a.example', timeout=0.05)
+    assert scheduler.acquire('b.example', timeout=0.05)
+    scheduler.release('a.example')
+    assert scheduler.acquire('a.example', timeout=0.05)
+    assert scheduler.stats() == {'active': 3, 'hosts': 2, 'waiting': 0}
+
+
+def test_global_connection_limit():
+    scheduler = HostScheduler(max_connections=2, max_per_host=2, delay=0)
+    assert scheduler.acquire('a.example')
+    assert scheduler.acquire('b.example')
+    assert not scheduler.acquire('c.example', timeout=0.05)
+    scheduler.release('a.example')
+    assert scheduler.acquire('c.example', timeout=0.05)
+
+
+def test_delay_between_requests_to_one_host():
+    scheduler = HostScheduler(max_per_host=4, delay=0.1)
+    with scheduler.slot('a.example') as first:
+        assert first.acquired
+    started = time.monotonic()
+    with scheduler.slot('a.example') as second:
+        assert second.acquired
+    assert time.monotonic() - started >= 0.09
+    with scheduler.slot('b.example', timeout=0.01) as other:
+        assert other.acquired
+
+
+def test_crawl_delay_overrides_shorter_default():
+    scheduler = HostScheduler(max_per_host=4, delay=0)
+    scheduler.acquire('a.example', delay=0.2)
+    scheduler.release('a.example')
+    assert not scheduler.acquire('a.example', timeout=0.05)
+
+
+def test_waiting_hosts_are_served_round_robin():
+    scheduler = HostScheduler(max_connections=1, max_per_host=1, delay=0)
+    scheduler.acquire('busy.example')
+    order = []
+
+    def fetch(host):
+        with scheduler.slot(host, timeout=5) as slot:
+            assert slot.acquired
+            order.append(host)
+
+    threads = []
+    for host in ['a.example', 'a.example', 'a.example', 'b.example']:
+        thread = threading.Thread(target=fetch, args=(host,))
+        thread.start()
+        threads.append(thread)
+        while scheduler.stats()['waiting'] < len(threads):
+            time.sleep(0.001)
+    scheduler.release('busy.example')
+    for thread in threads:
+        thread.join(5)
+    assert order.index('b.example') <= 1
+
+
+def make_robots(responses):
+    fetched = []
+
+    def fetch(url):
+        fetched.append(url)
+        response = responses[url]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    return RobotsCache(fetch, 'PolicyAnalyzer'), fetched
+
+
+def test_robots_rules_are_cached_per_origin():
+    robots, fetched = make_robots({'https://a.example/robots.txt': (200, ROBOTS)})
+    assert robots.allowed('https://a.example/privacy')
+    assert not robots.allowed('https://a.example/admin/users')
+    assert robots.allowed('https://a.example/private/data')
+    assert fetched == ['https://a.example/robots.txt']
+
+
+def test_robots_crawl_delay():
+    robots, _ = make_robots({'https://a.example/robots.txt': (200, "User-agent: *\nCrawl-delay: 3\n")})
+    assert robots.crawl_delay('https://a.example/privacy') == 3.0
+
+
+def test_missing_robots_allows_everything():
+    robots, _ = make_robots({'https://a.example/robots.txt': (404, '')})
+    assert robots.allowed('https://a.example/anything')
+    assert robots.crawl_delay('https://a.example/anything') is None
+
+
+def test_unavailable_robots_disallows_everything():
+    robots, _ = make_robots({
+        'https://a.example/robots.txt': (503, ''),
+        'https://b.example/robots.txt': OSError('connection refused'),
+    })
+    assert not robots.allowed('https://a.example/privacy')
+    assert not robots.allowed('https://b.example/privacy')
+    assert robots.crawl_delay('https://b.example/privacy') is None
+
+
+def test_dns_cache_resolves_once_until_forgotten(monkeypatch):
+    lookups = []
+
+    def getaddrinfo(host, port, family, type):
+        lookups.append((host, port))
+        return [(2, 1, 6, '', ('192.0.2.1', port))]
+
+    monkeypatch.setattr('politeness.socket.getaddrinfo', getaddrinfo)
+    dns = DNSCache(ttl=60)
+    assert dns.resolve('a.example', 443) == [(2, 1, 6, '', ('192.0.2.1', 443))]
+    dns.resolve('a.example', 443)
+    assert lookups == [('a.example', 443)]
+    dns.forget('a.example', 443)
+    dns.resolve('a.example', 443)
+    assert len(lookups) == 2
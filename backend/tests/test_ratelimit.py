@@ -0,0 +1,112 @@
+import asyncio
+import threading
+
+import pytest
+
+from ratelimit import Semaphore, TokenBucket, backoff_delay
+
+
+def test_semaphore_limits_concurrency():
+    semaphore = Semaphore(2)
+    active = []
+    peak = []
+
+    async def work():
+        async with semaphore:
+            active.append(1)
+            peak.append(len(active))
+            await asyncio.sleep(0.01)
+            active.pop()
+
+    async def main():
+        await asyncio.gather(*(work() for _ in range(10)))
+
+    asyncio.run(main())
+    assert max(peak) == 2
+    assert semaphore.in_use() == 0
+
+
+def test_semaphore_hands_permits_across_threads():
+    semaphore = Semaphore(1)
+    acquired = threading.Event()
+    release = threading.Event()
+
+    async def hold():
+        async with semaphore:
+            acquired.set()
+            await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+
+    holder = threading.Thread(target=lambda: asyncio.run(hold()))
+    holder.start()
+    assert acquired.wait(5)
+
+    async def wait_for_permit():
+        threading.Timer(0.05, release.set).start()
+        async with semaphore:
+            return semaphore.in_use()
+
+    assert asyncio.run(wait_for_permit()) == 1
+    holder.join(5)
+    assert semaphore.in_use() == 0
+
+
+def test_cancelled_waiter_does_not_leak_a_permit():
+    semaphore = Semaphore(1)
+
+    async def main():
+        await semaphore.acquire()
+        waiter = asyncio.ensure_future(semaphore.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        semaphore.release()
+
+    asyncio.run(main())
+    assert semaphore.in_use() == 0
+
+
+def test_waiter_cancelled_after_grant_releases_the_permit():
+    semaphore = Semaphore(1)
+
+    async def main():
+        await semaphore.acquire()
+        waiter = asyncio.ensure_future(semaphore.acquire())
+        await asyncio.sleep(0)
+        semaphore.release()
+        # Let _grant() hand the permit over, then cancel before the waiter resumes
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.wait_for(semaphore.acquire(), 1)
+        semaphore.release()
+
+    asyncio.run(main())
+    assert semaphore.in_use() == 0
+
+
+def test_token_bucket_allows_burst_then_paces(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('ratelimit.time.monotonic', lambda: now[0])
+    bucket = TokenBucket(rate=2, capacity=4)
+    assert [bucket.reserve() for _ in range(4)] == [0.0] * 4
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+    now[0] += 1.0
+    assert bucket.reserve() == pytest.approx(0.5)
+
+
+def test_token_bucket_caps_oversized_requests(monkeypatch):
+    monkeypatch.setattr('ratelimit.time.monotonic', lambda: 100.0)
+    bucket = TokenBucket(rate=1, capacity=10)
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.reserve(10) == pytest.approx(10.0)
+
+
+def test_token_bucket_disabled_by_zero_rate():
+    assert TokenBucket(rate=0).reserve(100) == 0.0
+
+
+def test_backoff_delay_is_capped():
+    assert all(0 <= backoff_delay(attempt, base=1.0, cap=5.0) <= min(5.0, 2 ** attempt) for attempt in range(10))
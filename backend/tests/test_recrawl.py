@@ -0,0 +1,78 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+from models import Domain, Policy
+from jobs import JobQueue
+from recrawl import RecrawlScheduler
+
+
+def add_policies(domain_name, count, status, age):
+    domain = Domain.create(domain_name, f'https://{domain_name}').data[0]
+    rows = []
+    for i in range(count):
+        row = Policy.new_row(domain['id'], 'privacy_policy', 'Privacy', f'https://{domain_name}/privacy/{i}')
+        row['processing_status'] = status
+        row['last_updated_at'] = (datetime.utcnow() - age).isoformat()
+        rows.append(row)
+    return domain, Policy.upsert_many(rows)
+
+
+def set_visits(db, domain, visits):
+    db.rows('domain_popularity')[domain['id']] = {
+        'domain_id': domain['id'], 'visits': visits, 'last_visited_at': datetime.utcnow().isoformat()
+    }
+
+
+def make_scheduler(handler=None, **kwargs):
+    async def noop(job):
+        return {'cached': True}
+    return RecrawlScheduler(JobQueue(handler or noop, num_workers=2), **kwargs)
+
+
+def test_popular_domain_is_not_crowded_out_by_older_backlog(db):
+    add_policies('old.example', 5, 'processed', timedelta(days=20))
+    popular, (policy,) = add_policies('popular.example', 1, 'processed', timedelta(days=8))
+    set_visits(db, popular, 500)
+    scheduler = make_scheduler(max_age_hours=24 * 7, batch_size=2)
+    candidates = scheduler.candidates()
+    assert candidates[0]['id'] == policy['id']
+    assert len(candidates) == 3
+
+
+def test_fresh_and_recently_failed_policies_are_not_due(db):
+    add_policies('fresh.example', 1, 'processed', timedelta(hours=1))
+    add_policies('failed.example', 1, 'failed_fetch', timedelta(hours=1))
+    _, stuck = add_policies('stuck.example', 1, 'processing', timedelta(hours=2))
+    _, pending = add_policies('new.example', 1, 'not_processed', timedelta(seconds=1))
+    scheduler = make_scheduler(max_age_hours=24, failed_retry_hours=24, stuck_minutes=30)
+    assert {p['id'] for p in scheduler.candidates()} == {stuck[0]['id'], pending[0]['id']}
+
+
+def test_priority_prefers_visits_age_and_pending():
+    scheduler = make_scheduler(max_age_hours=24)
+    now = datetime.utcnow()
+    old = {'last_updated_at': (now - timedelta(days=2)).isoformat(), 'processing_status': 'processed'}
+    young = {'last_updated_at': (now - timedelta(days=1)).isoformat(), 'processing_status': 'processed'}
+    pending = dict(young, processing_status='not_processed')
+    assert scheduler.priority(old, 0, now) > scheduler.priority(young, 0, now)
+    assert scheduler.priority(young, 100, now) > scheduler.priority(old, 0, now)
+    assert scheduler.priority(pending, 0, now) > scheduler.priority(young, 0, now)
+
+
+def test_dispatches_one_policy_per_host_at_a_time(db):
+    release = threading.Event()
+
+    async def handler(job):
+        await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+        return {'cached': True}
+
+    add_policies('a.example', 3, 'not_processed', timedelta(minutes=1))
+    add_policies('b.example', 1, 'not_processed', timedelta(minutes=1))
+    scheduler = make_scheduler(handler, max_in_flight=4, host_delay=0, policies_per_minute=600)
+    assert scheduler.run_once() == 2
+    assert scheduler.run_once() == 0
+    release.set()
+    scheduler.job_queue.stop(5)
+    scheduler._collect_finished()
+    assert scheduler.stats['unchanged'] == 2
@@ -0,0 +1,78 @@
+from llm_config import get_llm_config
+from models import Domain, Policy, PolicyResult
+from pipeline import find_near_duplicate, result_entry
+from similarity import MinHasher, NearDuplicateIndex, shingles
+
+WORDS = ('we collect your email address and usage data to provide improve and secure the service '
+         'and we share it with processors who act on our behalf under contract').split()
+POLICY = ' '.join(f'{word}{i % 7}' for i, word in enumerate(WORDS * 12))
+OTHER = ' '.join(f'{word}{i % 5}' for i, word in enumerate(reversed(WORDS * 12)))
+
+
+def test_shingles():
+    assert shingles('One, two  three!', size=2) == {'one two', 'two three'}
+    assert shingles('Short', size=5) == {'short'}
+    assert shingles('...', size=5) == set()
+
+
+def test_signature_similarity():
+    hasher = MinHasher()
+    signature = hasher.signature(POLICY)
+    assert len(signature) == hasher.num_perm
+    assert hasher.signature(POLICY) == signature
+    assert hasher.similarity(signature, hasher.signature(POLICY.upper())) == 1.0
+    edited = POLICY.replace('processors0', 'partners0', 1)
+    assert hasher.similarity(signature, hasher.signature(edited)) > 0.9
+    assert hasher.similarity(signature, hasher.signature(OTHER)) < 0.3
+    assert hasher.signature('') == []
+    assert hasher.similarity([], []) == 0.0
+
+
+def test_buckets_match_for_equal_bands():
+    hasher = MinHasher(num_perm=32, bands=4)
+    signature = hasher.signature(POLICY)
+    buckets = hasher.buckets(signature)
+    assert len(buckets) == 4
+    assert all(0 <= bucket < 2 ** 63 for bucket in buckets)
+    changed = signature[:8] + [value + 1 for value in signature[8:]]
+    assert hasher.buckets(changed)[0] == buckets[0]
+    assert hasher.buckets(changed)[1:] != buckets[1:]
+
+
+def test_index_finds_near_duplicates(db):
+    index = NearDuplicateIndex(threshold=0.9)
+    index.add_many([(1, 'a', index.signature(POLICY)), (2, 'b', index.signature(OTHER))])
+    signature = index.signature(POLICY.replace('processors0', 'partners0', 1))
+    matches = index.find(signature)
+    assert [row['policy_id'] for row, _ in matches] == [1]
+    assert matches[0][0]['checksum'] == 'a'
+    assert index.find(index.signature(POLICY), exclude=1) == []
+
+
+def add_processed_policy(domain_name, path, llm_config):
+    domain = Domain.create(domain_name, f'https://{domain_name}').data[0]
+    policy = Policy.create(domain['id'], 'privacy_policy', 'Privacy', f'https://{domain_name}{path}').data[0]
+    Policy.update(policy['id'], {'processing_status': 'processed', 'checksum': f'{domain_name}{path}'})
+    PolicyResult.save_many([result_entry(policy['id'], f'{domain_name}{path}',
+                                         {'summary': f'{domain_name} collects data.'}, llm_config)])
+    return Policy.get_by_id(policy['id'])
+
+
+def test_near_duplicates_are_only_reused_within_a_domain(db, monkeypatch):
+    index = NearDuplicateIndex()
+    monkeypatch.setattr('pipeline.near_duplicates', index)
+    llm_config = get_llm_config('stub')
+    source = add_processed_policy('a.example', '/privacy', llm_config)
+    index.add(source['id'], source['checksum'], index.signature(POLICY))
+
+    other_domain = Policy.get_by_id(Policy.create(
+        Domain.create('b.example', 'https://b.example').data[0]['id'],
+        'privacy_policy', 'Privacy', 'https://b.example/privacy').data[0]['id'])
+    assert find_near_duplicate(other_domain, index.signature(POLICY), llm_config) is None
+
+    same_domain = Policy.get_by_id(Policy.create(
+        source['domain_id'], 'privacy_policy', 'Privacy', 'https://a.example/legal/privacy').data[0]['id'])
+    found = find_near_duplicate(same_domain, index.signature(POLICY), llm_config)
+    assert found is not None
+    assert found[0]['id'] == source['id']
+    assert found[1] == {'summary': 'a.example collects data.'}
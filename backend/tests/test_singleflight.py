@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight('test')
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'result'
+
+    async def main():
+        return await asyncio.gather(*(flight.run('key', work) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert all(result == 'result' for result, _ in results)
+    assert flight.shared == 4
+    assert flight.in_flight() == 0
+
+
+def test_followers_get_the_leaders_exception():
+    flight = SingleFlight('test')
+
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise ValueError('boom')
+
+    async def main():
+        return await asyncio.gather(flight.run('key', fail), flight.run('key', fail), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.in_flight() == 0
+
+
+def test_sequential_calls_run_again():
+    flight = SingleFlight('test')
+    calls = []
+
+    async def work():
+        calls.append(1)
+        return len(calls)
+
+    assert asyncio.run(flight.run('key', work)) == (1, False)
+    assert asyncio.run(flight.run('key', work)) == (2, False)
+
+
+def test_coalesces_across_threads_and_loops():
+    flight = SingleFlight('test')
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        started.set()
+        await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+        return 'result'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(asyncio.run(flight.run('key', work))))
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(asyncio.run(flight.run('key', work))))
+    follower.start()
+    while flight.shared == 0:
+        follower.join(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert len(calls) == 1
+    assert sorted(results) == [('result', False), ('result', True)]
+
+
+def test_different_keys_run_independently():
+    flight = SingleFlight('test')
+
+    async def work(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    async def main():
+        return await asyncio.gather(flight.run('a', lambda: work(1)), flight.run('b', lambda: work(2)))
+
+    assert asyncio.run(main()) == [(1, False), (2, False)]
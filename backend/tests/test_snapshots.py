@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from analysis_schema import validate_analysis
+from cache import content_checksum
+from chunking import is_heading
+import snapshots
+from snapshots import SectionDiff, segment, analyze_policy_text, record_update, EXCERPT_NOTE
+
+
+def section(heading, topic):
+    return heading + '\n' + ' '.join(f'We handle {topic} carefully in case {i}.' for i in range(12))
+
+
+SECTIONS = [
+    section('1. Data We Collect', 'email addresses'),
+    section('2. How We Use Data', 'usage data'),
+    section('3. Sharing', 'partner data'),
+    section('4. Your Rights', 'deletion requests'),
+]
+POLICY = '\n'.join(SECTIONS)
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Stands in for the LLM: each analysis lists the headings of the text it was given."""
+    calls = []
+
+    async def perform_analysis(content, llm_name=None, note=None):
+        calls.append((content, note))
+        return validate_analysis({
+            'summary': f'Analysis {len(calls)}.',
+            'keyPoints': [line for line in content.split('\n') if is_heading(line)],
+        })
+
+    monkeypatch.setattr(snapshots, 'perform_analysis', perform_analysis)
+    return calls
+
+
+def analyze(policy, content, stored_result):
+    update = asyncio.run(analyze_policy_text(policy, content, content_checksum(content), stored_result))
+    record_update(update)
+    return update
+
+
+def first_version(db, llm):
+    update = analyze({'id': 1, 'checksum': ''}, POLICY, None)
+    llm.clear()
+    return {'id': 1, 'checksum': content_checksum(POLICY)}, update.result
+
+
+def test_section_diff():
+    old = segment(POLICY)
+    new = segment('\n'.join([SECTIONS[1], SECTIONS[0], section('3. Sharing', 'advertising data'),
+                             section('5. Cookies', 'cookie data')]))
+    diff = SectionDiff(old, new)
+    assert [s['heading'] for s in diff.modified] == ['3. Sharing']
+    assert [s['heading'] for s in diff.added] == ['5. Cookies']
+    assert [s['heading'] for s in diff.removed] == ['4. Your Rights']
+    assert diff.changed_chars == sum(s['chars'] for s in diff.changed) + diff.removed[0]['chars']
+    assert diff.total_chars == sum(s['chars'] for s in new)
+
+
+def test_reordering_is_not_a_change():
+    diff = SectionDiff(segment(POLICY), segment('\n'.join(reversed(SECTIONS))))
+    assert not diff.changed and not diff.removed and diff.changed_chars == 0
+
+
+def test_first_analysis_is_full(db, llm):
+    update = analyze({'id': 1, 'checksum': ''}, POLICY, None)
+    assert update.change['mode'] == 'full'
+    assert llm == [(POLICY, None)]
+    assert update.snapshot['parts'][0]['sections'] == [s['hash'] for s in segment(POLICY)]
+
+
+def test_only_changed_sections_are_analyzed(db, llm):
+    policy, stored = first_version(db, llm)
+    changed = section('2. How We Use Data', 'analytics data')
+    update = analyze(policy, POLICY.replace(SECTIONS[1], changed), stored)
+    assert update.change['mode'] == 'incremental'
+    assert llm == [(changed, EXCERPT_NOTE)]
+    assert update.analyzed_chars == len(changed)
+    assert update.result['keyPoints'] == [
+        '1. Data We Collect', '2. How We Use Data', '3. Sharing', '4. Your Rights'
+    ]
+    assert update.result['summary'] == 'Analysis 1.\n\nAnalysis 1.'
+
+
+def test_removed_section_needs_no_llm_call(db, llm, monkeypatch):
+    monkeypatch.setattr(snapshots, 'INCREMENTAL_MAX_CHANGE', 0.5)
+    policy, stored = first_version(db, llm)
+    update = asyncio.run(analyze_policy_text(policy, '\n'.join(SECTIONS[:3]),
+                                             content_checksum('\n'.join(SECTIONS[:3])), stored))
+    assert llm == []
+    assert update.analyzed_chars == 0
+    assert update.change['mode'] == 'incremental'
+    assert [part['sections'] for part in update.snapshot['parts']] == [[s['hash'] for s in segment(POLICY)[:3]]]
+
+
+def test_large_change_is_analyzed_in_full(db, llm):
+    policy, stored = first_version(db, llm)
+    content = '\n'.join([SECTIONS[0], section('2. How We Use Data', 'ads'), section('3. Sharing', 'brokers')])
+    update = analyze(policy, content, stored)
+    assert update.change['mode'] == 'full'
+    assert llm == [(content, None)]
+
+
+def test_stale_snapshot_is_not_built_on(db, llm):
+    policy, stored = first_version(db, llm)
+    changed = POLICY.replace(SECTIONS[3], section('4. Your Rights', 'access requests'))
+    update = analyze(dict(policy, checksum='something-else'), changed, stored)
+    assert update.change['mode'] == 'full'
@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+from models import UserHistory
+from visits import VisitBuffer, BufferFullError
+
+
+def make_buffer(monkeypatch, **kwargs):
+    buffer = VisitBuffer(flush_interval=60, **kwargs)
+    # Flush explicitly instead of from the background thread
+    monkeypatch.setattr(buffer, 'start', lambda: None)
+    return buffer
+
+
+def written(db):
+    return [(row['user_id'], row['domain_id']) for row in db.rows('user_history').values()]
+
+
+def fail_writes(monkeypatch):
+    def insert_many(rows):
+        raise RuntimeError('database unavailable')
+    monkeypatch.setattr(UserHistory, 'insert_many', staticmethod(insert_many))
+
+
+def test_flush_writes_in_batches(db, monkeypatch):
+    buffer = make_buffer(monkeypatch, flush_size=2)
+    for user in 'abc':
+        buffer.record(user, 1)
+    db.reset_counters()
+    assert buffer.flush() == 3
+    assert db.round_trips == 2
+    assert written(db) == [('a', 1), ('b', 1), ('c', 1)]
+    assert buffer.pending() == 0
+
+
+def test_failed_write_is_retried_in_order(db, monkeypatch):
+    buffer = make_buffer(monkeypatch, flush_size=10)
+    for user in 'abc':
+        buffer.record(user, 1)
+    with monkeypatch.context() as patch:
+        fail_writes(patch)
+        assert buffer.flush() == 0
+    assert buffer.pending() == 3
+    buffer.record('d', 1)
+    assert buffer.flush() == 4
+    assert written(db) == [('a', 1), ('b', 1), ('c', 1), ('d', 1)]
+
+
+def test_full_buffer_rejects_visits(db, monkeypatch):
+    buffer = make_buffer(monkeypatch, flush_size=2, max_buffered=2)
+    buffer.record('a', 1)
+    buffer.record('b', 1)
+    with pytest.raises(BufferFullError):
+        buffer.record('c', 1)
+
+
+def test_requeue_keeps_only_what_fits(db, monkeypatch):
+    buffer = make_buffer(monkeypatch, flush_size=3, max_buffered=3)
+    buffer.record('new1', 1)
+    buffer.record('new2', 1)
+    buffer._requeue([{'user_id': 'old1', 'domain_id': 1, 'visited_at': None},
+                     {'user_id': 'old2', 'domain_id': 1, 'visited_at': None}])
+    assert buffer.flush() == 3
+    assert [user for user, _ in written(db)] == ['old1', 'new1', 'new2']
+
+
+def test_stop_writes_remaining_and_refuses_new_visits(db):
+    buffer = VisitBuffer(flush_size=100, flush_interval=60)
+    buffer.record('a', 1)
+    buffer.stop(timeout=5)
+    assert written(db) == [('a', 1)]
+    with pytest.raises(BufferFullError):
+        buffer.record('b', 1)
+
+
+def test_background_flush_at_flush_size(db):
+    buffer = VisitBuffer(flush_size=2, flush_interval=60)
+    buffer.record('a', 1)
+    buffer.record('b', 1)
+    for _ in range(500):
+        if len(written(db)) == 2:
+            break
+        time.sleep(0.01)
+    assert len(written(db)) == 2
+    buffer.stop(timeout=5)
@@ -0,0 +1,130 @@
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Deque
+
+from models import UserHistory
+import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+visits_recorded = metrics.counter('policy_visits_recorded_total', 'Visit events accepted into the buffer')
+visits_rejected = metrics.counter('policy_visits_rejected_total', 'Visit events refused because the buffer was full')
+visits_written = metrics.counter('policy_visits_written_total', 'Visit events written to user_history')
+visits_dropped = metrics.counter('policy_visits_dropped_total', 'Visit events lost after failed writes')
+
+
+class BufferFullError(Exception):
+    """Raised when a visit arrives while the buffer is at capacity; callers should retry later."""
+
+
+class VisitBuffer:
+    """
+    Buffers visit events in memory and writes them to user_history in bulk.
+
+    A background thread flushes when ``flush_size`` events are waiting or
+    ``flush_interval`` seconds have passed, whichever comes first. At most
+    ``max_buffered`` events are held. Beyond that, record() raises
+    BufferFullError so the endpoint can tell clients to back off. Failed
+    writes are retried on the next flush while there is room. stop()
+    flushes whatever is left.
+    """
+
+    def __init__(self, flush_size: int = 500, flush_interval: float = 2.0, max_buffered: int = 10000):
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval
+        self.max_buffered = max(self.flush_size, max_buffered)
+        self._cond = threading.Condition()
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None or self._stopping:
+                return
+            self._thread = threading.Thread(target=self._run, name='visit-flusher', daemon=True)
+            self._thread.start()
+
+    def record(self, user_id: str, domain_id: Any, visited_at: Optional[str] = None) -> None:
+        """
+        Queues one visit.
+
+        Raises:
+            BufferFullError: If ``max_buffered`` events are already waiting,
+                or the buffer is shutting down.
+        """
+        self.start()
+        with self._cond:
+            if self._stopping or len(self._buffer) >= self.max_buffered:
+                visits_rejected.inc()
+                raise BufferFullError('Visit buffer is full')
+            self._buffer.append({
+                'user_id': user_id,
+                'domain_id': domain_id,
+                'visited_at': visited_at or datetime.utcnow().isoformat()
+            })
+            if len(self._buffer) >= self.flush_size:
+                self._cond.notify()
+        visits_recorded.inc()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._buffer)
+
+    def flush(self) -> int:
+        """Writes up to one batch per call until the buffer is empty; returns the number written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = [self._buffer.popleft() for _ in range(min(self.flush_size, len(self._buffer)))]
+                if not batch:
+                    return written
+                try:
+                    UserHistory.insert_many(batch)
+                except Exception as e:
+                    logger.error("Failed to write %s visits, will retry: %s", len(batch), e)
+                    self._requeue(batch)
+                    return written
+                written += len(batch)
+                visits_written.inc(len(batch))
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Refuses new visits, stops the flusher and writes what is still buffered."""
+        with self._cond:
+            self._stopping = True
+            thread, self._thread = self._thread, None
+            self._cond.notify()
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+        left = self.pending()
+        if left:
+            logger.warning("Visit buffer stopped with %s unwritten visits", left)
+            visits_dropped.inc(left)
+
+    def _requeue(self, batch: List[Dict[str, Any]]) -> None:
+        with self._cond:
+            room = self.max_buffered - len(self._buffer)
+            keep = batch[:max(0, room)]
+            self._buffer.extendleft(reversed(keep))
+        if len(keep) < len(batch):
+            logger.warning("Dropping %s visits: buffer full after failed write", len(batch) - len(keep))
+            visits_dropped.inc(len(batch) - len(keep))
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._buffer) < self.flush_size:
+                    self._cond.wait(self.flush_interval)
+                if self._stopping:
+                    return
+            if self.pending() and not self.flush():
+                # The write failed; back off instead of retrying in a tight loop
+                with self._cond:
+                    if not self._stopping:
+                        self._cond.wait(self.flush_interval)
@@ -55,9 +55,14 @@ async function analyzePolicyContent(content, domain) {
     }
 }
 
+// How long to poll batch analysis jobs before returning what has finished
+const JOB_POLL_INTERVAL_MS = 2000;
+const JOB_POLL_TIMEOUT_MS = 5 * 60 * 1000;
+
 // Function to fetch and analyze multiple policy URLs
 async function fetchAndAnalyzePolicies(urls) {
     try {
+        // The backend queues the analyses and answers with job IDs to poll
         const response = await fetch(`${API_BASE_URL}/fetch-and-analyze`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -70,13 +75,31 @@ async function fetchAndAnalyzePolicies(urls) {
         }
 
         const data = await response.json();
-        return data; // Returns aggregated analysis
+        const results = await Promise.all(data.results.map(waitForJob));
+        return { results }; // Returns aggregated analysis
     } catch (error) {
         console.error('Error in fetchAndAnalyzePolicies:', error);
         throw error;
     }
 }
 
+// Polls a queued analysis job until it finishes, merging its outcome into the batch result
+async function waitForJob(result) {
+    if (!result.job_id) return result;
+    const deadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+        const response = await fetch(`${API_BASE_URL}/jobs/${result.job_id}`);
+        if (response.ok) {
+            const job = await response.json();
+            if (job.status === 'completed' || job.status === 'failed') {
+                return { ...result, status: job.status, result: job.result, error: job.error };
+            }
+        }
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+    return result;
+}
+
 // Asynchronous function to check if analysis for a domain is already cached
 async function checkCachedAnalysis(domain) {
     // Attempt to retrieve cached analysis from Chrome's local storage
@@ -215,27 +215,25 @@ async function promptUserForAnalysis(policyData) {
     }
 
     try {
-        await Promise.all(policyData.map(async (item) => {
-            const policyContent = await fetchPolicyContent(item.url);
-            const analysisData = {
-                content: policyContent,
-                url: item.url,
-                title: item.title,
-                domain: new URL(item.url).hostname
-            };
-
-            const response = await fetch('http://127.0.0.1:5000/analyze-policy', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(analysisData)
-            });
+        // One batch request for all detected policies; the backend queues the analyses
+        const response = await fetch(`${API_BASE_URL}/fetch-and-analyze?wait=false`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                urls: policyData.map(item => ({
+                    url: item.url,
+                    title: item.title,
+                    policy_type: item.policy_type
+                }))
+            })
+        });
 
-            if (!response.ok) {
-                throw new Error(`Analysis failed for ${item.url}`);
-            }
+        if (!response.ok) {
+            throw new Error(`Batch analysis request failed with status ${response.status}`);
+        }
 
-            log.info(`Analysis of ${item.url} successful.`);
-        }));
+        const data = await response.json();
+        log.info(`Queued analysis of ${data.results.length} policies.`);
     } catch (error) {
         log.error('Error during policy analysis:', error);
     }